@@ -0,0 +1,221 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import close_old_connections, connection, transaction
+from django.utils.timezone import now
+
+from apps.authentication.models import UserActivity
+from config.core.metrics import metrics
+
+logger = logging.getLogger()
+
+
+# Inbox coalesces activities of the same type and target within this period
+INBOX_BUCKET_SECONDS = 24 * 3600
+
+
+class ActivityEvent:
+    __slots__ = ('type', 'content', 'content_id', 'initiator_id', 'content_owner_id', 'target_id')
+
+    def __init__(self, activity_type: str, content: str | None, content_id, initiator_id, content_owner_id,
+                 target_id=None):
+        self.type = activity_type
+        self.content = content
+        self.content_id = None if content_id is None else str(content_id)
+        self.initiator_id = initiator_id
+        self.content_owner_id = content_owner_id
+        self.target_id = '' if target_id is None else str(target_id)
+
+    @property
+    def notifies(self) -> bool:
+        # Likes are recorded on unlike too, without content_id, those are not shown in the inbox
+        return bool(self.content_owner_id) and (self.content_id is not None or not self.type.startswith('liked_'))
+
+    def to_model(self) -> UserActivity:
+        return UserActivity(type=self.type, content=self.content, content_id=self.content_id,
+                            initiator_id=self.initiator_id, content_owner_id=self.content_owner_id)
+
+
+def update_inbox(events: list[ActivityEvent]):
+    """
+    Coalesce a batch into ActivityInboxItem rows of the current bucket, count actors not seen in the item yet
+    and bump unread counters of owners whose item is new or was read before; one statement per step
+    whatever the batch size
+    """
+    if not events:
+        return
+    latest_at = now()
+    bucket = datetime.fromtimestamp(latest_at.timestamp() // INBOX_BUCKET_SECONDS * INBOX_BUCKET_SECONDS,
+                                    tz=dt_timezone.utc)
+    groups, actors = {}, {}
+    for event in events:
+        key = (event.content_owner_id, event.type, event.target_id)
+        groups[key] = (event.initiator_id, event.content_id)
+        if event.initiator_id is not None:
+            actors.setdefault(key, set()).add(event.initiator_id)
+    # Counters are locked first and everything in the same order, so writer processes and mark_inbox_read
+    # serialize per owner instead of deadlocking
+    keys = sorted(groups)
+    key_values = ', '.join(['(%s, %s, %s)'] * len(keys))
+    key_params = [value for key in keys for value in key]
+    owners = sorted({key[0] for key in keys})
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO activity_inbox_counter (user_id, unread) '
+            f'VALUES {", ".join(["(%s, 0)"] * len(owners))} '
+            'ON CONFLICT (user_id) DO UPDATE SET unread = activity_inbox_counter.unread',
+            owners
+        )
+        cursor.execute(
+            'SELECT owner_id, type, target_id FROM activity_inbox_item '
+            f'WHERE bucket = %s AND (owner_id, type, target_id) IN ({key_values}) AND is_read '
+            'ORDER BY owner_id, type, target_id FOR UPDATE',
+            [bucket, *key_params]
+        )
+        read_before = set(cursor.fetchall())
+        cursor.execute(
+            'INSERT INTO activity_inbox_item (owner_id, type, target_id, bucket, count, last_actor_id, '
+            'last_content_id, latest_at, is_read, created_at, updated_at) '
+            f'VALUES {", ".join(["(%s, %s, %s, %s, 0, %s, %s, %s, false, %s, %s)"] * len(keys))} '
+            'ON CONFLICT (owner_id, type, target_id, bucket) DO UPDATE SET '
+            'last_actor_id = EXCLUDED.last_actor_id, last_content_id = EXCLUDED.last_content_id, '
+            'latest_at = EXCLUDED.latest_at, updated_at = EXCLUDED.updated_at, is_read = false '
+            'RETURNING id, owner_id, type, target_id, xmax = 0',
+            [value for key in keys for value in (*key, bucket, *groups[key], latest_at, latest_at, latest_at)]
+        )
+        items = cursor.fetchall()
+        unread = Counter(owner_id for _item_id, owner_id, activity_type, target_id, inserted in items
+                         if inserted or (owner_id, activity_type, target_id) in read_before)
+        # Items are locked by the upsert above, so actors of an item are only ever added by one writer at a time
+        item_actors = sorted(
+            (item_id, actor_id)
+            for item_id, *key, _inserted in items
+            for actor_id in actors.get(tuple(key), ())
+        )
+        if item_actors:
+            cursor.execute(
+                'INSERT INTO activity_inbox_actor (item_id, actor_id) '
+                f'VALUES {", ".join(["(%s, %s)"] * len(item_actors))} '
+                'ON CONFLICT (item_id, actor_id) DO NOTHING RETURNING item_id',
+                [value for pair in item_actors for value in pair]
+            )
+            new_actors = Counter(item_id for item_id, in cursor.fetchall())
+            if new_actors:
+                cursor.execute(
+                    'UPDATE activity_inbox_item SET count = activity_inbox_item.count + bumps.actors '
+                    f'FROM (VALUES {", ".join(["(%s, %s)"] * len(new_actors))}) AS bumps (id, actors) '
+                    'WHERE activity_inbox_item.id = bumps.id',
+                    [value for item_id in sorted(new_actors) for value in (item_id, new_actors[item_id])]
+                )
+        if unread:
+            cursor.execute(
+                'UPDATE activity_inbox_counter SET unread = activity_inbox_counter.unread + bumps.unread '
+                f'FROM (VALUES {", ".join(["(%s, %s)"] * len(unread))}) AS bumps (user_id, unread) '
+                'WHERE activity_inbox_counter.user_id = bumps.user_id',
+                [value for owner_id in sorted(unread) for value in (owner_id, unread[owner_id])]
+            )
+    metrics.increment('activity.inbox_items', len(keys))
+
+
+class ActivityWriter:
+    """
+    Bounded in-process queue of activities drained by one writer thread with bulk_create;
+    when the queue is full the caller waits up to `put_timeout` and then writes its event itself,
+    so a burst slows requests down instead of piling up threads and connections. Flushed on exit.
+    """
+    _stop = object()
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 0.5,
+                 put_timeout: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Writer thread does not survive fork, every worker process starts its own
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                    atexit.register(self.stop)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='activity_writer', daemon=True)
+                self._thread.start()
+
+    def put(self, event: ActivityEvent):
+        self._ensure_started()
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            metrics.increment('activity.overflow')
+            self.write([event])
+
+    @staticmethod
+    def write(events: list[ActivityEvent]):
+        with transaction.atomic():
+            UserActivity.objects.bulk_create([event.to_model() for event in events])
+            update_inbox([event for event in events if event.notifies])
+        metrics.increment('activity.written', len(events))
+
+    def _next_batch(self) -> tuple[list, bool]:
+        """
+        return: (events, stop) where stop tells that shutdown was requested
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        if self._stop in batch:
+            return [event for event in batch if event is not self._stop], True
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            events, stop = self._next_batch()
+            if not events:
+                continue
+            close_old_connections()
+            try:
+                self.write(events)
+            except Exception as exc:
+                metrics.increment('activity.errors')
+                logger.exception(f'activity_writer: {len(events)} activities are not written: {exc.args}')
+            metrics.gauge('activity.queue_depth', self._queue.qsize())
+        connection.close()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Write everything queued so far and stop the writer thread
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(self._stop, timeout=timeout)
+        except queue.Full:
+            logger.warning(f'activity_writer: {self._queue.qsize()} activities are not written on exit')
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+
+activity_writer = ActivityWriter()
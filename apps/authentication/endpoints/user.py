@@ -5,7 +5,8 @@ from apps.authentication.routes.user import (BecomeUserMultibankAccountsAPIView,
                                              UserSubscriptionPlanListAPIView, UserSubscribeCreateAPIView,
                                              PopularCreatorListAPIView, PopularCategoryCreatorListAPIView,
                                              SearchCreatorAPIView, ToggleBlockAPIView, DonateAPIView, GetMeAPIView,
-                                             UserFundraisingListAPIView)
+                                             UserFundraisingListAPIView, ActivityInboxListAPIView,
+                                             ActivityInboxUnreadAPIView, ActivityInboxReadAPIView)
 
 urlpatterns = [
     path('user/become-creator/multibank-accounts/', BecomeUserMultibankAccountsAPIView.as_view(),
@@ -28,4 +29,7 @@ urlpatterns = [
     path('user/<int:user_id>/toggle-block/', ToggleBlockAPIView.as_view(), name='block_toggle'),
     path('user/donate/', DonateAPIView.as_view(), name='user_donate'),
     path('user/get-me/', GetMeAPIView.as_view(), name='user_get_me'),
+    path('user/activity/inbox/', ActivityInboxListAPIView.as_view(), name='user_activity_inbox'),
+    path('user/activity/inbox/unread/', ActivityInboxUnreadAPIView.as_view(), name='user_activity_inbox_unread'),
+    path('user/activity/inbox/read/', ActivityInboxReadAPIView.as_view(), name='user_activity_inbox_read'),
 ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0024_remove_notificationdistribution_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='last4',
+            field=models.CharField(blank=True, max_length=4, null=True),
+        ),
+        migrations.RunSQL('UPDATE card SET last4 = RIGHT(number, 4)', migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['user', 'last4'], name='card_user_last4_idx'),
+        ),
+    ]
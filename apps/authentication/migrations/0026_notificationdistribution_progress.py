@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0025_card_last4'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='failures',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='last_device_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationdistribution',
+            name='status',
+            field=models.CharField(choices=[('waiting', 'Ожидается'), ('draft', 'Драфт'), ('sending', 'Отправляется'), ('sent', 'Отправлен')], default='waiting', max_length=55),
+        ),
+    ]
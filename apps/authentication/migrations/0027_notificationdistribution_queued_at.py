@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0026_notificationdistribution_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationdistribution',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Distributions already handed to the distributor stay claimable
+        migrations.RunSQL(
+            "UPDATE notification_distribution SET queued_at = created_at "
+            "WHERE status IN ('waiting', 'sending') AND sending_date IS NULL AND NOT is_draft",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='notificationdistribution',
+            index=models.Index(fields=['status', 'sending_date'], name='notif_dis_status_sending_idx'),
+        ),
+    ]
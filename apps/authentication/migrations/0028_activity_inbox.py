@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-19 16:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0027_notificationdistribution_queued_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityInboxCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity_inbox_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'activity_inbox_counter',
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityInboxItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('type', models.CharField(choices=[('donation', 'Задонатил'), ('commented', 'Оставил комментарий'), ('replied', 'Оставил ответный комментарий'), ('followed', 'Фолловнул'), ('subscribed', 'Подписался'), ('liked_post', 'Лайкнул пост'), ('liked_comment', 'Лайкнул комментарий')], max_length=20)),
+                ('target_id', models.CharField(blank=True, default='', max_length=50)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_content_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('latest_at', models.DateTimeField()),
+                ('is_read', models.BooleanField(default=False)),
+                ('last_actor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'activity_inbox_item',
+                'indexes': [models.Index(fields=['owner', '-latest_at', '-id'], name='activity_inbox_owner_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'type', 'target_id', 'bucket'), name='activity_inbox_item_unique_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityInboxActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='authentication.activityinboxitem')),
+            ],
+            options={
+                'db_table': 'activity_inbox_actor',
+                'constraints': [models.UniqueConstraint(fields=('item', 'actor'), name='activity_inbox_actor_unique')],
+            },
+        ),
+    ]
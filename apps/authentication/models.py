@@ -50,6 +50,7 @@ class UserType(models.TextChoices):
 class NotifDisStatus(models.TextChoices):
     waiting = 'waiting', _('Ожидается')
     draft = 'draft', _('Драфт')
+    sending = 'sending', _('Отправляется')
     sent = 'sent', _('Отправлен')
 
 
@@ -225,6 +226,7 @@ class Card(BaseModel):
     is_main = models.BooleanField(default=False)
     card_owner = models.CharField(max_length=155, null=True)
     number = models.CharField(max_length=16)
+    last4 = models.CharField(max_length=4, null=True, blank=True)
     token = models.TextField(null=True, blank=True)
     expiration = models.CharField(max_length=5)
     cvc_cvv = models.CharField(max_length=5, null=True, blank=True)
@@ -238,6 +240,12 @@ class Card(BaseModel):
     def card_pan(self):
         return f'*{self.number[-4:]}' if self.number else None
 
+    def save(self, *args, **kwargs):
+        self.last4 = self.number[-4:] if self.number else None
+        if kwargs.get('update_fields') is not None and 'number' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'last4'}
+        super().save(*args, **kwargs)
+
     def delete_card(self):
         if self.is_main:
             self.is_main = False
@@ -260,6 +268,10 @@ class Card(BaseModel):
 
     class Meta:
         db_table = 'card'
+        indexes = [
+            # Bind-card webhook matches pending card by owner and last digits of PAN
+            models.Index(fields=['user', 'last4'], name='card_user_last4_idx'),
+        ]
 
 
 class SubscriptionPlan(BaseModel):
@@ -423,6 +435,55 @@ class UserActivity(BaseModel):
         db_table = 'user_activity'
 
 
+class ActivityInboxItem(BaseModel):
+    """
+    Activities of one type about the same target (post, comment or the owner) coalesced per day,
+    e.g. "last_actor and count - 1 others liked your post", count is of distinct actors; maintained by activity_writer
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_inbox')
+    type = models.CharField(choices=ActivityType.choices, max_length=20)
+    target_id = models.CharField(max_length=50, default='', blank=True)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    last_actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    last_content_id = models.CharField(max_length=50, null=True, blank=True)
+    latest_at = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'activity_inbox_item'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'type', 'target_id', 'bucket'],
+                                    name='activity_inbox_item_unique_bucket')
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-latest_at', '-id'], name='activity_inbox_owner_idx'),
+        ]
+
+
+class ActivityInboxActor(models.Model):
+    """
+    Actors already counted in an inbox item, so one who likes, unlikes and likes again is counted once
+    """
+    item = models.ForeignKey(ActivityInboxItem, on_delete=models.CASCADE, related_name='actors')
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        db_table = 'activity_inbox_actor'
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'actor'], name='activity_inbox_actor_unique')
+        ]
+
+
+class ActivityInboxCounter(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='activity_inbox_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'activity_inbox_counter'
+
+
 class NotificationDistribution(BaseModel):
     is_draft = models.BooleanField(default=False)
     title_uz = models.CharField(max_length=155, null=True, blank=True)
@@ -436,5 +497,19 @@ class NotificationDistribution(BaseModel):
     # type = models.CharField(choices=NotifDisPlatformType.choices, default=NotifDisPlatformType.push_notification, max_length=55)
     types = ArrayField(models.CharField(max_length=55, choices=NotifDisPlatformType.choices), default=list)
 
+    # Progress of sending, see `manage.py run_notification_distributor`
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    last_device_id = models.BigIntegerField(null=True, blank=True)
+    # Set when distribution is handed to the distributor: right away, or at sending_date by the scheduler
+    queued_at = models.DateTimeField(null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    failures = models.JSONField(default=dict, blank=True)
+
     class Meta:
         db_table = 'notification_distribution'
+        indexes = [
+            models.Index(fields=['status', 'sending_date'], name='notif_dis_status_sending_idx'),
+        ]
@@ -15,10 +15,13 @@ from apps.authentication.serializers.auth import (LoginWelcomeSerializer, LoginV
 from apps.authentication.services import authenticate_user
 from apps.integrations.services.sms_services import only_phone_numbers
 from config.core.api_exceptions import APIValidation
+from config.core.rate_limit import (LoginPhoneThrottle, LoginIPThrottle, SMSCooldownPhoneThrottle,
+                                    VerifySMSPhoneThrottle, VerifySMSIPThrottle)
 
 
 class LoginWelcomeAPIView(APIView):
     permission_classes = [AllowAny, ]
+    throttle_classes = [LoginIPThrottle, LoginPhoneThrottle, SMSCooldownPhoneThrottle, ]
     serializer_class = LoginWelcomeSerializer
 
     @staticmethod
@@ -42,6 +45,7 @@ class LoginWelcomeAPIView(APIView):
 
 class LoginVerifySMSAPIView(APIView):
     permission_classes = [AllowAny, ]
+    throttle_classes = [VerifySMSIPThrottle, VerifySMSPhoneThrottle, ]
     serializer_class = LoginVerifySMSSerializer
 
     @staticmethod
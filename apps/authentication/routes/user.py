@@ -8,17 +8,20 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils.translation import gettext_lazy as _
 
-from apps.authentication.models import User, SubscriptionPlan, UserSubscription, Donation, Fundraising
+from apps.authentication.models import User, SubscriptionPlan, UserSubscription, Donation, Fundraising, \
+    ActivityInboxItem
 from apps.authentication.serializers.user import BecomeCreatorSerializer, UserRetrieveSerializer, \
     UserSubscriptionPlanListSerializer, UserSubscriptionCreateSerializer, DonationCreateSerializer, \
-    BecomeUserMultibankAddAccountSerializer, UserFundraisingListSerializer
-from apps.authentication.services import create_activity
+    BecomeUserMultibankAddAccountSerializer, UserFundraisingListSerializer, ActivityInboxItemSerializer
+from apps.authentication.services import create_activity, inbox_unread_count, mark_inbox_read
+from apps.chat.policy import invalidate_chat_access
 from apps.content.models import Category
 from apps.files.serializers import FileSerializer
 from apps.integrations.api_integrations.multibank import multibank_prod_app
+from apps.integrations.services.idempotency import IdempotentRequestMixin, IDEMPOTENCY_HEADER
 from config.core.api_exceptions import APIValidation
+from config.core.pagination import APICursorPagination
 from config.swagger import query_search_swagger_param
-from config.services import run_with_thread
 
 
 class BecomeUserMultibankAccountsAPIView(APIView):
@@ -172,7 +175,7 @@ class ToggleFollowAPIView(APIView):
         # Check if the follow relationship already exists
         action, follow_relation = follower.toggle_follow(user_to_follow)
         if action == 'followed':
-            run_with_thread(create_activity, ('followed', None, None, follower, user_to_follow))
+            create_activity('followed', None, None, follower, user_to_follow)
 
         # Return the appropriate response
         return Response({
@@ -208,10 +211,20 @@ class UserFundraisingListAPIView(ListAPIView):
         return queryset
 
 
-class UserSubscribeCreateAPIView(CreateAPIView):
+idempotency_key_param = openapi.Parameter(
+    IDEMPOTENCY_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+    description='Unique per payment attempt, retries with the same key get the first response'
+)
+
+
+class UserSubscribeCreateAPIView(IdempotentRequestMixin, CreateAPIView):
     queryset = UserSubscription.objects.all()
     serializer_class = UserSubscriptionCreateSerializer
 
+    @swagger_auto_schema(request_body=UserSubscriptionCreateSerializer, manual_parameters=[idempotency_key_param])
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
 
 class PopularCreatorListAPIView(APIView):
 
@@ -471,6 +484,7 @@ class ToggleBlockAPIView(APIView):
 
         # Check if the block relationship already exists
         action, toggle_relation = blocker.toggle_block(user_to_block)
+        invalidate_chat_access([(blocker.id, user_to_block.id)])
 
         # Return the appropriate response
         return Response({
@@ -483,12 +497,13 @@ class ToggleBlockAPIView(APIView):
         }, status=status.HTTP_200_OK)
 
 
-class DonateAPIView(CreateAPIView):
+class DonateAPIView(IdempotentRequestMixin, CreateAPIView):
     queryset = Donation.objects.all()
     serializer_class = DonationCreateSerializer
 
     @swagger_auto_schema(
         request_body=DonationCreateSerializer,
+        manual_parameters=[idempotency_key_param],
         responses={
             201: openapi.Response(
                 description='Donation created successfully',
@@ -501,8 +516,10 @@ class DonateAPIView(CreateAPIView):
                         'fundraising': None,
                         'creator': 1,
                         'payment_info': {
+                            'id': '5d0c8a8e-3b0f-4a57-9a3e-1f1f6d2b8c11',
+                            'status': 'new',
                             'need_otp': False,
-                            'transaction_id': '9bf2385d-46a1-11f0-bdd5-005056b4367d'
+                            'transaction_id': None
                         }
                     }
                 }
@@ -562,3 +579,43 @@ class GetMeAPIView(APIView):
             'multibank_account': user.multibank_account,
             'multibank_verified': user.multibank_verified,
         })
+
+
+class ActivityInboxPagination(APICursorPagination):
+    ordering = ('-latest_at', '-id')
+
+
+class ActivityInboxListAPIView(ListAPIView):
+    serializer_class = ActivityInboxItemSerializer
+    pagination_class = ActivityInboxPagination
+
+    @swagger_auto_schema(operation_description='Activities on your content coalesced per post/comment and day, '
+                                               'newest first: "last_actor and others_count others liked your post". '
+                                               'Paginated by cursor, follow `next`')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return (
+            ActivityInboxItem.objects
+            .filter(owner=self.request.user)
+            .select_related('last_actor__profile_photo')
+        )
+
+
+class ActivityInboxUnreadAPIView(APIView):
+
+    @swagger_auto_schema(responses={200: openapi.Response(description='Unread inbox items',
+                                                          examples={'application/json': {'unread': 3}})})
+    def get(self, request, *args, **kwargs):
+        return Response({'unread': inbox_unread_count(request.user)})
+
+
+class ActivityInboxReadAPIView(APIView):
+
+    @swagger_auto_schema(operation_description='Mark the whole inbox as read',
+                         responses={200: openapi.Response(description='Unread inbox items',
+                                                          examples={'application/json': {'unread': 0}})})
+    def post(self, request, *args, **kwargs):
+        mark_inbox_read(request.user)
+        return Response({'unread': 0})
@@ -5,8 +5,9 @@ from django.utils.translation import gettext_lazy as _
 from apps.authentication.models import User, NotificationDistribution, NotifDisStatus
 from apps.content.models import ReportTypes, Report, ReportComment
 from apps.files.serializers import FileSerializer
-from apps.integrations.api_integrations.firebase import send_notification_to_user
+from apps.integrations.services.push_distribution import queue_distribution
 from config.core.api_exceptions import APIValidation
+from config.core.pg_notify import notify
 
 
 class AdminCreatorListSerializer(serializers.ModelSerializer):
@@ -248,39 +249,16 @@ class AdminNotifDisSerializer(serializers.ModelSerializer):
     created_at = serializers.DateTimeField(read_only=True)
     status = serializers.ChoiceField(choices=NotifDisStatus.choices, read_only=True)
 
-    @staticmethod
-    def get_users(user_type):
-        if user_type == 'creators':
-            return User.objects.filter(is_creator=True)
-        elif user_type == 'users':
-            return User.objects.filter(is_creator=False)
-        elif user_type == 'all':
-            return User.objects.all()
-        else:
-            raise APIValidation(_('Тип юзера неправильный'), status_code=status.HTTP_400_BAD_REQUEST)
-
-    def manipulate_notification_sending(self, instance):
-        validated_data = self.validated_data
-        if not validated_data.get('sending_date') and not instance.is_draft:
-            if validated_data.get('types'):
-                for notif_type in validated_data.get('types', []):
-                    if notif_type == 'push_notification':
-                        users = self.get_users(validated_data.get('user_type'))
-                        [send_notification_to_user(user, validated_data.get('title_ru'), validated_data.get('text_ru'))
-                         for user in users]
-            instance.status = 'sent'
-        else:
-            pass
-            # TODO: add sending with task with sending_date
-
     def create(self, validated_data):
         instance = super().create(validated_data)
         if validated_data.get('is_draft'):
             instance.status = 'draft'
             instance.save()
             return instance
-        self.manipulate_notification_sending(instance)
+        channel = queue_distribution(instance)
         instance.save()
+        if channel:
+            notify(channel)
         return instance
 
     def update(self, instance: NotificationDistribution, validated_data):
@@ -289,8 +267,10 @@ class AdminNotifDisSerializer(serializers.ModelSerializer):
         instance = super().update(instance, validated_data)
         if not instance.is_draft:
             instance.status = 'waiting'
-        self.manipulate_notification_sending(instance)
+        channel = queue_distribution(instance)
         instance.save()
+        if channel:
+            notify(channel)
         return instance
 
     class Meta:
@@ -1,16 +1,16 @@
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers, status
 
-from apps.authentication.models import User, SubscriptionPlan, UserSubscription, Donation, Fundraising
-from apps.authentication.services import create_activity
+from apps.authentication.models import (User, SubscriptionPlan, UserSubscription, Donation, Fundraising,
+                                        ActivityInboxItem)
 from apps.files.serializers import FileSerializer
-from apps.integrations.services.multibank import multibank_payment
+from apps.integrations.models import MultibankTransaction, MultibankTransactionStatusEnum
+from apps.integrations.services.multibank import create_payment_intent, payment_state
 from config.core.api_exceptions import APIValidation
-from config.services import run_with_thread
 
 
 class BecomeUserMultibankAddAccountSerializer(serializers.ModelSerializer):
@@ -152,6 +152,19 @@ class UserSubscriptionCreateSerializer(serializers.ModelSerializer):
         ).exists()
         return user_subs
 
+    @staticmethod
+    def lock_subscription(subscriber, creator, plan) -> UserSubscription | None:
+        """
+        return: latest subscription of the subscriber to the plan, locked until commit
+        """
+        return (
+            UserSubscription.objects
+            .select_for_update()
+            .filter(subscriber=subscriber, creator=creator, plan=plan)
+            .order_by('-created_at', '-id')
+            .first()
+        )
+
     def validate(self, attrs):
         user = self.context['request'].user
         card = attrs.get('subscriber_card')
@@ -171,14 +184,40 @@ class UserSubscriptionCreateSerializer(serializers.ModelSerializer):
 
             if self.check_subscription(validated_data):
                 raise APIValidation(_('У вас уже имеется этот подписка'), status_code=400)
-            subscription = UserSubscription.objects.create(subscriber=subscriber, creator=creator, end_date=end_date,
-                                                           **validated_data)
-            payment_info = multibank_payment(subscriber, creator, card, amount, 'subscription')
-            subscription.payment_reference = payment_info
-            subscription.save(update_fields=['payment_reference'])
-            run_with_thread(create_activity, ('subscribed', None, subscription.id, subscriber, creator))
+            # Activated by payment worker once the payment is confirmed; the row stays locked until commit,
+            # so a second tap waits here and sees this payment
+            subscription = self.lock_subscription(subscriber, creator, plan)
+            if subscription is None:
+                try:
+                    with transaction.atomic():
+                        subscription = UserSubscription.objects.create(
+                            subscriber=subscriber, creator=creator, end_date=end_date, is_active=False,
+                            **validated_data
+                        )
+                except IntegrityError:
+                    # A concurrent first tap created it, waits for it
+                    subscription = self.lock_subscription(subscriber, creator, plan)
+            if MultibankTransaction.objects.filter(
+                subscription=subscription,
+                status__in=[MultibankTransactionStatusEnum.new, MultibankTransactionStatusEnum.pending]
+            ).exists():
+                raise APIValidation(_('Оплата этой подписки уже обрабатывается'), status_code=409)
+            payment = create_payment_intent(subscriber, creator, card, amount, 'subscription',
+                                            subscription=subscription)
+            # An expired or unpaid subscription keeps its dates and state until the payment is confirmed
+            subscription.subscriber_card = card
+            subscription.commission_by_subscriber = validated_data.get('commission_by_subscriber', False)
+            subscription.payment_reference = str(payment.id)
+            subscription.save(update_fields=['subscriber_card', 'commission_by_subscriber', 'payment_reference',
+                                             'updated_at'])
+            subscription.payment_info = payment_state(payment)
             return subscription
 
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['payment_info'] = instance.payment_info
+        return representation
+
     class Meta:
         model = UserSubscription
         fields = [
@@ -231,7 +270,30 @@ class DonationCreateSerializer(serializers.ModelSerializer):
                 validated_data['message'] = None
             validated_data['donator'] = donator
             donation = super().create(validated_data)
-            payment_info = multibank_payment(donator, creator, card, validated_data.get('amount', 0), 'donation', fundraising)
-            donation.payment_info = payment_info
-            run_with_thread(create_activity, ('donation', None, donation.id, donator, validated_data.get('creator_id')))
+            payment = create_payment_intent(donator, creator, card, validated_data.get('amount', 0), 'donation',
+                                            donation=donation, fundraising=fundraising)
+            donation.payment_info = payment_state(payment)
             return donation
+
+
+class ActivityInboxItemSerializer(serializers.ModelSerializer):
+    last_actor = serializers.SerializerMethodField()
+    others_count = serializers.SerializerMethodField()
+
+    def get_last_actor(self, obj):
+        actor = obj.last_actor
+        if actor is None:
+            return None
+        return {
+            'id': actor.id,
+            'username': actor.username,
+            'profile_photo': FileSerializer(actor.profile_photo).data if actor.profile_photo else None
+        }
+
+    def get_others_count(self, obj):
+        return max(obj.count - 1, 0)
+
+    class Meta:
+        model = ActivityInboxItem
+        fields = ['id', 'type', 'target_id', 'last_actor', 'others_count', 'count', 'last_content_id',
+                  'latest_at', 'is_read']
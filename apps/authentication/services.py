@@ -1,27 +1,40 @@
 from datetime import timedelta
 
-from django.db.models import Sum, Q, Count
+from django.db import transaction
+from django.db.models import Sum, Q, Count, F
+from django.db.models.functions import TruncDate
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from apps.authentication.models import UserActivity, User, UserSubscription
+from apps.authentication.activity import ActivityEvent, activity_writer
+from apps.authentication.models import User, UserSubscription, ActivityInboxCounter, ActivityInboxItem
 from apps.content.models import Post
-from apps.integrations.models import MultibankTransaction
+from apps.integrations.models import DailyEarnings
 from config.core.api_exceptions import APIValidation
 
 
-def create_activity(activity_type: str, content: str, content_id: str | int, initiator, content_owner):
+def create_activity(activity_type: str, content: str, content_id: str | int, initiator, content_owner,
+                    target_id: str | int = None):
     """
     types: donation, commented, followed, subscribed, liked
+    target_id: post or comment the activity is about, activities are coalesced by it in the owner's inbox
+    Queued after commit and written in batches by activity_writer, does not block the request
     """
-    UserActivity.objects.create(
-        type=activity_type,
-        content=content,
-        content_id=content_id,
-        initiator=initiator,
-        content_owner=content_owner,
-    )
+    event = ActivityEvent(activity_type, content, content_id, initiator.pk if initiator else None,
+                          content_owner.pk if content_owner else None, target_id)
+    transaction.on_commit(lambda: activity_writer.put(event))
+
+
+def inbox_unread_count(user) -> int:
+    return ActivityInboxCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
+
+
+def mark_inbox_read(user):
+    with transaction.atomic():
+        # Counter row is locked first, as activity_writer does, so a batch in flight is counted after reset
+        ActivityInboxCounter.objects.update_or_create(user=user, defaults={'unread': 0})
+        ActivityInboxItem.objects.filter(owner=user, is_read=False).update(is_read=True)
 
 
 def get_last_week_days():
@@ -65,12 +78,7 @@ def authenticate_user(request):
 
 
 def creator_earnings():
-    earnings = (
-        MultibankTransaction.objects
-        .filter(status='paid')
-        .aggregate(creator_earnings=Sum('creator_amount'))
-        .get('creator_earnings', 0)
-    )
+    earnings = DailyEarnings.objects.aggregate(creator_earnings=Sum('creator_amount')).get('creator_earnings', 0)
     return {'data': earnings}
 
 
@@ -172,24 +180,24 @@ def platform_earnings(trunc_func, start_date=None, end_date=None):
     start_date_filter = Q()
     end_date_filter = Q()
     if start_date:
-        start_date_filter = Q(created_at__date__gte=start_date)
+        start_date_filter = Q(date__gte=start_date)
     if end_date:
-        end_date_filter = Q(created_at__date__lte=end_date)
-    revenue_data = MultibankTransaction.objects.filter(
+        end_date_filter = Q(date__lte=end_date)
+    # Earnings are already aggregated per day, only weeks and months need truncating
+    period = F('date') if trunc_func is TruncDate else trunc_func('date')
+    revenue_data = DailyEarnings.objects.filter(
         start_date_filter,
         end_date_filter,
-        status='paid'
     ).annotate(
-        period=trunc_func('created_at')
+        period=period
     ).values('period').annotate(
         total_revenue=Sum('sapi_amount')
     ).order_by('period')
 
     # Calculate total revenue
-    total_revenue = MultibankTransaction.objects.filter(
+    total_revenue = DailyEarnings.objects.filter(
         start_date_filter,
         end_date_filter,
-        status='paid'
     ).aggregate(total=Sum('sapi_amount'))['total'] or 0
 
     return {
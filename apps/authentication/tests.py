@@ -1,3 +1,83 @@
 from django.test import TestCase
+from django.utils.timezone import now, timedelta
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.authentication.activity import ActivityEvent, update_inbox
+from apps.authentication.models import (ActivityInboxCounter, ActivityInboxItem, Card, SubscriptionPlan, User,
+                                        UserSubscription)
+from apps.integrations.models import MultibankTransaction, MultibankTransactionStatusEnum
+
+
+class SubscribeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create(phone_number='998900000001', username='creator', is_creator=True)
+        cls.subscriber = User.objects.create(phone_number='998900000002', username='subscriber')
+        cls.card = Card.objects.create(user=cls.subscriber, number='8600123412341234', expiration='12/30',
+                                       token='card-token', is_active=True)
+        cls.plan = SubscriptionPlan.objects.create(name='plan', price=10000, duration=timedelta(days=30),
+                                                   creator=cls.creator)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.subscriber)
+
+    def subscribe(self):
+        return self.client.post('/user/subscribe/', {'plan': self.plan.pk, 'subscriber_card': self.card.pk},
+                                format='json')
+
+    def test_subscription_waits_for_payment(self):
+        response = self.subscribe()
+        self.assertEqual(response.status_code, 201, response.data)
+        subscription = UserSubscription.objects.get(subscriber=self.subscriber, plan=self.plan)
+        self.assertFalse(subscription.is_active)
+        payment = MultibankTransaction.objects.get(subscription=subscription)
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.new)
+        self.assertEqual(response.data['payment_info']['id'], str(payment.pk))
+
+    def test_second_payment_is_rejected_while_first_is_processed(self):
+        self.assertEqual(self.subscribe().status_code, 201)
+        response = self.subscribe()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(MultibankTransaction.objects.filter(subscription__subscriber=self.subscriber).count(), 1)
+
+    def test_renewal_keeps_expired_subscription_until_paid(self):
+        ended_at = now() - timedelta(days=1)
+        expired = UserSubscription.objects.create(subscriber=self.subscriber, creator=self.creator, plan=self.plan,
+                                                  subscriber_card=self.card, end_date=ended_at, is_active=True)
+        self.assertEqual(self.subscribe().status_code, 201)
+
+        expired.refresh_from_db()
+        self.assertEqual((expired.end_date, expired.is_active), (ended_at, True))
+        self.assertEqual(MultibankTransaction.objects.get(subscription=expired).status,
+                         MultibankTransactionStatusEnum.new)
+
+
+class ActivityInboxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(phone_number='998900000001', username='owner')
+        cls.fans = [User.objects.create(phone_number=f'99890000001{index}', username=f'fan{index}')
+                    for index in range(2)]
+
+    def like(self, fan: User, post_id: int = 1) -> ActivityEvent:
+        return ActivityEvent('liked_post', 'post', post_id, fan.pk, self.owner.pk, target_id=post_id)
+
+    def test_item_counts_distinct_actors(self):
+        first, second = self.fans
+        update_inbox([self.like(first), self.like(second), self.like(first)])
+        # Liked again in a later batch
+        update_inbox([self.like(second)])
+
+        item = ActivityInboxItem.objects.get(owner=self.owner)
+        self.assertEqual((item.count, item.last_actor_id), (2, second.pk))
+        self.assertEqual(ActivityInboxCounter.objects.get(user=self.owner).unread, 1)
+
+    def test_targets_are_counted_apart(self):
+        update_inbox([self.like(self.fans[0], post_id=1), self.like(self.fans[0], post_id=2)])
+
+        items = ActivityInboxItem.objects.filter(owner=self.owner).order_by('target_id')
+        self.assertEqual([item.count for item in items], [1, 1])
+        self.assertEqual(ActivityInboxCounter.objects.get(user=self.owner).unread, 2)
@@ -1,132 +1,471 @@
 # consumers.py
-import base64
+import asyncio
 import json
 import logging
+import time
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.core.files.base import ContentFile
 
-from apps.chat.models import ChatRoom, Message, BlockedUser
-from apps.files.utils import upload_file
+from apps.chat.policy import ChatPolicyDenied, check_message
+from apps.chat.services import accessible_rooms, advance_read_cursors, create_message, replay_messages
+from config.core.metrics import metrics
 
 logger = logging.getLogger()
 
+# Messages delivered within this many seconds are stored in the read cursor with one write
+READ_DEBOUNCE_SECONDS = 1.0
+# Rooms one user socket may be subscribed to at once
+MAX_SUBSCRIBED_ROOMS = 200
+# Missed messages sent on resume, beyond it the client gets a gap event and reloads history (chat/last-messages/)
+REPLAY_LIMIT = 200
+# Close codes: the client did not read its frames in time / sent nothing for CHAT_SOCKET['IDLE_TIMEOUT']
+CLOSE_SLOW_CONSUMER = 4008
+CLOSE_IDLE = 4000
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.user = self.scope['user']
 
-        if isinstance(self.user, AnonymousUser):
-            await self.close()
-            return
+def room_group(room_id) -> str:
+    return f'chat_{room_id}'
 
-        # Verify user has access to this chat room
-        chat_access_verification = await self.verify_chat_access()
-        if not chat_access_verification:
-            await self.close()
-            return
 
-        self.room_group_name = f'chat_{self.room_id}'
+class BaseChatConsumer(AsyncWebsocketConsumer):
+    """
+    Messages and read receipts of the chat rooms a socket is in (self.rooms, groups chat_<room_id>);
+    events of a room are sent through send_event.
+    Frames go through a bounded outbox written by a task of the socket, so a slow client never blocks event
+    handling: when the outbox is full (CHAT_SOCKET['OVERFLOW']) the frame is dropped or the socket is closed
+    with CLOSE_SLOW_CONSUMER, as it is when one frame is not written within CHAT_SOCKET['SEND_TIMEOUT'];
+    the client reconnects and resumes. Both apply as far as send of the server waits for the client.
+    {"event": "heartbeat"} is sent after CHAT_SOCKET['HEARTBEAT'] seconds without frames,
+    {"ping": ...} of the client is answered with {"event": "pong"}
+    """
+    # Messages delivered to the socket are shown to the user, so they are read
+    read_on_delivery = True
+    # Sockets and frames waiting in their outboxes in this process
+    sockets = 0
+    queued = 0
 
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+    async def connect(self):
+        self.user = self.scope['user']
+        self.rooms = {}  # room -> (creator_id, subscriber_id), loaded once by the access check
+        self.read_up_to = {}  # room -> newest message read on this socket, not stored in the cursor yet
+        self.read_flush = None
+        self.replayed = {}  # room -> newest message sent on resume, live events up to it are duplicates
+        self.options = settings.CHAT_SOCKET
+        self.outbox = asyncio.Queue(maxsize=self.options['OUTBOX_SIZE'])
+        self.writer = None
+        self.heartbeat = None
+        self.closing = False
+        self.received_at = self.sent_at = time.monotonic()
 
-        await self.accept()
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol, headers)
+        self.writer = asyncio.create_task(self.write_outbox())
+        self.heartbeat = asyncio.create_task(self.keep_alive())
+        BaseChatConsumer.sockets += 1
+        metrics.gauge('chat.sockets', BaseChatConsumer.sockets)
 
     async def disconnect(self, close_code):
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if getattr(self, 'read_flush', None) and not self.read_flush.done():
+            self.read_flush.cancel()
+        if getattr(self, 'read_up_to', None):
+            await self.flush_read()
+        if getattr(self, 'writer', None):
+            self.closing = True
+            self.writer.cancel()
+            self.heartbeat.cancel()
+            self.discard_outbox()
+            BaseChatConsumer.sockets -= 1
+            metrics.gauge('chat.sockets', BaseChatConsumer.sockets)
+
+        # Leave room groups
+        await self.leave_rooms(getattr(self, 'rooms', ()))
 
-    @database_sync_to_async
-    def verify_chat_access(self):
+    # Outbound frames
+
+    async def send(self, text_data=None, bytes_data=None, close=False) -> bool:
+        """
+        return: False when the frame is dropped
+        """
+        if self.closing:
+            return False
+        if self.writer is None:
+            await super().send(text_data, bytes_data, close)
+            return True
         try:
-            room = ChatRoom.objects.get(pk=self.room_id)
-        except ChatRoom.DoesNotExist:
+            self.outbox.put_nowait((time.monotonic(), text_data, bytes_data))
+        except asyncio.QueueFull:
+            metrics.increment('chat.dropped_frames')
+            if self.options['OVERFLOW'] == 'disconnect':
+                await self.drop_slow_consumer('overflow')
             return False
+        BaseChatConsumer.queued += 1
+        metrics.gauge('chat.outbox_depth', BaseChatConsumer.queued)
+        return True
 
-        # Check if current user is part of this chat
-        if self.user not in [room.creator, room.subscriber]:
-            return False
+    async def write_outbox(self):
+        while True:
+            queued_at, text_data, bytes_data = await self.outbox.get()
+            BaseChatConsumer.queued -= 1
+            try:
+                await asyncio.wait_for(super().send(text_data, bytes_data), self.options['SEND_TIMEOUT'])
+            except asyncio.TimeoutError:
+                await self.drop_slow_consumer('send_timeout')
+                return
+            self.sent_at = time.monotonic()
+            metrics.observe('chat.outbox_latency', self.sent_at - queued_at)
 
-        # Check if users are blocked
-        if BlockedUser.is_blocked(room.creator, room.subscriber):
-            return False
+    def discard_outbox(self):
+        BaseChatConsumer.queued -= self.outbox.qsize()
+        metrics.gauge('chat.outbox_depth', BaseChatConsumer.queued)
+        while not self.outbox.empty():
+            self.outbox.get_nowait()
 
-        # If chatting with creator, check subscription
-        # if room.creator.is_creator and self.user == room.subscriber:
-        #     return UserSubscription.objects.filter(
-        #         subscriber=self.user,
-        #         creator=room.creator,
-        #         is_active=True,
-        #         end_date__gt=timezone.now()
-        #     ).exists()
+    async def drop_slow_consumer(self, reason: str):
+        self.closing = True
+        metrics.increment('chat.slow_consumers', reason=reason)
+        logger.info(f'chat: user {self.user.id} is closed as a slow consumer ({reason}, {self.outbox.qsize()} queued)')
+        self.discard_outbox()
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        await self.close(code=CLOSE_SLOW_CONSUMER)
 
-        return True
+    async def keep_alive(self):
+        interval = self.options['HEARTBEAT']
+        while not self.closing:
+            await asyncio.sleep(interval)
+            idle_timeout = self.options['IDLE_TIMEOUT']
+            if idle_timeout and time.monotonic() - self.received_at > idle_timeout:
+                metrics.increment('chat.idle_closed')
+                self.closing = True
+                await self.close(code=CLOSE_IDLE)
+                return
+            if time.monotonic() - self.sent_at >= interval and self.outbox.empty():
+                await self.send(text_data=json.dumps({'event': 'heartbeat'}))
+
+    # Inbound frames
+
+    async def receive(self, text_data=None, bytes_data=None):
+        self.received_at = time.monotonic()
+        if text_data is None:
+            await self.send_error('frames must be JSON text')
+            return
+        try:
+            text_data_json = json.loads(text_data)
+        except ValueError:
+            await self.send_error('frame is not valid JSON')
+            return
+        if not isinstance(text_data_json, dict):
+            await self.send_error('frame must be a JSON object')
+            return
+        if 'ping' in text_data_json:
+            await self.send_event(None, {'event': 'pong'})
+            return
+        await self.receive_frame(text_data_json)
+
+    async def receive_frame(self, text_data_json: dict):
+        """
+        Frame of the client other than ping, subclasses handle the ones they support
+        """
+        await self.send_error('frame is not supported')
+
+    async def join_rooms(self, rooms: dict):
+        """
+        rooms: {room_id: (creator_id, subscriber_id)} the user has access to
+        """
+        await asyncio.gather(*(self.channel_layer.group_add(room_group(room_id), self.channel_name)
+                               for room_id in rooms))
+        self.rooms.update(rooms)
 
-    @database_sync_to_async
-    def create_message(self, content=None, file_data=None, file_name=None):
+    async def leave_rooms(self, room_ids):
+        room_ids = list(room_ids)
+        await asyncio.gather(*(self.channel_layer.group_discard(room_group(room_id), self.channel_name)
+                               for room_id in room_ids))
+        for room_id in room_ids:
+            self.rooms.pop(room_id, None)
+
+    async def persist_message(self, room_id, content=None, file_id=None) -> dict | None:
+        """
+        Attachments are uploaded out of band (files/upload-url/), only their id comes through the socket.
+        One thread hop and one statement: the room is not loaded again, its participants are known since connect;
+        chat policy is checked in the same hop from the cache
+        return: {'id', 'created_at', 'file_path'}, or None when the file is not the user's uploaded file
+        raise: ChatPolicyDenied
+        """
         try:
-            room = ChatRoom.objects.get(pk=self.room_id)
-            message = Message(room=room, sender=self.user)
-
-            if content:
-                message.content = content
-
-            if file_data and file_name:
-                data = ContentFile(base64.b64decode(file_data), name=file_name)
-                file = upload_file(data)
-                message.file = file
-            message.save()
-            return message
+            return await database_sync_to_async(self.write_message)(room_id, content, file_id)
+        except ChatPolicyDenied:
+            raise
         except Exception as e:
             logger.exception(f"create_message failed: {e.args}")
             raise e
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    def write_message(self, room_id, content, file_id) -> dict | None:
+        check_message(self.user.id, self.rooms[room_id])
+        return create_message(room_id, self.user.id, self.rooms[room_id], content=content, file_id=file_id)
+
+    def mark_read(self, room_id, message_id: int):
+        self.read_up_to[room_id] = max(self.read_up_to.get(room_id, 0), message_id)
+        if self.read_flush is None or self.read_flush.done():
+            self.read_flush = asyncio.create_task(self.flush_read(delay=READ_DEBOUNCE_SECONDS))
+
+    async def flush_read(self, delay: float = 0.0):
+        if delay:
+            await asyncio.sleep(delay)
+        read_up_to, self.read_up_to = self.read_up_to, {}
+        if not read_up_to:
+            return
+        # Cursors of all rooms read within the debounce period in one database call
+        moved = await database_sync_to_async(advance_read_cursors)(self.user.id, read_up_to)
+        for room_id in moved:
+            await self.channel_layer.group_send(room_group(room_id), {
+                'type': 'chat_read',
+                'room_id': room_id,
+                'user_id': self.user.id,
+                'last_read_message_id': read_up_to[room_id],
+            })
+
+    async def receive_room(self, room_id, text_data_json: dict):
+        # {"read": <message_id>}: client has shown messages up to it
+        if 'read' in text_data_json:
+            if isinstance(text_data_json['read'], int):
+                self.mark_read(room_id, text_data_json['read'])
+            return
 
         message_text = text_data_json.get('message')
-        file_data = text_data_json.get('file_data')  # base64 file string
-        file_name = text_data_json.get('file_name')  # original filename
+        file_id = text_data_json.get('file_id')  # File uploaded through files/upload-url/
 
-        db_message = await self.create_message(
-            content=message_text,
-            file_data=file_data,
-            file_name=file_name
-        )
+        if 'file_data' in text_data_json:
+            await self.send_error('file_data is not supported, upload the file to files/upload-url/ '
+                                  'and send its file_id', room_id)
+            return
+        if file_id is not None and not isinstance(file_id, int):
+            await self.send_error('file_id must be an integer', room_id)
+            return
+
+        try:
+            db_message = await self.persist_message(
+                room_id,
+                content=message_text,
+                file_id=file_id
+            )
+        except ChatPolicyDenied as e:
+            await self.send_error(e.detail, room_id)
+            return
+        if db_message is None:
+            await self.send_error('file is not found or not uploaded yet', room_id)
+            return
 
         message = {
             'type': 'chat_message',
+            'room_id': room_id,
             'message': message_text,
-            'file_url': db_message.file.path if db_message.file else None,
+            'file_url': db_message['file_path'],
             'sender_id': self.user.id,
-            'created_at': db_message.created_at.isoformat(),
-            'message_id': db_message.id
+            'created_at': db_message['created_at'].isoformat(),
+            'message_id': db_message['id']
         }
         await self.channel_layer.group_send(
-            self.room_group_name,
+            room_group(room_id),
             message
         )
 
+    async def resume(self, last_seen: dict):
+        """
+        Catch up after reconnecting, last_seen: {room_id: newest message id the client has}.
+        Messages after it are sent (with "replay": true) and closed by {"event": "resumed", "replayed": count};
+        when there are more than REPLAY_LIMIT of them or the message is unknown, {"event": "gap"} is sent instead.
+        Live events wait in the channel layer while this runs, the ones already replayed are skipped afterwards
+        """
+        replays = await database_sync_to_async(replay_messages)(last_seen, REPLAY_LIMIT + 1)
+        for room_id, messages in replays.items():
+            if messages is None or len(messages) > REPLAY_LIMIT:
+                await self.send_event(room_id, {'event': 'gap', 'last_seen_id': last_seen[room_id]})
+                continue
+            for message in messages:
+                if self.read_on_delivery and message['sender_id'] != self.user.id:
+                    self.mark_read(room_id, message['id'])
+                await self.send_event(room_id, {
+                    'message': message['content'],
+                    'file_path': message['file__path'],
+                    'sender_id': message['sender_id'],
+                    'created_at': message['created_at'].isoformat(),
+                    'message_id': message['id'],
+                    'replay': True,
+                })
+            if messages:
+                self.replayed[room_id] = max(self.replayed.get(room_id, 0), max(m['id'] for m in messages))
+            await self.send_event(room_id, {'event': 'resumed', 'replayed': len(messages)})
+
+    async def send_event(self, room_id, data: dict) -> bool:
+        return await self.send(text_data=json.dumps(data))
+
+    async def send_error(self, detail: str, room_id=None):
+        await self.send_event(room_id, {'event': 'error', 'detail': detail})
+
     async def chat_message(self, event):
-        if event['sender_id'] != self.user.id:
-            message = await Message.objects.aget(pk=event['message_id'])
-            message.is_read = True
-            await message.asave()
+        if event['room_id'] not in self.rooms:
+            # Sent to the group before the socket left it
+            return
+        if event['message_id'] <= self.replayed.get(event['room_id'], 0):
+            return
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        delivered = await self.send_event(event['room_id'], {
             'message': event['message'],
             'file_path': event['file_url'],
             'sender_id': event['sender_id'],
             'created_at': event['created_at'],
             'message_id': event['message_id']
+        })
+        # A dropped message is not read, the client gets it on resume
+        if delivered and self.read_on_delivery and event['sender_id'] != self.user.id:
+            self.mark_read(event['room_id'], event['message_id'])
+
+    async def chat_read(self, event):
+        # Read receipt: messages up to last_read_message_id are read by user_id
+        if event['room_id'] not in self.rooms:
+            return
+        await self.send_event(event['room_id'], {
+            'event': 'read',
+            'user_id': event['user_id'],
+            'last_read_message_id': event['last_read_message_id'],
+        })
+
+
+class ChatConsumer(BaseChatConsumer):
+    """
+    Socket of one room: ws/chat/<room_id>/, {"resume": last seen message id} catches up after reconnecting
+    """
+
+    async def connect(self):
+        await super().connect()
+        room_id = self.scope['url_route']['kwargs']['room_id']
+
+        if isinstance(self.user, AnonymousUser) or not room_id.isdigit():
+            await self.close()
+            return
+
+        # Verify user has access to this chat room
+        self.room_id = int(room_id)
+        rooms = await self.verify_chat_access()
+        if not rooms:
+            await self.close()
+            return
+
+        # Join room group
+        await self.join_rooms(rooms)
+
+        await self.accept()
+
+    async def verify_chat_access(self) -> dict:
+        """
+        return: {room_id: participants} when the user has access to the room, empty otherwise
+        """
+        return await database_sync_to_async(accessible_rooms)(self.user.id, [self.room_id])
+
+    async def receive_frame(self, text_data_json: dict):
+        # {"resume": <message_id>}: newest message the client has, sent after reconnecting
+        if 'resume' in text_data_json:
+            if isinstance(text_data_json['resume'], int):
+                await self.resume({self.room_id: text_data_json['resume']})
+            else:
+                await self.send_error('resume must be a message id')
+            return
+
+        await self.receive_room(self.room_id, text_data_json)
+
+
+class UserChatConsumer(BaseChatConsumer):
+    """
+    One socket per user for all of their rooms: ws/chat/
+    {"subscribe": [room ids]} joins rooms, access to the whole list is checked with one query and answered with
+    {"event": "subscribed", "rooms": [subscribed room ids], "denied": [room ids]};
+    {"unsubscribe": [room ids]} leaves rooms, answered with {"event": "unsubscribed", "rooms": [...]}.
+    {"room": id, "message": ..., "file_id": ...} and {"room": id, "read": message id} work as on the room socket
+    for subscribed rooms; every event of a room carries its "room".
+    {"resume": {"<room id>": last seen message id}} catches up after reconnecting (see resume), it may come in the
+    same frame as subscribe.
+    Rooms are listed rather than opened, so messages are read only by {"room": id, "read": message id}
+    """
+    read_on_delivery = False
+
+    async def connect(self):
+        await super().connect()
+
+        if isinstance(self.user, AnonymousUser):
+            await self.close()
+            return
+
+        await self.accept()
+
+    async def receive_frame(self, text_data_json: dict):
+        if 'subscribe' in text_data_json:
+            await self.subscribe(text_data_json['subscribe'])
+        if 'unsubscribe' in text_data_json:
+            await self.unsubscribe(text_data_json['unsubscribe'])
+        if 'resume' in text_data_json:
+            await self.resume_rooms(text_data_json['resume'])
+        if text_data_json.keys() & {'subscribe', 'unsubscribe', 'resume'}:
+            return
+
+        room_id = text_data_json.get('room')
+        if not isinstance(room_id, int) or isinstance(room_id, bool):
+            await self.send_error('room must be a room id')
+            return
+        if room_id not in self.rooms:
+            await self.send_error('room is not subscribed', room_id)
+            return
+        await self.receive_room(room_id, text_data_json)
+
+    @staticmethod
+    def room_ids(value) -> list | None:
+        if not isinstance(value, list) or not all(isinstance(room_id, int) for room_id in value):
+            return None
+        return value
+
+    async def subscribe(self, room_ids):
+        room_ids = self.room_ids(room_ids)
+        if room_ids is None:
+            await self.send_error('subscribe must be a list of room ids')
+            return
+        requested = set(room_ids) - self.rooms.keys()
+        if len(self.rooms) + len(requested) > MAX_SUBSCRIBED_ROOMS:
+            await self.send_error(f'at most {MAX_SUBSCRIBED_ROOMS} rooms can be subscribed')
+            return
+
+        allowed = await database_sync_to_async(accessible_rooms)(self.user.id, requested) if requested else {}
+        await self.join_rooms(allowed)
+        await self.send(text_data=json.dumps({
+            'event': 'subscribed',
+            'rooms': sorted(self.rooms),
+            'denied': sorted(requested - allowed.keys()),
         }))
+
+    async def unsubscribe(self, room_ids):
+        room_ids = self.room_ids(room_ids)
+        if room_ids is None:
+            await self.send_error('unsubscribe must be a list of room ids')
+            return
+        # Reads of the rooms are stored before leaving them
+        if any(room_id in self.read_up_to for room_id in room_ids):
+            await self.flush_read()
+        await self.leave_rooms(self.rooms.keys() & set(room_ids))
+        await self.send(text_data=json.dumps({'event': 'unsubscribed', 'rooms': sorted(self.rooms)}))
+
+    async def resume_rooms(self, last_seen):
+        if not isinstance(last_seen, dict) or not all(
+                room_id.isdigit() and isinstance(message_id, int) for room_id, message_id in last_seen.items()):
+            await self.send_error('resume must be an object of room id: message id')
+            return
+        last_seen = {int(room_id): message_id for room_id, message_id in last_seen.items()}
+        denied = sorted(last_seen.keys() - self.rooms.keys())
+        if denied:
+            await self.send_error(f'rooms are not subscribed: {denied}')
+        await self.resume({room_id: message_id for room_id, message_id in last_seen.items() if room_id in self.rooms})
+
+    async def send_event(self, room_id, data: dict) -> bool:
+        if room_id is not None:
+            data = {'room': room_id, **data}
+        return await self.send(text_data=json.dumps(data))
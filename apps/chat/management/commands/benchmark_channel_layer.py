@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.integrations.fake_servers.redis import FakeRedisServer
+from config.core.benchmark import latency_summary
+from config.core.channel_layer import ShardedRedisChannelLayer
+
+GROUP = 'benchmark'
+
+
+async def serve_sockets(hosts: list, sockets: int, messages: int, ready, timeout: float) -> dict:
+    layer = ShardedRedisChannelLayer(hosts=hosts, capacity=messages, inbox_capacity=messages * 2)
+    channels = [await layer.new_channel() for _ in range(sockets)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+    latencies = []
+
+    async def socket(channel):
+        # What a consumer does: receive and dispatch, here only the delivery latency is kept
+        for _ in range(messages):
+            message = await layer.receive(channel)
+            latencies.append(time.time() - message['sent_at'])
+
+    tasks = [asyncio.create_task(socket(channel)) for channel in channels]
+    await asyncio.sleep(0.1)  # inbox reader is up
+    ready.put(True)
+    _done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    last_at = time.time()
+    await layer.close()
+    return {'latencies': latencies, 'last_at': last_at}
+
+
+def run_worker(hosts, sockets, messages, ready, results, timeout):
+    results.put(asyncio.run(serve_sockets(hosts, sockets, messages, ready, timeout)))
+
+
+async def send_messages(hosts: list, messages: int, interval: float) -> list:
+    layer = ShardedRedisChannelLayer(hosts=hosts)
+    samples = []
+    for seq in range(messages):
+        started = time.perf_counter()
+        await layer.group_send(GROUP, {'type': 'chat.message', 'seq': seq, 'sent_at': time.time()})
+        samples.append(time.perf_counter() - started)
+        if interval:
+            await asyncio.sleep(interval)
+    await layer.close()
+    return samples
+
+
+class Command(BaseCommand):
+    help = 'Measure group fan-out of the sharded channel layer: sockets split across worker processes ' \
+           'all in one group, messages/sec delivered and send-to-socket latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=10000)
+        parser.add_argument('--workers', type=int, default=4, help='Processes the sockets are split across')
+        parser.add_argument('--messages', type=int, default=100, help='group_send calls')
+        parser.add_argument('--interval', type=float, default=0.1,
+                            help='Pause between group_send calls, 0 to send as fast as possible')
+        parser.add_argument('--shards', type=int, default=2, help='In-process fake Redis servers')
+        parser.add_argument('--hosts', nargs='*', help='Benchmark running Redis servers instead of fake ones')
+        parser.add_argument('--timeout', type=float, default=120.0)
+
+    def handle(self, *args, **options):
+        servers = []
+        hosts = options['hosts']
+        if not hosts:
+            servers = [FakeRedisServer().start() for _ in range(options['shards'])]
+            hosts = [server.base_url for server in servers]
+
+        context = multiprocessing.get_context('spawn')
+        ready, results = context.Queue(), context.Queue()
+        per_worker = options['sockets'] // options['workers']
+        workers = [
+            context.Process(target=run_worker, args=(hosts, per_worker, options['messages'], ready, results,
+                                                     options['timeout']), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        try:
+            for worker in workers:
+                worker.start()
+            for _ in workers:
+                ready.get(timeout=options['timeout'])
+            self.stdout.write(f"{per_worker * len(workers)} sockets in {len(workers)} workers, {len(hosts)} shards")
+
+            started = time.time()
+            send_samples = asyncio.run(send_messages(hosts, options['messages'], options['interval']))
+            send_time = time.time() - started
+            reports = [results.get(timeout=options['timeout']) for _ in workers]
+        finally:
+            for worker in workers:
+                worker.join(timeout=5)
+            for server in servers:
+                server.stop()
+
+        latencies = [sample for report in reports for sample in report['latencies']]
+        expected = per_worker * len(workers) * options['messages']
+        delivery_time = max(report['last_at'] for report in reports) - started
+        send_summary = latency_summary(send_samples)
+        send_summary['per_second'] = round(options['messages'] / send_time, 1)
+        self.stdout.write(f'group_send: {send_summary}')
+        self.stdout.write(f"delivered: {len(latencies)}/{expected}, "
+                          f"{round(len(latencies) / delivery_time, 1)} messages/sec")
+        self.stdout.write(f'fan-out latency: {latency_summary(latencies)}')
+        if servers:
+            self.stdout.write(f'upstream: {[server.stats for server in servers]}')
@@ -0,0 +1,110 @@
+import asyncio
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.test.utils import override_settings
+
+from apps.authentication.models import User
+from apps.chat.consumers import ChatConsumer
+from apps.chat.models import ChatInbox, ChatRoom, Message
+from apps.chat.services import create_inbox
+from config.core.benchmark import latency_summary
+
+
+class LegacyChatConsumer(ChatConsumer):
+    """
+    Write path before participants were cached: the room is loaded again for every message,
+    then the message and inbox rows are saved by the ORM in a transaction; two thread hops
+    """
+
+    async def persist_message(self, room_id, content=None, file_id=None) -> dict | None:
+        room = await database_sync_to_async(ChatRoom.objects.get)(pk=room_id)
+        return await database_sync_to_async(self.save_message)(room, content)
+
+    def save_message(self, room, content):
+        with transaction.atomic():
+            message = Message.objects.create(room=room, sender=self.user, content=content)
+            ChatInbox.objects.filter(room=room).update(
+                last_message_id=message.id, last_sender_id=message.sender_id, preview=(content or '')[:100],
+                last_activity_at=message.created_at,
+                unread_count=Case(When(user_id=self.user.id, then=F('unread_count')),
+                                  default=F('unread_count') + Value(1)),
+            )
+        return {'id': message.id, 'created_at': message.created_at, 'file_path': None}
+
+
+def application(consumer, user, room_id):
+    app = consumer.as_asgi()
+
+    async def inner(scope, receive, send):
+        scope = dict(scope, user=user, url_route={'kwargs': {'room_id': str(room_id)}})
+        return await app(scope, receive, send)
+
+    return inner
+
+
+async def run_room(consumer, sender, receiver, room_id, messages: int, samples: list):
+    sending = WebsocketCommunicator(application(consumer, sender, room_id), f'/ws/chat/{room_id}/')
+    receiving = WebsocketCommunicator(application(consumer, receiver, room_id), f'/ws/chat/{room_id}/')
+    await sending.connect()
+    await receiving.connect()
+    try:
+        for seq in range(messages):
+            started = time.perf_counter()
+            await sending.send_json_to({'message': f'benchmark {seq}'})
+            await receiving.receive_json_from(timeout=10)
+            samples.append(time.perf_counter() - started)
+            await sending.receive_json_from(timeout=10)  # own echo
+    finally:
+        await sending.disconnect()
+        await receiving.disconnect()
+
+
+class Command(BaseCommand):
+    help = 'Compare send-to-receive latency of chat messages: legacy write path (room fetched again, ORM save, ' \
+           'two thread hops) vs cached participants with one statement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Rooms chatting at the same time')
+        parser.add_argument('--messages', type=int, default=100, help='Messages per room')
+
+    def handle(self, *args, **options):
+        users = User.objects.bulk_create([
+            User(username=f'benchmark_{uuid.uuid4().hex[:12]}', phone_number=f'bench{uuid.uuid4().hex[:10]}')
+            for _ in range(options['rooms'] * 2)
+        ])
+        rooms = []
+        for index in range(options['rooms']):
+            room = ChatRoom.objects.create(creator=users[index * 2], subscriber=users[index * 2 + 1])
+            create_inbox(room)
+            rooms.append(room)
+
+        # Senders write faster than the chat_message rate limit lets them
+        rules = dict(settings.RATE_LIMITS['RULES'], chat_message=('token_bucket', 10 ** 9, 1))
+        try:
+            with override_settings(RATE_LIMITS=dict(settings.RATE_LIMITS, RULES=rules)):
+                self.compare(rooms, users, options['messages'])
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def compare(self, rooms, users, messages):
+        for name, consumer in (('legacy', LegacyChatConsumer), ('cached', ChatConsumer)):
+            samples = []
+            started = time.perf_counter()
+            asyncio.run(self.run(consumer, rooms, users, messages, samples))
+            summary = latency_summary(samples)
+            summary['messages_per_second'] = round(len(samples) / (time.perf_counter() - started), 1)
+            self.stdout.write(f'{name:>7}: {summary}')
+
+    @staticmethod
+    async def run(consumer, rooms, users, messages, samples):
+        await asyncio.gather(*(
+            run_room(consumer, users[index * 2], users[index * 2 + 1], room.id, messages, samples)
+            for index, room in enumerate(rooms)
+        ))
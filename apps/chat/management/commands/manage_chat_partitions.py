@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.chat.partitions import create_partitions, detach_partitions, MONTHS_AHEAD
+
+
+class Command(BaseCommand):
+    help = 'Create monthly partitions of chat_message ahead of time (run_notification_scheduler does it as well) ' \
+           'and detach the ones older than the retention (run periodically, e.g. daily cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=MONTHS_AHEAD, help='Months partitioned after the current one')
+        parser.add_argument('--retain-months', type=int, default=settings.CHAT_MESSAGE_RETENTION_MONTHS,
+                            help='Detach partitions ending before N months ago, 0 keeps everything')
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them '
+                                                                'as tables to archive')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        created = create_partitions(options['ahead'], dry_run=options['dry_run'])
+        detached = []
+        if options['retain_months']:
+            detached = detach_partitions(options['retain_months'], drop=options['drop'], dry_run=options['dry_run'])
+        prefix = 'Dry run, would be ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}created: {', '.join(created) or '-'}; "
+            f"{'dropped' if options['drop'] else 'detached'}: {', '.join(detached) or '-'}"
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 17:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_alter_chatsettings_minimum_message_donation_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'chat_read_cursor',
+                'constraints': [models.UniqueConstraint(fields=('room', 'user'), name='chat_read_cursor_unique')],
+            },
+        ),
+        # Cursor of every recipient is the newest message it has read
+        migrations.RunSQL(
+            "INSERT INTO chat_read_cursor (room_id, user_id, last_read_message_id, created_at, updated_at) "
+            "SELECT m.room_id, CASE WHEN m.sender_id = r.creator_id THEN r.subscriber_id ELSE r.creator_id END, "
+            "MAX(m.id), NOW(), NOW() "
+            "FROM chat_message m JOIN chat_room r ON r.id = m.room_id WHERE m.is_read "
+            "GROUP BY 1, 2",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
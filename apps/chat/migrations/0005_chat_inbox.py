@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-19 17:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_read_cursor'),
+        ('files', '0002_file_owner_is_uploaded'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('preview', models.CharField(blank=True, default='', max_length=100)),
+                ('last_activity_at', models.DateTimeField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('chat_with', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('last_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='files.file')),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'chat_inbox',
+                'indexes': [models.Index(fields=['user', '-last_activity_at', '-id'], name='chat_inbox_user_activity_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'room'), name='chat_inbox_unique')],
+            },
+        ),
+        # Row of both participants of every room, unread counted from their read cursors
+        migrations.RunSQL(
+            "INSERT INTO chat_inbox (user_id, room_id, chat_with_id, last_message_id, last_sender_id, last_file_id, "
+            "preview, last_activity_at, unread_count, created_at, updated_at) "
+            "SELECT p.user_id, r.id, p.chat_with_id, m.id, m.sender_id, m.file_id, LEFT(COALESCE(m.content, ''), 100), "
+            "COALESCE(m.created_at, r.created_at, NOW()), "
+            "(SELECT COUNT(*) FROM chat_message u WHERE u.room_id = r.id AND u.sender_id <> p.user_id "
+            "AND u.id > COALESCE((SELECT c.last_read_message_id FROM chat_read_cursor c "
+            "WHERE c.room_id = r.id AND c.user_id = p.user_id), 0)), NOW(), NOW() "
+            "FROM chat_room r "
+            "CROSS JOIN LATERAL (VALUES (r.creator_id, r.subscriber_id), (r.subscriber_id, r.creator_id)) "
+            "AS p (user_id, chat_with_id) "
+            "LEFT JOIN LATERAL (SELECT * FROM chat_message WHERE room_id = r.id ORDER BY id DESC LIMIT 1) m ON true",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,117 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+# Months partitioned ahead of the current one, later ones are created by NotificationScheduler.tick()
+# (apps/chat/partitions.py: ensure_partitions)
+MONTHS_AHEAD = 3
+
+
+def month_start(value, months=0):
+    value = timezone.localtime(value)
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_messages(apps, schema_editor):
+    """
+    chat_message becomes a table partitioned by month of created_at; rows stay where they are,
+    the old table is attached as the partition of everything before the next month (chat_message_legacy)
+    """
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(created_at) FROM chat_message')
+        newest = cursor.fetchone()[0]
+        cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'chat_message' "
+                       "AND indexname <> 'chat_message_pkey'")
+        indexes = cursor.fetchall()
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = 'chat_message'::regclass AND contype = 'f'")
+        foreign_keys = cursor.fetchall()
+
+    # Names of indexes are unique per schema, the parent takes over the ones Django knows
+    execute('ALTER TABLE chat_message RENAME TO chat_message_legacy')
+    # A partition takes the primary key of the parent, (id, created_at)
+    execute('ALTER TABLE chat_message_legacy DROP CONSTRAINT chat_message_pkey, '
+            'ADD CONSTRAINT chat_message_legacy_pkey PRIMARY KEY (id, created_at)')
+    for name, _definition in indexes:
+        execute(f'ALTER INDEX {name} RENAME TO {name.replace("chat_message_", "chat_message_legacy_", 1)}')
+    # Identity columns can not be attached to a partitioned table, ids continue from a plain sequence
+    execute('ALTER TABLE chat_message_legacy ALTER COLUMN id DROP IDENTITY')
+
+    execute('CREATE TABLE chat_message (LIKE chat_message_legacy INCLUDING DEFAULTS, '
+            'CONSTRAINT chat_message_pkey PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)')
+    execute('CREATE SEQUENCE chat_message_id_seq OWNED BY chat_message.id')
+    execute("SELECT setval('chat_message_id_seq', COALESCE((SELECT MAX(id) FROM chat_message_legacy), 0) + 1, false)")
+    execute("ALTER TABLE chat_message ALTER COLUMN id SET DEFAULT nextval('chat_message_id_seq')")
+    for _name, definition in indexes:
+        execute(definition)
+    for name, definition in foreign_keys:
+        execute(f'ALTER TABLE chat_message ADD CONSTRAINT {name} {definition}')
+
+    # Equal indexes and foreign keys of the old table are attached, not built again
+    legacy_until = month_start(max(timezone.now(), newest or timezone.now()), 1)
+    execute('ALTER TABLE chat_message ATTACH PARTITION chat_message_legacy '
+            f"FOR VALUES FROM (MINVALUE) TO ('{legacy_until.isoformat()}')")
+    for months in range(MONTHS_AHEAD):
+        start, end = month_start(legacy_until, months), month_start(legacy_until, months + 1)
+        execute(f'CREATE TABLE chat_message_p{start:%Y%m} PARTITION OF chat_message '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+
+
+def unpartition_messages(apps, schema_editor):
+    """
+    Back to a plain chat_message with an identity id; rows of attached partitions are copied into it,
+    detached ones (manage_chat_partitions --retain-months) are left as they are
+    """
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'chat_message' "
+                       "AND indexname <> 'chat_message_pkey'")
+        indexes = cursor.fetchall()
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = 'chat_message'::regclass AND contype = 'f'")
+        foreign_keys = cursor.fetchall()
+
+    execute('CREATE TABLE chat_message_plain (LIKE chat_message)')
+    execute('INSERT INTO chat_message_plain SELECT * FROM chat_message')
+    # Partitions and the sequence owned by chat_message.id go with it
+    execute('DROP TABLE chat_message')
+    execute('ALTER TABLE chat_message_plain RENAME TO chat_message')
+    execute('ALTER TABLE chat_message ADD CONSTRAINT chat_message_pkey PRIMARY KEY (id), '
+            'ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    execute("SELECT setval(pg_get_serial_sequence('chat_message', 'id'), "
+            "COALESCE((SELECT MAX(id) FROM chat_message), 0) + 1, false)")
+    # Indexes of a partitioned table are defined ON ONLY it
+    for _name, definition in indexes:
+        execute(definition.replace(' ON ONLY ', ' ON ', 1))
+    for name, definition in foreign_keys:
+        execute(f'ALTER TABLE chat_message ADD CONSTRAINT {name} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chat_inbox'),
+    ]
+
+    operations = [
+        # created_at is the partition key, it is a part of the primary key and can not be null
+        migrations.RunSQL(
+            'UPDATE chat_message SET created_at = COALESCE(updated_at, NOW()) WHERE created_at IS NULL',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ['created_at', 'id']},
+        ),
+        migrations.RunPython(partition_messages, unpartition_messages),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'created_at', 'id'], name='chat_message_room_created_idx'),
+        ),
+    ]
@@ -52,16 +52,59 @@ class Message(BaseModel):
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField(null=True, blank=True)
     file = models.ForeignKey('files.File', on_delete=models.SET_NULL, null=True, blank=True, related_name='messages')
-    is_read = models.BooleanField(default=False)
+    # Partition key: chat_message is partitioned by month of created_at, see apps/chat/partitions.py
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'chat_message'
-        ordering = ['created_at']
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['room', 'created_at', 'id'], name='chat_message_room_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender}: {self.content[:10]}...'
 
 
+class ChatReadCursor(BaseModel):
+    """Newest message of the room read by the user, messages up to it are read"""
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_read_message_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'chat_read_cursor'
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='chat_read_cursor_unique')
+        ]
+
+
+class ChatInbox(BaseModel):
+    """
+    Inbox read model: one row per participant of a room with its last message and unread count,
+    maintained by the message write path (apps.chat.services.create_message)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_inbox')
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='inbox')
+    chat_with = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_file = models.ForeignKey('files.File', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='+')
+    preview = models.CharField(max_length=100, default='', blank=True)
+    last_activity_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'chat_inbox'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'room'], name='chat_inbox_unique')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at', '-id'], name='chat_inbox_user_activity_idx'),
+        ]
+
+
 class ChatSettings(BaseModel):
     """Represents a chat settings of creator"""
 
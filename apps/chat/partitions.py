@@ -0,0 +1,110 @@
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger()
+
+# chat_message is partitioned by month of created_at (local time): chat_message_p<YYYYMM>;
+# chat_message_legacy holds everything written before partitioning
+TABLE = 'chat_message'
+PARTITION_PREFIX = 'chat_message_p'
+BOUND_RE = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+# Months partitioned after the current one
+MONTHS_AHEAD = 3
+# pg_advisory_xact_lock key of ensure_partitions
+PARTITIONS_LOCK = 4046
+
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    value = timezone.localtime(value)
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def parse_bound(value: str) -> datetime | None:
+    # MINVALUE / MAXVALUE are open bounds
+    if not value.startswith("'"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def partitions() -> list[tuple[str, datetime | None, datetime | None]]:
+    """
+    return: (name, start, end) of attached partitions by start, None for open bounds
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass',
+            [TABLE]
+        )
+        rows = cursor.fetchall()
+    result = []
+    for name, bound in rows:
+        match = BOUND_RE.fullmatch(bound)
+        if match is None:
+            logger.warning(f'chat_partitions: {name} has unexpected bound {bound}')
+            continue
+        result.append((name, parse_bound(match.group(1)), parse_bound(match.group(2))))
+    return sorted(result, key=lambda partition: partition[1] or datetime.min.replace(tzinfo=dt_timezone.utc))
+
+
+def create_partitions(months_ahead: int, dry_run: bool = False) -> list[str]:
+    """
+    Partitions from the end of the last one up to `months_ahead` months after the current one; a message
+    with created_at outside of every partition can not be written
+    return: names of created partitions
+    """
+    until = month_start(timezone.now(), months_ahead + 1)
+    ends = [end for _name, _start, end in partitions() if end is not None]
+    start = max(ends) if ends else month_start(timezone.now())
+    created = []
+    while start < until:
+        end = month_start(start, 1)
+        name = f'{PARTITION_PREFIX}{timezone.localtime(start):%Y%m}'
+        if not dry_run:
+            # Attaching an empty table locks chat_message lighter than CREATE TABLE ... PARTITION OF,
+            # writes go on meanwhile; indexes and foreign keys of the parent are created on it
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+                cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} '
+                               f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+        created.append(name)
+        start = end
+    return created
+
+
+def ensure_partitions(months_ahead: int = MONTHS_AHEAD) -> list[str]:
+    """
+    create_partitions for periodic callers of several processes: skipped while another one is at it
+    return: names of created partitions
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [PARTITIONS_LOCK])
+        if not cursor.fetchone()[0]:
+            return []
+        return create_partitions(months_ahead)
+
+
+def detach_partitions(retain_months: int, drop: bool = False, dry_run: bool = False) -> list[str]:
+    """
+    Detach partitions that end before the first day of `retain_months` months ago; detached ones stay as
+    standalone tables to archive (pg_dump -t) unless `drop`
+    return: names of detached partitions
+    """
+    cutoff = month_start(timezone.now(), -retain_months)
+    detached = []
+    for name, _start, end in partitions():
+        if end is None or end > cutoff:
+            continue
+        if not dry_run:
+            with connection.cursor() as cursor:
+                # Outside of a transaction: CONCURRENTLY does not block reads and writes of chat_message
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name} CONCURRENTLY')
+                if drop:
+                    cursor.execute(f'DROP TABLE {name}')
+        detached.append(name)
+    return detached
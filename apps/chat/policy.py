@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils.timezone import now
+
+from apps.authentication.models import BlockedUser, Donation, User, UserSubscription
+from apps.chat.models import CanChatWithSettingsEnum, ChatSettings
+from apps.integrations.models import MultibankTransactionStatusEnum
+from config.core.rate_limit import hit
+
+# Who may write to a creator is read from the cache on every message, the database is asked on a miss only:
+# chat:settings:<creator>         rules of ChatSettings of the creator
+# chat:access:<creator>:<user>    block between them, active subscription plans and largest paid donation of the user
+# Invalidation has to reach every Daphne process, so the cache is used only when it is shared (Redis);
+# with LocMemCache every message asks the database
+
+
+class ChatPolicyDenied(Exception):
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def policy_cache():
+    """
+    return: the default cache when every process sees it, None for LocMemCache
+    """
+    cache = caches['default']
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def settings_key(creator_id) -> str:
+    return f'chat:settings:{creator_id}'
+
+
+def access_key(creator_id, user_id) -> str:
+    return f'chat:access:{creator_id}:{user_id}'
+
+
+def chat_rules(creator_id: int) -> list[tuple]:
+    """
+    return: [(can_chat, subscription plan ids, minimum donation)], a creator without settings is open to everyone
+    """
+    cache = policy_cache()
+    rules = cache.get(settings_key(creator_id)) if cache is not None else None
+    if rules is None:
+        rules = [
+            (can_chat_with, list(plans or ()), minimum or 0)
+            for can_chat_with, plans, minimum in
+            ChatSettings.objects
+            .filter(creator_id=creator_id)
+            .values_list('can_chat', 'subscription_plans', 'minimum_message_donation')
+        ] or [(CanChatWithSettingsEnum.everyone, [], 0)]
+        if cache is not None:
+            cache.set(settings_key(creator_id), rules, timeout=settings.CHAT_POLICY['SETTINGS_TTL'])
+    return rules
+
+
+def chat_access(creator_id: int, user_id: int) -> dict:
+    """
+    State of the user towards the creator, one query on a cache miss; kept until the first subscription ends
+    return: {'blocked', 'plans', 'donated'}
+    """
+    cache = policy_cache()
+    access = cache.get(access_key(creator_id, user_id)) if cache is not None else None
+    if access is not None:
+        return access
+    subscriptions = UserSubscription.objects.filter(
+        subscriber_id=OuterRef('pk'), creator_id=creator_id, is_active=True, end_date__gte=now()
+    )
+    access = User.objects.filter(pk=user_id).values(
+        blocked=Exists(BlockedUser.objects.filter(
+            Q(blocker_id=creator_id, blocked_id=OuterRef('pk')) | Q(blocker_id=OuterRef('pk'), blocked_id=creator_id)
+        )),
+        plans=ArraySubquery(subscriptions.values('plan_id')),
+        subscribed_until=Subquery(subscriptions.order_by('end_date').values('end_date')[:1]),
+        donated=Subquery(
+            Donation.objects
+            .filter(donator_id=OuterRef('pk'), creator_id=creator_id,
+                    multibank_transactions__status=MultibankTransactionStatusEnum.paid)
+            .order_by('-amount')
+            .values('amount')[:1]
+        ),
+    ).first() or {'blocked': True, 'plans': [], 'subscribed_until': None, 'donated': None}
+    timeout = settings.CHAT_POLICY['ACCESS_TTL']
+    subscribed_until = access.pop('subscribed_until')
+    if subscribed_until is not None:
+        timeout = max(1, min(timeout, int((subscribed_until - now()).total_seconds())))
+    access['donated'] = access['donated'] or 0
+    if cache is not None:
+        cache.set(access_key(creator_id, user_id), access, timeout=timeout)
+    return access
+
+
+def can_chat(rule: tuple, access: dict) -> bool:
+    can_chat_with, plans, minimum = rule
+    if can_chat_with == CanChatWithSettingsEnum.everyone:
+        return True
+    if can_chat_with == CanChatWithSettingsEnum.subscribers:
+        # No plans listed: any active subscription
+        return bool(access['plans']) and (not plans or any(plan in plans for plan in access['plans']))
+    if can_chat_with == CanChatWithSettingsEnum.donations:
+        return access['donated'] > 0 and access['donated'] >= minimum
+    return False
+
+
+def check_message(sender_id: int, participants: tuple):
+    """
+    Messages to the creator of the room (the user the chat was started with) follow the creator's ChatSettings,
+    any of the rules lets the sender through; the creator answers freely. A block stops both, every sender is
+    rate limited. Reads the cache only, while snapshots are there
+    raise: ChatPolicyDenied
+    """
+    allowed, retry_after = hit('chat_message', sender_id)
+    if not allowed:
+        raise ChatPolicyDenied(f'too many messages, retry in {int(retry_after) + 1}s')
+    creator_id, subscriber_id = participants
+    # Blocks count both ways, one snapshot serves both participants
+    access = chat_access(creator_id, subscriber_id)
+    if access['blocked']:
+        raise ChatPolicyDenied('chat is blocked')
+    if sender_id != creator_id and not any(can_chat(rule, access) for rule in chat_rules(creator_id)):
+        raise ChatPolicyDenied('chat settings of the user do not allow your messages')
+
+
+def invalidate_chat_rules(creator_id: int):
+    cache = policy_cache()
+    if cache is not None:
+        transaction.on_commit(lambda: cache.delete(settings_key(creator_id)))
+
+
+def invalidate_chat_access(pairs):
+    """
+    pairs: (creator_id, user_id) whose block, subscription or donation has changed; blocks count both ways
+    """
+    cache = policy_cache()
+    keys = [key for creator_id, user_id in pairs
+            for key in (access_key(creator_id, user_id), access_key(user_id, creator_id))]
+    if cache is not None and keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,7 +1,8 @@
 from django.urls import re_path
 
-from apps.chat.consumers import ChatConsumer
+from apps.chat.consumers import ChatConsumer, UserChatConsumer
 
 websocket_urlpatterns = [
+    re_path(r'ws/chat/$', UserChatConsumer.as_asgi()),
     re_path(r'ws/chat/(?P<room_id>\w+)/$', ChatConsumer.as_asgi()),
 ]
@@ -1,47 +1,32 @@
 from rest_framework import serializers
 
-from apps.chat.models import Message, ChatRoom, ChatSettings
+from apps.chat.models import Message, ChatInbox, ChatSettings
+from apps.chat.services import is_read
 from apps.files.serializers import FileSerializer
 
 
 class UserChatRoomListSerializer(serializers.ModelSerializer):
-    chat_with = serializers.SerializerMethodField(read_only=True)
-    chat_with_username = serializers.SerializerMethodField(read_only=True)
+    id = serializers.IntegerField(source='room_id', read_only=True)
+    chat_with_username = serializers.CharField(source='chat_with.username', read_only=True)
     last_message = serializers.SerializerMethodField(read_only=True)
 
-    def get_chat_with(self, room):
-        user = self.context['request'].user
-        if room.subscriber == user:
-            chat_with = room.creator
-        else:
-            chat_with = room.subscriber
-        return chat_with.id
-
-    def get_chat_with_username(self, room):
-        user = self.context['request'].user
-        if room.subscriber == user:
-            chat_with = room.creator
-        else:
-            chat_with = room.subscriber
-        return chat_with.username
-
-    def get_last_message(self, room):
-        user = self.context['request'].user
-        message = room.messages.order_by('-id').first()
-        file = FileSerializer(message.file).data
-        if message.sender != user:
-            is_read = message.is_read
-        else:
-            is_read = True
-        return {'id': message.id, 'content': message.content, 'file': file, 'is_read': is_read}
+    def get_last_message(self, inbox):
+        if inbox.last_message_id is None:
+            return None
+        file = FileSerializer(inbox.last_file).data
+        # Others' last message is read when nothing is unread, own one is always read
+        read = inbox.last_sender_id == inbox.user_id or not inbox.unread_count
+        return {'id': inbox.last_message_id, 'content': inbox.preview, 'file': file, 'is_read': read}
 
     class Meta:
-        model = ChatRoom
+        model = ChatInbox
         fields = [
             'id',
             'chat_with',
             'chat_with_username',
             'last_message',
+            'unread_count',
+            'last_activity_at',
         ]
 
 
@@ -50,12 +35,8 @@ class MessageListSerializer(serializers.ModelSerializer):
     is_read = serializers.SerializerMethodField()
 
     def get_is_read(self, obj):
-        user = self.context['request'].user
-        if obj.sender != user:
-            obj.is_read = True
-            obj.save()
-            return True
-        return None
+        # Own messages: read by the other participant; others' messages: read by the current user
+        return is_read(obj, self.context.get('read_cursors', {}))
 
     class Meta:
         model = Message
@@ -0,0 +1,200 @@
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils.timezone import now, timedelta
+
+from apps.authentication.models import BlockedUser
+from apps.chat.models import ChatInbox, ChatReadCursor, ChatRoom, Message
+
+# created_at comes from the clocks of app servers, a message with a greater id may be that much older
+CLOCK_SKEW = timedelta(minutes=1)
+
+
+def room_participants(room_id) -> tuple:
+    """
+    return: (creator_id, subscriber_id), empty when the room does not exist
+    """
+    return ChatRoom.objects.filter(pk=room_id).values_list('creator_id', 'subscriber_id').first() or ()
+
+
+def accessible_rooms(user_id: int, room_ids) -> dict:
+    """
+    Rooms of the list the user takes part in, without a block between its participants; one query for the list
+    return: {room_id: (creator_id, subscriber_id)}
+    """
+    blocked = BlockedUser.objects.filter(
+        Q(blocker_id=OuterRef('creator_id'), blocked_id=OuterRef('subscriber_id')) |
+        Q(blocker_id=OuterRef('subscriber_id'), blocked_id=OuterRef('creator_id'))
+    )
+    return {
+        room_id: (creator_id, subscriber_id)
+        for room_id, creator_id, subscriber_id in
+        ChatRoom.objects
+        .filter(Q(creator_id=user_id) | Q(subscriber_id=user_id), pk__in=room_ids)
+        .exclude(Exists(blocked))
+        .values_list('pk', 'creator_id', 'subscriber_id')
+    }
+
+
+def advance_read_cursor(room_id, user_id: int, message_id: int) -> bool:
+    """
+    Mark messages of the room up to message_id as read by the user; the cursor never moves back
+    return: whether the cursor moved
+    """
+    with transaction.atomic():
+        moved = _advance_read_cursor(room_id, user_id, message_id)
+        if moved:
+            refresh_unread(room_id, user_id)
+    return moved
+
+
+def _advance_read_cursor(room_id, user_id: int, message_id: int) -> bool:
+    cursors = ChatReadCursor.objects.filter(room_id=room_id, user_id=user_id, last_read_message_id__lt=message_id)
+    if cursors.update(last_read_message_id=message_id, updated_at=now()):
+        return True
+    cursor, created = ChatReadCursor.objects.get_or_create(
+        room_id=room_id, user_id=user_id, defaults={'last_read_message_id': message_id}
+    )
+    if created or cursor.last_read_message_id >= message_id:
+        return created
+    # Created concurrently and still behind
+    return bool(cursors.update(last_read_message_id=message_id, updated_at=now()))
+
+
+def advance_read_cursors(user_id: int, read_up_to: dict) -> list:
+    """
+    advance_read_cursor for {room_id: message_id}
+    return: rooms whose cursor moved
+    """
+    return [room_id for room_id, message_id in read_up_to.items()
+            if advance_read_cursor(room_id, user_id, message_id)]
+
+
+def read_cursors(room_id, participants: tuple) -> dict:
+    """
+    return: {user_id: last read message id} of room participants
+    """
+    return dict(
+        ChatReadCursor.objects
+        .filter(room_id=room_id, user_id__in=participants)
+        .values_list('user_id', 'last_read_message_id')
+    )
+
+
+def is_read(message, cursors: dict) -> bool:
+    """
+    Message is read when the cursor of the other participant reached it
+    """
+    return any(last_read >= message.id for user_id, last_read in cursors.items() if user_id != message.sender_id)
+
+
+# Columns of the inbox row taken from the newest message only, messages may commit out of order
+INBOX_MESSAGE_COLUMNS = ('last_message_id', 'last_sender_id', 'last_file_id', 'preview', 'last_activity_at')
+INBOX_PREVIEW_LENGTH = 100
+
+
+def create_inbox(room: ChatRoom):
+    """
+    Inbox rows of both participants of a new room
+    """
+    ChatInbox.objects.bulk_create([
+        ChatInbox(user_id=room.creator_id, room=room, chat_with_id=room.subscriber_id,
+                  last_activity_at=room.created_at or now()),
+        ChatInbox(user_id=room.subscriber_id, room=room, chat_with_id=room.creator_id,
+                  last_activity_at=room.created_at or now()),
+    ], ignore_conflicts=True)
+
+
+def create_message(room_id: int, sender_id: int, participants: tuple, content: str | None = None,
+                   file_id: int | None = None) -> dict | None:
+    """
+    Write the message and put it into inbox rows of the room participants with one statement (one round trip,
+    no transaction to open); unread count of the recipient grows by one. The file must be the sender's uploaded one
+    return: {'id', 'created_at', 'file_path'} of the message, None when the file is not found
+    """
+    created_at = now()
+    params = {
+        'room': room_id, 'sender': sender_id, 'content': content or None, 'file': file_id, 'now': created_at,
+        'preview': (content or '')[:INBOX_PREVIEW_LENGTH],
+        'first': participants[0], 'second': participants[1],
+        'first_unread': int(participants[0] != sender_id), 'second_unread': int(participants[1] != sender_id),
+    }
+    newer = 'EXCLUDED.last_message_id > COALESCE(chat_inbox.last_message_id, 0)'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'WITH message AS ('
+            'INSERT INTO chat_message (room_id, sender_id, content, file_id, created_at, updated_at) '
+            'SELECT %(room)s, %(sender)s, %(content)s, %(file)s, %(now)s, %(now)s '
+            'WHERE %(file)s IS NULL OR EXISTS ('
+            'SELECT 1 FROM file WHERE id = %(file)s AND owner_id = %(sender)s AND is_uploaded) '
+            'RETURNING id, file_id'
+            '), inbox AS ('
+            'INSERT INTO chat_inbox (user_id, room_id, chat_with_id, last_message_id, last_sender_id, last_file_id, '
+            'preview, last_activity_at, unread_count, created_at, updated_at) '
+            'SELECT rows.user_id, %(room)s, rows.chat_with_id, message.id, %(sender)s, message.file_id, %(preview)s, '
+            '%(now)s, rows.unread, %(now)s, %(now)s '
+            'FROM message, (VALUES (%(first)s, %(second)s, %(first_unread)s), '
+            '(%(second)s, %(first)s, %(second_unread)s)) AS rows (user_id, chat_with_id, unread) '
+            'ON CONFLICT (user_id, room_id) DO UPDATE SET '
+            'unread_count = chat_inbox.unread_count + EXCLUDED.unread_count, updated_at = EXCLUDED.updated_at, '
+            + ', '.join(f'{column} = CASE WHEN {newer} THEN EXCLUDED.{column} ELSE chat_inbox.{column} END'
+                        for column in INBOX_MESSAGE_COLUMNS) +
+            ') '
+            'SELECT message.id, file.path FROM message LEFT JOIN file ON file.id = message.file_id',
+            params
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return {'id': row[0], 'created_at': created_at, 'file_path': row[1]}
+
+
+def messages_after(room_id, message_id: int, limit: int) -> list[dict] | None:
+    """
+    Messages of the room newer than message_id, oldest first, at most `limit`; the range starts at created_at
+    of message_id, so only the newest partitions and the end of the room's (room, created_at, id) index are read
+    return: [{'id', 'content', 'file__path', 'sender_id', 'created_at'}], None when message_id is not in the room
+    """
+    seen_at = Message.objects.filter(room_id=room_id, pk=message_id).values_list('created_at', flat=True).first()
+    if seen_at is None:
+        return None
+    return list(
+        Message.objects
+        .filter(room_id=room_id, created_at__gte=seen_at - CLOCK_SKEW, pk__gt=message_id)
+        .order_by('created_at', 'id')
+        .values('id', 'content', 'file__path', 'sender_id', 'created_at')[:limit]
+    )
+
+
+def replay_messages(last_seen: dict, limit: int) -> dict:
+    """
+    messages_after for {room_id: message_id} in one call
+    """
+    return {room_id: messages_after(room_id, message_id, limit) for room_id, message_id in last_seen.items()}
+
+
+def refresh_unread(room_id, user_id: int):
+    """
+    Count unread messages of the inbox row again after the read cursor moved;
+    the row is locked first, so the count sees messages committed while waiting for it.
+    As in messages_after, the count starts at created_at of the cursor message, so only the newest partitions
+    are read
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM chat_inbox WHERE room_id = %s AND user_id = %s FOR UPDATE',
+                       [room_id, user_id])
+        last_read_id = ChatReadCursor.objects.filter(room_id=room_id, user_id=user_id).values_list(
+            'last_read_message_id', flat=True
+        ).first() or 0
+        seen_at = Message.objects.filter(room_id=room_id, pk=last_read_id).values_list(
+            'created_at', flat=True
+        ).first() if last_read_id else None
+        since, params = '', [room_id, user_id, last_read_id]
+        if seen_at is not None:
+            since = ' AND m.created_at >= %s'
+            params.append(seen_at - CLOCK_SKEW)
+        cursor.execute(
+            'UPDATE chat_inbox SET unread_count = ('
+            f'SELECT COUNT(*) FROM chat_message m WHERE m.room_id = %s AND m.sender_id <> %s AND m.id > %s{since}'
+            '), updated_at = NOW() WHERE room_id = %s AND user_id = %s',
+            [*params, room_id, user_id]
+        )
@@ -1,3 +1,340 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from channels.exceptions import ChannelFull
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.authentication.models import BlockedUser, User
+from apps.chat.consumers import BaseChatConsumer, CLOSE_SLOW_CONSUMER, UserChatConsumer
+from apps.chat.partitions import ensure_partitions, month_start, MONTHS_AHEAD, partitions
+from apps.chat.policy import ChatPolicyDenied, check_message, invalidate_chat_access
+from apps.integrations.fake_servers.redis import FakeRedisServer
+from config.core.channel_layer import ShardedRedisChannelLayer, group_send_sync
+from config.core.metrics import metrics
+
+
+class ShardedRedisChannelLayerTests(SimpleTestCase):
+    """
+    ShardedRedisChannelLayer against two in-process fake Redis shards
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servers = [FakeRedisServer().start() for _ in range(2)]
+        cls.hosts = [server.base_url for server in cls.servers]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        for server in self.servers:
+            with server._changed:
+                server.cmd_flushdb()
+
+    def layer(self, **options) -> ShardedRedisChannelLayer:
+        return ShardedRedisChannelLayer(hosts=self.hosts, **options)
+
+    def run_layers(self, test, *layers):
+        async def run():
+            try:
+                await test(*layers)
+            finally:
+                await asyncio.gather(*(layer.close() for layer in layers))
+
+        asyncio.run(run())
+
+    async def receive(self, layer, channel, timeout=3.0):
+        return await asyncio.wait_for(layer.receive(channel), timeout)
+
+    def test_group_send_reaches_every_process(self):
+        async def test(first, second):
+            channels = [await first.new_channel(), await first.new_channel(), await second.new_channel()]
+            for channel, layer in zip(channels, (first, first, second)):
+                await layer.group_add('chat', channel)
+            await first.group_send('chat', {'type': 'chat.message', 'text': 'hello'})
+            for channel, layer in zip(channels, (first, first, second)):
+                self.assertEqual(await self.receive(layer, channel), {'type': 'chat.message', 'text': 'hello'})
+
+        self.run_layers(test, self.layer(), self.layer())
+
+    def test_group_discard(self):
+        async def test(layer):
+            stays, leaves = await layer.new_channel(), await layer.new_channel()
+            await layer.group_add('chat', stays)
+            await layer.group_add('chat', leaves)
+            await layer.group_discard('chat', leaves)
+            await layer.group_send('chat', {'type': 'chat.message'})
+            self.assertEqual(await self.receive(layer, stays), {'type': 'chat.message'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.receive(layer, leaves, timeout=0.5)
+
+            # The last socket of the process leaves, so does the process in Redis
+            await layer.group_discard('chat', stays)
+            self.assertEqual(self.servers[layer.shard('chat')].cmd_zcard(layer.group_key('chat').encode()), 0)
+
+        self.run_layers(test, self.layer())
+
+    def test_send_to_channel_of_another_process(self):
+        async def test(sender, receiver):
+            channel = await receiver.new_channel()
+            await sender.send(channel, {'type': 'chat.message', 'id': 1})
+            self.assertEqual(await self.receive(receiver, channel), {'type': 'chat.message', 'id': 1})
+
+        self.run_layers(test, self.layer(), self.layer())
+
+    def test_expired_messages_are_dropped(self):
+        async def test(layer):
+            stale, fresh = await layer.new_channel(), await layer.new_channel()
+            await layer.send(stale, {'type': 'chat.message', 'id': 1})
+            await asyncio.sleep(1.1)
+            await layer.send(fresh, {'type': 'chat.message', 'id': 2})
+            self.assertEqual(await self.receive(layer, fresh), {'type': 'chat.message', 'id': 2})
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.receive(layer, stale, timeout=0.5)
+
+        self.run_layers(test, self.layer(expiry=1))
+
+    def test_full_inbox_raises_channel_full(self):
+        # Capacity of inboxes is checked by the sending process
+        async def test(sender, receiver):
+            channel = await receiver.new_channel()
+            await sender.send(channel, {'type': 'chat.message', 'id': 1})
+            await sender.send(channel, {'type': 'chat.message', 'id': 2})
+            with self.assertRaises(ChannelFull):
+                await sender.send(channel, {'type': 'chat.message', 'id': 3})
+
+        self.run_layers(test, self.layer(inbox_capacity=2), self.layer())
+
+    def test_full_channel_drops_group_messages(self):
+        async def test(layer):
+            channel = await layer.new_channel()
+            await layer.group_add('chat', channel)
+            for index in range(3):
+                await layer.group_send('chat', {'type': 'chat.message', 'id': index})
+            self.assertEqual(await self.receive(layer, channel), {'type': 'chat.message', 'id': 0})
+            # The reader has taken the whole inbox at once, the rest did not fit the channel
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.receive(layer, channel, timeout=0.5)
+
+        self.run_layers(test, self.layer(capacity=1))
+
+    def test_flush_removes_keys_of_the_prefix_only(self):
+        async def test(layer):
+            for index in range(25):
+                await layer.group_add(f'chat{index}', f'specific.other!{index}')
+            other = self.servers[0]
+            with other._changed:
+                other.cmd_rpush(b'other:key', b'value')
+            await layer.flush()
+            self.assertEqual([list(server.data) for server in self.servers], [[b'other:key'], []])
+
+        self.run_layers(test, self.layer())
+
+    def test_group_send_sync_closes_its_clients(self):
+        layer = self.layer()
+        asyncio.run(self._join(layer, 'chat', 'specific.other!socket'))
+        with mock.patch('config.core.channel_layer.get_channel_layer', return_value=layer):
+            group_send_sync('chat', {'type': 'payment.state'})
+        self.assertEqual(len(layer._clients), 0)
+        inbox = self.servers[layer.shard('other')].cmd_llen(layer.inbox_key('other').encode())
+        self.assertEqual(inbox, 1)
+
+    @staticmethod
+    async def _join(layer, group, channel):
+        await layer.group_add(group, channel)
+        await layer.close()
+
+
+class FloodConsumer(BaseChatConsumer):
+    """
+    Answers {"flood": n} with n frames of FRAME_SIZE bytes
+    """
+    FRAME_SIZE = 16 * 1024
+
+    async def connect(self):
+        await super().connect()
+        await self.accept()
+
+    async def receive_frame(self, text_data_json: dict):
+        padding = 'x' * self.FRAME_SIZE
+        for index in range(text_data_json['flood']):
+            await self.send(text_data=json.dumps({'event': 'flood', 'index': index, 'padding': padding}))
+
+
+class BlockingSend:
+    """
+    ASGI send of a server that waits for the client, as Daphne does not: frames wait for `reading`
+    """
+
+    def __init__(self):
+        self.reading = asyncio.Event()
+        self.frames = []
+        self.close_code = None
+        self.closed = asyncio.Event()
+
+    async def __call__(self, message):
+        if message['type'] == 'websocket.send':
+            await self.reading.wait()
+            self.frames.append(json.loads(message['text']))
+        elif message['type'] == 'websocket.close':
+            self.close_code = message['code']
+            self.closed.set()
+
+
+class SlowConsumerTests(SimpleTestCase):
+    """
+    Outbox of BaseChatConsumer in front of a send that waits for the client
+    """
+    FRAMES = 50
+
+    def slow_consumers(self, reason: str) -> int:
+        return metrics.counters.get(f'chat.slow_consumers{{reason={reason}}}', 0)
+
+    def flood(self, send: BlockingSend, frames: int, wait_for):
+        async def run():
+            receive = asyncio.Queue()
+            for message in ({'type': 'websocket.connect'},
+                            {'type': 'websocket.receive', 'text': json.dumps({'flood': frames})}):
+                receive.put_nowait(message)
+            scope = {'type': 'websocket', 'path': '/flood/', 'headers': [], 'user': AnonymousUser()}
+            consumer = asyncio.create_task(FloodConsumer.as_asgi()(scope, receive.get, send))
+            try:
+                await asyncio.wait_for(wait_for(), timeout=10)
+            finally:
+                receive.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+                await asyncio.wait_for(consumer, timeout=10)
+
+        asyncio.run(run())
+
+    @override_settings(CHAT_SOCKET={**settings.CHAT_SOCKET, 'OUTBOX_SIZE': 1000, 'SEND_TIMEOUT': 0.5})
+    def test_client_that_does_not_read_is_closed(self):
+        dropped, send = self.slow_consumers('send_timeout'), BlockingSend()
+        self.flood(send, self.FRAMES, send.closed.wait)
+
+        self.assertEqual(send.close_code, CLOSE_SLOW_CONSUMER)
+        self.assertEqual(send.frames, [])
+        self.assertEqual(self.slow_consumers('send_timeout'), dropped + 1)
+
+    @override_settings(CHAT_SOCKET={**settings.CHAT_SOCKET, 'OUTBOX_SIZE': 10, 'SEND_TIMEOUT': 10.0})
+    def test_full_outbox_closes_the_socket(self):
+        dropped, send = self.slow_consumers('overflow'), BlockingSend()
+        self.flood(send, self.FRAMES, send.closed.wait)
+
+        self.assertEqual(send.close_code, CLOSE_SLOW_CONSUMER)
+        self.assertEqual(self.slow_consumers('overflow'), dropped + 1)
+
+    @override_settings(CHAT_SOCKET={**settings.CHAT_SOCKET, 'OUTBOX_SIZE': 1000, 'SEND_TIMEOUT': 0.5})
+    def test_client_that_reads_gets_every_frame(self):
+        dropped, send = self.slow_consumers('send_timeout'), BlockingSend()
+        send.reading.set()
+
+        async def delivered():
+            while len(send.frames) < self.FRAMES:
+                await asyncio.sleep(0.01)
+
+        self.flood(send, self.FRAMES, delivered)
+        self.assertEqual([frame['index'] for frame in send.frames], list(range(self.FRAMES)))
+        self.assertIsNone(send.close_code)
+        self.assertEqual(self.slow_consumers('send_timeout'), dropped)
+
+
+class MalformedFrameTests(SimpleTestCase):
+    """
+    Frames the consumers cannot handle are answered with an error event, the socket stays open
+    """
+
+    def errors(self, consumer, frames: list) -> list:
+        async def run():
+            communicator = WebsocketCommunicator(consumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = User(id=1, username='user')
+            connected, _subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            details = []
+            try:
+                for frame in frames:
+                    if isinstance(frame, bytes):
+                        await communicator.send_to(bytes_data=frame)
+                    else:
+                        await communicator.send_to(text_data=frame)
+                    response = await communicator.receive_json_from(timeout=3)
+                    self.assertEqual(response['event'], 'error')
+                    details.append(response['detail'])
+                # Still served after all of them
+                await communicator.send_json_to({'ping': 1})
+                self.assertEqual(await communicator.receive_json_from(timeout=3), {'event': 'pong'})
+            finally:
+                await communicator.disconnect()
+            return details
+
+        return asyncio.run(run())
+
+    def test_frames_that_are_not_json_objects(self):
+        details = self.errors(UserChatConsumer, [b'\x00binary', 'not json', '[1, 2]', '"text"'])
+        self.assertEqual(details, ['frames must be JSON text', 'frame is not valid JSON',
+                                   'frame must be a JSON object', 'frame must be a JSON object'])
+
+    def test_room_must_be_a_room_id(self):
+        frames = [json.dumps({'room': room, 'message': 'hi'}) for room in ([1], {'id': 1}, '1', True)]
+        self.assertEqual(self.errors(UserChatConsumer, frames), ['room must be a room id'] * 4)
+        self.assertEqual(self.errors(UserChatConsumer, [json.dumps({'room': 1, 'message': 'hi'})]),
+                         ['room is not subscribed'])
+
+    def test_frames_of_consumers_without_handler(self):
+        class AcceptingConsumer(BaseChatConsumer):
+            async def connect(self):
+                await super().connect()
+                await self.accept()
+
+        self.assertEqual(self.errors(AcceptingConsumer, ['{"message": "hi"}']), ['frame is not supported'])
+
+
+class PartitionTests(TestCase):
+
+    def test_partitions_are_created_ahead_once(self):
+        # The migration has partitioned MONTHS_AHEAD months already
+        self.assertEqual(ensure_partitions(), [])
+        created = ensure_partitions(MONTHS_AHEAD + 1)
+        self.assertEqual(created, [f'chat_message_p{month_start(timezone.now(), MONTHS_AHEAD + 1):%Y%m}'])
+        self.assertEqual(ensure_partitions(MONTHS_AHEAD + 1), [])
+        self.assertEqual(partitions()[-1][0], created[0])
+
+
+class ChatPolicyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create(phone_number='998900000001', username='creator', is_creator=True)
+        cls.user = User.objects.create(phone_number='998900000002', username='user')
+
+    def block(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BlockedUser.objects.create(blocker=self.creator, blocked=self.user)
+            invalidate_chat_access([(self.creator.pk, self.user.pk)])
+
+    def test_local_memory_cache_is_not_used(self):
+        check_message(self.user.pk, (self.creator.pk, self.user.pk))
+        # Another process would not see its invalidation, so nothing is cached to be invalidated
+        BlockedUser.objects.create(blocker=self.creator, blocked=self.user)
+        with self.assertRaises(ChatPolicyDenied):
+            check_message(self.user.pk, (self.creator.pk, self.user.pk))
+
+    def test_shared_cache_is_invalidated(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location
+        }}):
+            check_message(self.user.pk, (self.creator.pk, self.user.pk))
+            with self.assertNumQueries(0):
+                check_message(self.user.pk, (self.creator.pk, self.user.pk))
+            self.block()
+            with self.assertRaises(ChatPolicyDenied):
+                check_message(self.user.pk, (self.creator.pk, self.user.pk))
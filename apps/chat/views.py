@@ -1,27 +1,42 @@
+from django.db import transaction
 from django.db.models import Q
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
-from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils.translation import gettext_lazy as _
 
 from apps.authentication.models import User, BlockedUser
-from apps.chat.models import ChatRoom, Message, ChatSettings
+from apps.chat.models import ChatRoom, Message, ChatSettings, ChatInbox
+from apps.chat.policy import invalidate_chat_rules
 from apps.chat.serializers import MessageListSerializer, UserChatRoomListSerializer, ChatSettingsSerializer
+from apps.chat.services import advance_read_cursor, create_inbox, read_cursors, room_participants
 from apps.chat.swagger import chat_settings_swagger
 from config.core.api_exceptions import APIValidation
-from config.core.pagination import APILimitOffsetPagination
+from config.core.pagination import APICursorPagination
+
+
+class ChatInboxPagination(APICursorPagination):
+    ordering = ('-last_activity_at', '-id')
 
 
 class UserChatRoomListAPIView(ListAPIView):
-    queryset = ChatRoom.objects.all()
     serializer_class = UserChatRoomListSerializer
+    pagination_class = ChatInboxPagination
+
+    @swagger_auto_schema(operation_description='Chat rooms of the user with their last message and unread count, '
+                                               'most recently active first. Paginated by cursor, follow `next`')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        return queryset
+        # One scan of chat_inbox_user_activity_idx, users and files joined by primary key
+        return (
+            ChatInbox.objects
+            .filter(user=self.request.user)
+            .select_related('chat_with', 'last_file')
+        )
 
 
 class UserGetChatRoomAPIView(APIView):
@@ -48,7 +63,9 @@ class UserGetChatRoomAPIView(APIView):
         ).first()
 
         if not room:
-            room = ChatRoom.objects.create(creator=writing_to, subscriber=chat_started_user)
+            with transaction.atomic():
+                room = ChatRoom.objects.create(creator=writing_to, subscriber=chat_started_user)
+                create_inbox(room)
         return Response({
             'room_id': room.id,
             'chat_started': chat_started_user.id,
@@ -58,19 +75,43 @@ class UserGetChatRoomAPIView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+class MessageHistoryPagination(APICursorPagination):
+    """
+    Keyset over chat_message_room_created_idx, a page reads only the newest partitions it needs
+    """
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    ordering = ('-created_at', '-id')
+
+
 class LastMessagesAPIView(ListAPIView):
     queryset = Message.objects.all()
     serializer_class = MessageListSerializer
-    pagination_class = APILimitOffsetPagination
-    filter_backends = [OrderingFilter]
-    ordering_fields = ['created_at']
-    ordering = ['-created_at']
+    pagination_class = MessageHistoryPagination
+
+    @swagger_auto_schema(operation_description='Messages of the room, newest first. Paginated by cursor, '
+                                               'follow `next` for older messages')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.filter(room_id=self.kwargs['room_id'])
+        queryset = queryset.filter(room_id=self.kwargs['room_id']).select_related('sender')
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        participants = room_participants(self.kwargs['room_id'])
+        # The page is one read batch: a single cursor update instead of an UPDATE per message
+        received = [message.id for message in page if message.sender_id != request.user.id]
+        if received and request.user.id in participants:
+            advance_read_cursor(self.kwargs['room_id'], request.user.id, max(received))
+        context = self.get_serializer_context()
+        context['read_cursors'] = read_cursors(self.kwargs['room_id'], participants)
+        serializer = self.get_serializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
 
 class GetChatSettingsAPIView(APIView):
     serializer_class = ChatSettingsSerializer
@@ -92,6 +133,10 @@ class ConfigureChatSettingsAPIView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # The posted list replaces settings of the creator, sockets see it with the next message
+        with transaction.atomic():
+            ChatSettings.objects.filter(creator=request.user).delete()
+            serializer.save(creator=request.user)
+            invalidate_chat_rules(request.user.id)
 
         return Response(serializer.data)
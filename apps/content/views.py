@@ -22,7 +22,6 @@ from config.core.api_exceptions import APIValidation
 from config.core.pagination import APILimitOffsetPagination
 from config.core.permissions import IsCreator, IsAdmin, IsAdminAllowGet
 from config.swagger import query_choice_swagger_param, post_type_swagger_param
-from config.services import run_with_thread
 from config.views import BaseModelViewSet
 
 
@@ -233,8 +232,8 @@ class PostToggleLikeAPIView(APIView):
             response = {'detail': _('Вы убрали лайк с этого комментарийа')}
         comment.update_like_count()
         if user != comment.user:
-            run_with_thread(create_activity, ('liked_comment', None,
-                                              like_obj.id if created else None, user, comment.user))
+            create_activity('liked_comment', None, like_obj.id if created else None, user, comment.user,
+                            target_id=comment.id)
         return response
 
     def like_post(self, post_id):
@@ -249,8 +248,8 @@ class PostToggleLikeAPIView(APIView):
             response = {'detail': _('Вы убрали лайк с этого поста')}
         post.update_counts()
         if user != post.user:
-            run_with_thread(create_activity, ('liked_post', None,
-                                              like_obj.id if created else None, user, post.user))
+            create_activity('liked_post', None, like_obj.id if created else None, user, post.user,
+                            target_id=post.id)
         return response
 
     @swagger_auto_schema(request_body=PostToggleLikeSerializer)
@@ -294,7 +293,7 @@ class PostLeaveCommentAPIView(APIView):
         post = self.get_post(post_id)
         comment = Comment.objects.create(user=user, post=post, text=text)
         if user != post.user:
-            run_with_thread(create_activity, ('commented', None, comment.id, user, post.user))
+            create_activity('commented', None, comment.id, user, post.user, target_id=post.id)
         return {'detail': _('Вы оставили комментарий')}
 
     def leave_reply(self, post_id, comment_id, text):
@@ -304,7 +303,7 @@ class PostLeaveCommentAPIView(APIView):
         parent = self.get_comment(comment_id)
         comment = Comment.objects.create(user=user, post=post, parent=parent, text=text)
         if user != post.user:
-            run_with_thread(create_activity, ('replied', None, comment.id, user, post.user))
+            create_activity('replied', None, comment.id, user, post.user, target_id=post.id)
         return {'detail': _('Вы оставили ответ на комментарий')}
 
     @swagger_auto_schema(request_body=PostLeaveCommentSerializer)
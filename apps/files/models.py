@@ -10,6 +10,13 @@ class File(BaseModel):
     path = models.TextField(null=True)
     content_type = models.CharField(max_length=100, null=True)
     extension = models.CharField(max_length=30, null=True)
+    owner = models.ForeignKey('authentication.User', on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='+')
+    # False until the client uploads a presigned file to the storage, see presigned_upload
+    is_uploaded = models.BooleanField(default=True)
 
     class Meta:
         db_table = "file"
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_uploaded=False), name='file_pending_upload_idx'),
+        ]
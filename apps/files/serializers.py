@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from apps.files.models import File
@@ -11,3 +13,14 @@ class FileSerializer(serializers.ModelSerializer):
             'size',
             'path',
         ]
+
+
+class FileUploadURLSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=300)
+    size = serializers.IntegerField(min_value=1)
+    content_type = serializers.CharField(max_length=100)
+
+    def validate_size(self, size):
+        if size > settings.FILE_MAX_SIZE:
+            raise serializers.ValidationError(_('Размер файла превысил 20 МБ!'))
+        return size
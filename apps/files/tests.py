@@ -1,3 +1,77 @@
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from django.conf import settings
 from django.test import TestCase
+from django.utils.timezone import now, timedelta
+
+from apps.authentication.models import User
+from apps.files.models import File
+from apps.files.utils import complete_upload, delete_abandoned_uploads, presigned_upload
+from config.core.api_exceptions import APIValidation
+
+
+def client_error(status_code: int) -> ClientError:
+    return ClientError({'Error': {'Code': str(status_code)}, 'ResponseMetadata': {'HTTPStatusCode': status_code}},
+                       'HeadObject')
+
+
+@mock.patch('apps.files.utils.s3_client')
+class PresignedUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(phone_number='998900000001', username='owner')
+
+    def reserve(self, size: int = 1024) -> File:
+        with mock.patch('apps.files.utils.s3_public_client') as s3_public_client:
+            s3_public_client.generate_presigned_post.return_value = {'url': 'http://storage', 'fields': {}}
+            file, _upload = presigned_upload('photo.jpg', 'image/jpeg', size, self.owner)
+        self.conditions = s3_public_client.generate_presigned_post.call_args.kwargs['Conditions']
+        return file
+
+    def test_policy_accepts_declared_size_only(self, s3_client):
+        self.reserve(size=1024)
+        self.assertIn(['content-length-range', 1024, 1024], self.conditions)
+
+    def test_upload_of_declared_size_completes(self, s3_client):
+        file = self.reserve(size=1024)
+        s3_client.head_object.return_value = {'ContentLength': 1024}
+        complete_upload(file)
+
+        file.refresh_from_db()
+        self.assertEqual((file.is_uploaded, file.size), (True, 1024))
+
+    def test_upload_of_other_size_is_rejected(self, s3_client):
+        file = self.reserve(size=1024)
+        s3_client.head_object.return_value = {'ContentLength': 4096}
+        with self.assertRaises(APIValidation):
+            complete_upload(file)
+
+        s3_client.delete_object.assert_called_once()
+        file.refresh_from_db()
+        self.assertFalse(file.is_uploaded)
+
+    def test_missing_object_is_bad_request(self, s3_client):
+        file = self.reserve()
+        s3_client.head_object.side_effect = client_error(404)
+        with self.assertRaises(APIValidation) as raised:
+            complete_upload(file)
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_storage_errors_are_not_bad_request(self, s3_client):
+        file = self.reserve()
+        s3_client.head_object.side_effect = client_error(403)
+        with self.assertRaises(ClientError):
+            complete_upload(file)
+
+    def test_abandoned_uploads_are_deleted(self, s3_client):
+        abandoned, pending, uploaded = self.reserve(), self.reserve(), self.reserve()
+        created_at = now() - timedelta(seconds=settings.FILE_UPLOAD_URL_TTL) - timedelta(hours=2)
+        File.objects.filter(pk__in=[abandoned.pk, uploaded.pk]).update(created_at=created_at)
+        File.objects.filter(pk=uploaded.pk).update(is_uploaded=True)
 
-# Create your tests here.
+        self.assertEqual(delete_abandoned_uploads(), 1)
+        keys = s3_client.delete_objects.call_args.kwargs['Delete']['Objects']
+        self.assertEqual(keys, [{'Key': f'uploads/{abandoned.gen_name}'}])
+        self.assertEqual(set(File.objects.values_list('pk', flat=True)), {pending.pk, uploaded.pk})
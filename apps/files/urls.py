@@ -1,9 +1,11 @@
 from django.urls import path
 
-from apps.files.views import FileCreateAPIView, FileDeleteAPIView
+from apps.files.views import FileCreateAPIView, FileDeleteAPIView, FileUploadURLAPIView, FileUploadCompleteAPIView
 
 app_name = 'files'
 urlpatterns = [
     path('create/', FileCreateAPIView.as_view(), name='file_create'),
     path('delete/<int:pk>/', FileDeleteAPIView.as_view(), name='file_delete'),
+    path('upload-url/', FileUploadURLAPIView.as_view(), name='file_upload_url'),
+    path('<int:pk>/complete/', FileUploadCompleteAPIView.as_view(), name='file_upload_complete'),
 ]
@@ -1,8 +1,11 @@
 import logging
 import mimetypes
 
+from botocore.exceptions import ClientError
 from django.conf import settings
 from django.db import transaction
+from django.utils.timezone import now, timedelta
+from django.utils.translation import gettext_lazy as _
 from rest_framework import status
 
 from apps.files.models import File
@@ -15,7 +18,7 @@ from dotenv import load_dotenv
 import uuid
 import time
 
-from config.core.minio import s3_client
+from config.core.minio import s3_client, s3_public_client
 
 load_dotenv()
 logger = logging.getLogger()
@@ -45,7 +48,7 @@ def gen_hash_name(filename) -> str:
     return "%s.%s" % (unique_code(), get_extension(filename=filename))
 
 
-def upload_file(file):
+def upload_file(file, owner=None):
     try:
         with transaction.atomic():
             name = file.name
@@ -72,7 +75,8 @@ def upload_file(file):
                                  gen_name=gen_name,
                                  path=path,
                                  content_type=content_type,
-                                 extension=extension)
+                                 extension=extension,
+                                 owner=owner)
             # with open(join_path(upload_path(), gen_name.replace(sep, '/')), 'wb+') as destination:
             #     for chunk in file.chunks():
             #         destination.write(chunk)
@@ -87,3 +91,72 @@ def delete_file(file: File):
     # file = s3_client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=f'uploads/{file.gen_name}')
     # print(file)
     return s3_client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=f'uploads/{file.gen_name}')
+
+
+def presigned_upload(name: str, content_type: str, size: int, owner) -> tuple[File, dict]:
+    """
+    Reserve a File and sign a POST the client uploads it with straight to the storage, the storage accepts
+    an object of the declared size only; the file is attachable after complete_upload
+    return: (file, {'url': ..., 'fields': {...}})
+    """
+    gen_name = gen_hash_name(name)
+    file = File.objects.create(name=name,
+                               size=size,
+                               gen_name=gen_name,
+                               path=media_path(gen_name),
+                               content_type=content_type,
+                               extension=get_extension(filename=name),
+                               owner=owner,
+                               is_uploaded=False)
+    upload = s3_public_client.generate_presigned_post(
+        settings.AWS_STORAGE_BUCKET_NAME,
+        upload_path(gen_name),
+        Fields={'Content-Type': content_type},
+        Conditions=[{'Content-Type': content_type}, ['content-length-range', size, size]],
+        ExpiresIn=settings.FILE_UPLOAD_URL_TTL,
+    )
+    return file, upload
+
+
+def complete_upload(file: File) -> File:
+    """
+    Mark presigned file uploaded once the storage has an object of the declared size
+    """
+    if file.is_uploaded:
+        return file
+    try:
+        head = s3_client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload_path(file.gen_name))
+    except ClientError as exc:
+        if exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode') != 404:
+            raise
+        raise APIValidation(detail=_('Файл не был загружен'), status_code=status.HTTP_400_BAD_REQUEST)
+    if head['ContentLength'] != int(file.size):
+        delete_file(file)
+        raise APIValidation(detail=_('Размер файла не совпадает с заявленным'),
+                            status_code=status.HTTP_400_BAD_REQUEST)
+    file.is_uploaded = True
+    file.save(update_fields=['is_uploaded', 'updated_at'])
+    return file
+
+
+def delete_abandoned_uploads(limit: int = 1000) -> int:
+    """
+    Delete presigned files never completed within an hour after their upload URL expired, with their objects
+    if the client uploaded one
+    return: number of deleted files
+    """
+    expired_at = now() - timedelta(seconds=settings.FILE_UPLOAD_URL_TTL) - timedelta(hours=1)
+    files = list(
+        File.objects
+        .filter(is_uploaded=False, created_at__lt=expired_at)
+        .order_by('id')
+        .values_list('id', 'gen_name')[:limit]
+    )
+    if not files:
+        return 0
+    # Up to 1000 keys per request, missing objects are not an error
+    s3_client.delete_objects(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Delete={
+        'Objects': [{'Key': upload_path(gen_name)} for _pk, gen_name in files], 'Quiet': True
+    })
+    File.objects.filter(pk__in=[pk for pk, _gen_name in files], is_uploaded=False).delete()
+    return len(files)
@@ -1,6 +1,7 @@
 import logging
 # from os import remove as delete_file
 
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.http import Http404
 from drf_yasg import openapi
@@ -12,7 +13,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from apps.files.models import File
-from apps.files.utils import upload_file, delete_file
+from apps.files.serializers import FileUploadURLSerializer
+from apps.files.utils import upload_file, delete_file, presigned_upload, complete_upload
 from config.core.api_exceptions import APIValidation
 
 logger = logging.getLogger()
@@ -38,10 +40,10 @@ class FileCreateAPIView(APIView):
         if not file:
             raise APIValidation(detail=_('Файл не был отправлен'), code=status.HTTP_400_BAD_REQUEST)
 
-        if file.size > 20_971_520:
+        if file.size > settings.FILE_MAX_SIZE:
             raise APIValidation(detail=_('Размер файла превысил 20 МБ!'), code=status.HTTP_400_BAD_REQUEST)
 
-        e_file = upload_file(file=file)
+        e_file = upload_file(file=file, owner=request.user if request.user.is_authenticated else None)
         return Response({
             'message': _('Файл успешно загружен'),
             'file': e_file.id,
@@ -50,6 +52,48 @@ class FileCreateAPIView(APIView):
         }, status=status.HTTP_201_CREATED)
 
 
+class FileUploadURLAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description='Reserve a file and get a presigned POST to upload it straight to the storage: '
+                              'send `fields` and then `file` as multipart/form-data to `url`, '
+                              'then call files/<file>/complete/. Use it for chat attachments',
+        request_body=FileUploadURLSerializer(),
+        responses={201: openapi.Response(description='Presigned upload', examples={'application/json': {
+            'file': 1, 'path': 'media/uploads/...', 'url': 'https://...', 'fields': {'key': 'uploads/...'}
+        }})}
+    )
+    def post(self, request):
+        serializer = FileUploadURLSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file, upload = presigned_upload(name=serializer.validated_data['name'],
+                                        content_type=serializer.validated_data['content_type'],
+                                        size=serializer.validated_data['size'],
+                                        owner=request.user)
+        return Response({
+            'file': file.id,
+            'path': file.path,
+            'url': upload['url'],
+            'fields': upload['fields'],
+        }, status=status.HTTP_201_CREATED)
+
+
+class FileUploadCompleteAPIView(APIView):
+
+    def post(self, request, pk):
+        file = File.objects.filter(pk=pk, owner=request.user).first()
+        if file is None:
+            raise Http404
+        complete_upload(file)
+        return Response({
+            'message': _('Файл успешно загружен'),
+            'file': file.id,
+            'path': file.path,
+            'size': file.size,
+            'status': status.HTTP_200_OK
+        }, status=status.HTTP_200_OK)
+
+
 class FileDeleteAPIView(APIView):
     permission_classes = [AllowAny, ]
 
@@ -1,6 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+
+from django.conf import settings
 from fcm_django.models import FCMDevice
 from firebase_admin.messaging import Message, Notification
 
+from config.core.request import HTTPClient, UpstreamUnavailable
+from config.core.token_cache import CachedToken
+
+# FCM errors after which the token will never be delivered to, its device is deactivated; INVALID_ARGUMENT is
+# left out, FCM also answers it for a bad payload (too long title), which says nothing about the token
+INVALID_TOKEN_ERRORS = frozenset({'UNREGISTERED', 'SENDER_ID_MISMATCH'})
+# Not sent: breaker of FCM is open or the request timed out
+UNAVAILABLE_ERROR = 'UNAVAILABLE'
+
 
 def send_notification_to_user(user, title, body):
     devices = FCMDevice.objects.filter(user=user)
@@ -17,3 +30,67 @@ def register_device(user, registration_id, device_type='android'):
     if not created:
         device.user = user
         device.save()
+
+
+class FCMRequestHandler(HTTPClient):
+    """
+    FCM HTTP v1 sender over the shared keep-alive session; v1 API has no multicast endpoint,
+    so a multicast is one request per token sent concurrently, as firebase_admin.send_each_for_multicast does
+    """
+    service = 'fcm'
+
+    def __init__(self, base_url, app, concurrency: int = 50):
+        self.base_url = base_url
+        self.app = app
+        self.concurrency = concurrency
+        self.cached_token = CachedToken(fetch=self._fetch_token)
+
+    def _fetch_token(self):
+        token = self.app.credential.get_access_token()
+        return token.access_token, token.expiry.replace(tzinfo=timezone.utc).timestamp()
+
+    @staticmethod
+    def error_code(response: dict) -> str:
+        error = response.get('error') or {}
+        for detail in error.get('details') or []:
+            if detail.get('errorCode'):
+                return detail['errorCode']
+        return error.get('status') or 'UNKNOWN'
+
+    def send(self, token: str, title: str, body: str) -> str | None:
+        """
+        return: None when delivered, FCM error code otherwise (UNAVAILABLE_ERROR when FCM could not be reached,
+        so one token does not abort the rest of a multicast)
+        """
+        payload = {'message': {'token': token, 'notification': {'title': title, 'body': body}}}
+        url = f'{self.base_url}/v1/projects/{self.app.project_id}/messages:send'
+        access_token = self.cached_token.get()
+        try:
+            response = self._request('POST', url, json=payload, headers={'Authorization': f'Bearer {access_token}'})
+            if response.status_code == 401:
+                self.cached_token.invalidate(stale_token=access_token)
+                response = self._request('POST', url, json=payload,
+                                         headers={'Authorization': f'Bearer {self.cached_token.get()}'})
+        except UpstreamUnavailable:
+            return UNAVAILABLE_ERROR
+        if response.ok:
+            return None
+        try:
+            return self.error_code(response.json())
+        except ValueError:
+            return f'HTTP_{response.status_code}'
+
+    def send_multicast(self, tokens: list[str], title: str, body: str) -> list[str | None]:
+        """
+        return: error code of every token in the same order, None for delivered ones
+        """
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(tokens) or 1),
+                                thread_name_prefix='fcm') as executor:
+            return list(executor.map(lambda token: self.send(token, title, body), tokens))
+
+
+fcm_app = FCMRequestHandler(
+    base_url=settings.FCM_INTEGRATION_SETTINGS['BASE_URL'],
+    app=settings.FIREBASE_APP,
+    concurrency=settings.FCM_INTEGRATION_SETTINGS['CONCURRENCY'],
+)
@@ -1,77 +1,121 @@
+from channels.db import database_sync_to_async
 from django.conf import settings
-from django.utils.timezone import now
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now, is_naive, make_aware, timedelta
 from django.utils.translation import gettext_lazy as _
 
 from apps.integrations.models import MultibankAuthToken
 from config.core.api_exceptions import APIValidation
+from config.core.async_request import AsyncHTTPClient
 from config.core.request import HTTPClient
+from config.core.token_cache import AsyncCachedToken, CachedToken
+
+# Token is refreshed this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+# pg_advisory_xact_lock key serializing token writes across processes
+TOKEN_LOCK_KEY = 7_100_001
+# Lifetime of a token whose response has no expiry
+TOKEN_DEFAULT_TTL = timedelta(hours=1)
+
+
+def valid_auth_token() -> MultibankAuthToken | None:
+    return MultibankAuthToken.objects.filter(
+        expires_at__gt=now() + timedelta(seconds=TOKEN_REFRESH_MARGIN)
+    ).order_by('-expires_at').first()
+
+
+def store_auth_token(token_response: dict) -> MultibankAuthToken:
+    """
+    Save fresh token and drop the others under an advisory lock, so processes refreshing at the same time
+    do not delete each other's rows
+    """
+    expiry = token_response.get('expiry')
+    expires_at = parse_datetime(str(expiry)) if expiry else None
+    if expires_at is None:
+        expires_at = now() + TOKEN_DEFAULT_TTL
+    elif is_naive(expires_at):
+        expires_at = make_aware(expires_at)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [TOKEN_LOCK_KEY])
+        token_instance = MultibankAuthToken.objects.create(token=token_response.get('token'), expires_at=expires_at)
+        MultibankAuthToken.objects.exclude(pk=token_instance.pk).delete()
+    return token_instance
+
+
+def drop_auth_token(token: str):
+    MultibankAuthToken.objects.filter(token=token).delete()
 
 
 class MultibankRequestHandler(HTTPClient):
+    """
+    Bearer token lives in process memory (no queries on the fast path) and in MultibankAuthToken,
+    which is shared between processes; it is refreshed TOKEN_REFRESH_MARGIN seconds before expiry
+    and concurrent callers wait for a single refresh
+    """
+    service = 'multibank'
+
     def __init__(self, base_url, application_id, secret):
         self.base_url = base_url
         self.application_id = application_id
         self.secret = secret
+        self.cached_token = CachedToken(fetch=self._fetch_token, refresh_margin=TOKEN_REFRESH_MARGIN)
 
-    def auth(self, method: str = 'POST', endpoint: str = 'auth'):
-        payload = {
-            'application_id': self.application_id,
-            'secret': self.secret
-        }
-        token = MultibankAuthToken.objects.filter(expires_at__gt=now())
-        if token.exists():
-            token = token.first().token
-        else:
+    def _fetch_token(self, method: str = 'POST', endpoint: str = 'auth'):
+        token_instance = valid_auth_token()
+        if token_instance is None:
+            payload = {
+                'application_id': self.application_id,
+                'secret': self.secret
+            }
             token_response, status_code = self.make_request(method=method, endpoint=endpoint, json=payload)
-            if str(status_code).startswith('2'):
-                MultibankAuthToken.objects.all().delete()
-                token_instance = MultibankAuthToken.objects.create(token=token_response.get('token'),
-                                                                   expires_at=token_response.get('expiry'))
-                token = token_instance.token
-            else:
+            if not str(status_code).startswith('2'):
                 raise APIValidation(_(f'Ошибка в получении ответа от Multibank: {token_response}'),
                                     status_code=status_code)
-        return token
+            token_instance = store_auth_token(token_response)
+        return token_instance.token, token_instance.expires_at.timestamp()
+
+    def auth(self):
+        return self.cached_token.get()
+
+    def authorized_request(self, method: str, endpoint: str, **kwargs):
+        """
+        Request with cached bearer token, on 401 token is dropped everywhere and request is repeated once
+        """
+        token = self.auth()
+        response = self.make_request(method=method, endpoint=endpoint, headers={'Authorization': f'Bearer {token}'},
+                                     **kwargs)
+        if response[1] == 401:
+            drop_auth_token(token)
+            self.cached_token.invalidate(stale_token=token)
+            response = self.make_request(method=method, endpoint=endpoint,
+                                         headers={'Authorization': f'Bearer {self.auth()}'}, **kwargs)
+        return response
 
     def bind_card(self, data: dict, method: str = 'POST', endpoint: str = 'payment/card/bind'):
-        headers = {
-            'Authorization': f'Bearer {self.auth()}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers, json=data)
+        return self.authorized_request(method, endpoint, json=data)
 
     def remove_card(self, card_token, method: str = 'DELETE'):
-        endpoint: str = f'payment/card/{card_token}'
-        headers = {'Authorization': f'Bearer {self.auth()}'}
-        return self.make_request(method=method, endpoint=endpoint, headers=headers)
+        return self.authorized_request(method, f'payment/card/{card_token}')
 
     def create_payment(self, data: dict, method: str = 'POST', endpoint: str = 'payment'):
-        headers = {
-            'Authorization': f'Bearer {self.auth()}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers, json=data)
+        return self.authorized_request(method, endpoint, json=data)
 
     def confirm_payment(self, transaction_id, data: dict = None, method: str = 'PUT'):
         endpoint: str = f'payment/{transaction_id}'
-        headers = {
-            'Authorization': f'Bearer {self.auth()}'
-        }
         if data:
-            return self.make_request(method=method, endpoint=endpoint, headers=headers, json=data)
-        return self.make_request(method=method, endpoint=endpoint, headers=headers)
+            return self.authorized_request(method, endpoint, json=data)
+        return self.authorized_request(method, endpoint)
+
+    def payment_information(self, transaction_id, method: str = 'GET'):
+        return self.authorized_request(method, f'payment/{transaction_id}')
 
     def check_account(self, phone, method: str = 'GET', endpoint: str = 'mobile/user/check_account'):
-        params = {'phone': phone}
-        headers = {
-            'Authorization': f'Bearer {self.auth()}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers, params=params)
+        return self.authorized_request(method, endpoint, params={'phone': phone})
 
     def get_receipient(self, merchant_id, data: dict, method: str = 'POST'):
-        endpoint: str = f'payment/merchant/{merchant_id}/account'
-        headers = {
-            'Authorization': f'Bearer {self.auth()}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers, json=data)
+        return self.authorized_request(method, f'payment/merchant/{merchant_id}/account', json=data)
 
     def make_request(self, method: str, endpoint: str, **kwargs):
         response = self._request(method, f"{self.base_url}/{endpoint}", **kwargs)
@@ -81,8 +125,87 @@ class MultibankRequestHandler(HTTPClient):
             return {"detail": f"Error occurred: {response.text}"}, 400
 
 
+class AsyncMultibankRequestHandler(AsyncHTTPClient):
+    """
+    Same surface as MultibankRequestHandler, every method is a coroutine;
+    token is shared with sync handler through MultibankAuthToken and cached in process between calls
+    """
+    service = 'multibank'
+
+    def __init__(self, base_url, application_id, secret):
+        self.base_url = base_url
+        self.application_id = application_id
+        self.secret = secret
+        self.cached_token = AsyncCachedToken(fetch=self._fetch_token, refresh_margin=TOKEN_REFRESH_MARGIN)
+
+    async def _fetch_token(self, method: str = 'POST', endpoint: str = 'auth'):
+        token_instance = await database_sync_to_async(valid_auth_token)()
+        if token_instance is None:
+            payload = {
+                'application_id': self.application_id,
+                'secret': self.secret
+            }
+            token_response, status_code = await self.make_request(method=method, endpoint=endpoint, json=payload)
+            if not str(status_code).startswith('2'):
+                raise APIValidation(_(f'Ошибка в получении ответа от Multibank: {token_response}'),
+                                    status_code=status_code)
+            token_instance = await database_sync_to_async(store_auth_token)(token_response)
+        return token_instance.token, token_instance.expires_at.timestamp()
+
+    async def auth(self):
+        return await self.cached_token.aget()
+
+    async def authorized_request(self, method: str, endpoint: str, **kwargs):
+        token = await self.auth()
+        response = await self.make_request(method=method, endpoint=endpoint,
+                                           headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        if response[1] == 401:
+            await database_sync_to_async(drop_auth_token)(token)
+            self.cached_token.invalidate(stale_token=token)
+            response = await self.make_request(method=method, endpoint=endpoint,
+                                               headers={'Authorization': f'Bearer {await self.auth()}'}, **kwargs)
+        return response
+
+    async def bind_card(self, data: dict, method: str = 'POST', endpoint: str = 'payment/card/bind'):
+        return await self.authorized_request(method, endpoint, json=data)
+
+    async def remove_card(self, card_token, method: str = 'DELETE'):
+        return await self.authorized_request(method, f'payment/card/{card_token}')
+
+    async def create_payment(self, data: dict, method: str = 'POST', endpoint: str = 'payment'):
+        return await self.authorized_request(method, endpoint, json=data)
+
+    async def confirm_payment(self, transaction_id, data: dict = None, method: str = 'PUT'):
+        endpoint: str = f'payment/{transaction_id}'
+        if data:
+            return await self.authorized_request(method, endpoint, json=data)
+        return await self.authorized_request(method, endpoint)
+
+    async def payment_information(self, transaction_id, method: str = 'GET'):
+        return await self.authorized_request(method, f'payment/{transaction_id}')
+
+    async def check_account(self, phone, method: str = 'GET', endpoint: str = 'mobile/user/check_account'):
+        return await self.authorized_request(method, endpoint, params={'phone': phone})
+
+    async def get_receipient(self, merchant_id, data: dict, method: str = 'POST'):
+        return await self.authorized_request(method, f'payment/merchant/{merchant_id}/account', json=data)
+
+    async def make_request(self, method: str, endpoint: str, **kwargs):
+        response = await self._request(method, f"{self.base_url}/{endpoint}", **kwargs)
+        try:
+            return response.json(), response.status_code
+        except Exception:  # noqa
+            return {"detail": f"Error occurred: {response.text}"}, 400
+
+
 multibank_prod_app = MultibankRequestHandler(
     base_url=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['BASE_URL'],
     application_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['APPLICATION_ID'],
     secret=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['SECRET']
 )
+
+multibank_prod_async_app = AsyncMultibankRequestHandler(
+    base_url=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['BASE_URL'],
+    application_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['APPLICATION_ID'],
+    secret=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['SECRET']
+)
@@ -1,13 +1,23 @@
+import time
+
+import requests
 from django.conf import settings
 
+from config.core.async_request import AsyncHTTPClient
 from config.core.request import HTTPClient
+from config.core.token_cache import AsyncCachedToken, CachedToken, jwt_expiry
 
 
 class SMSRequestHandler(HTTPClient):
-    def __init__(self, base_url, username, password):
+    service = 'sms'
+
+    def __init__(self, base_url, username, password, timeout: tuple = (3.05, 10), token_ttl: int = 3600):
         self.base_url = base_url
         self.username = username
         self.password = password
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+        self.cached_token = CachedToken(fetch=self._fetch_token)
 
     def token(self, method: str = 'POST', endpoint: str = 'api/auth/login'):
         payload = {
@@ -16,34 +26,112 @@ class SMSRequestHandler(HTTPClient):
         }
         return self.make_request(method=method, endpoint=endpoint, json=payload)
 
+    def _fetch_token(self):
+        token = self.token().get('data', {}).get('token')
+        if not token:
+            raise requests.HTTPError('SMS provider did not return token')
+        # Provider issues JWT, fall back to configured lifetime if `exp` claim is absent
+        return token, jwt_expiry(token) or time.time() + self.token_ttl
+
     def user_information(self, method: str = 'GET', endpoint: str = 'api/auth/user'):
-        headers = {
-            'Authorization': f'Bearer {self.token().get("data", {}).get("token")}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers)
+        return self.authorized_request(method=method, endpoint=endpoint)
 
     def templates_list(self, method: str = 'GET', endpoint: str = 'api/user/templates'):
-        headers = {
-            'Authorization': f'Bearer {self.token().get("data", {}).get("token")}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers)
+        return self.authorized_request(method=method, endpoint=endpoint)
 
     def send_sms(self, method: str = 'POST', endpoint: str = 'api/message/sms/send', data: dict = None):
-        headers = {
-            'Authorization': f'Bearer {self.token().get("data", {}).get("token")}'
-        }
-        return self.make_request(method=method, endpoint=endpoint, headers=headers, json=data)
+        return self.authorized_request(method=method, endpoint=endpoint, json=data)
 
-    def make_request(self, method: str, endpoint: str, **kwargs):
-        response = self._request(method, f"{self.base_url}/{endpoint}", **kwargs)
+    def authorized_request(self, method: str, endpoint: str, **kwargs):
+        """
+        Request with cached bearer token, on 401 token is refreshed once and request is repeated
+        """
+        token = self.cached_token.get()
+        response = self._send(method, endpoint, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        if response.status_code == 401:
+            self.cached_token.invalidate(stale_token=token)
+            token = self.cached_token.get()
+            response = self._send(method, endpoint, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        return self._parse(response)
+
+    def _send(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        return self._request(method, f"{self.base_url}/{endpoint}", **kwargs)
+
+    @staticmethod
+    def _parse(response: requests.Response):
         try:
             return response.json()
         except Exception:  # noqa
             return {"detail": f"Error occurred: {response.text}"}
 
+    def make_request(self, method: str, endpoint: str, **kwargs):
+        return self._parse(self._send(method, endpoint, **kwargs))
+
+
+class AsyncSMSRequestHandler(AsyncHTTPClient):
+    """
+    Same surface as SMSRequestHandler, every method is a coroutine
+    """
+    service = 'sms'
+
+    def __init__(self, base_url, username, password, timeout: tuple = (3.05, 10), token_ttl: int = 3600):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+        self.cached_token = AsyncCachedToken(fetch=self._fetch_token)
+
+    async def token(self, method: str = 'POST', endpoint: str = 'api/auth/login'):
+        payload = {
+            'email': self.username,
+            'password': self.password
+        }
+        return await self.make_request(method=method, endpoint=endpoint, json=payload)
+
+    async def _fetch_token(self):
+        token = (await self.token()).get('data', {}).get('token')
+        if not token:
+            raise requests.HTTPError('SMS provider did not return token')
+        return token, jwt_expiry(token) or time.time() + self.token_ttl
+
+    async def user_information(self, method: str = 'GET', endpoint: str = 'api/auth/user'):
+        return await self.authorized_request(method=method, endpoint=endpoint)
+
+    async def templates_list(self, method: str = 'GET', endpoint: str = 'api/user/templates'):
+        return await self.authorized_request(method=method, endpoint=endpoint)
+
+    async def send_sms(self, method: str = 'POST', endpoint: str = 'api/message/sms/send', data: dict = None):
+        return await self.authorized_request(method=method, endpoint=endpoint, json=data)
+
+    async def authorized_request(self, method: str, endpoint: str, **kwargs):
+        token = await self.cached_token.aget()
+        response = await self._send(method, endpoint, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        if response.status_code == 401:
+            self.cached_token.invalidate(stale_token=token)
+            token = await self.cached_token.aget()
+            response = await self._send(method, endpoint, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        return SMSRequestHandler._parse(response)
+
+    async def _send(self, method: str, endpoint: str, **kwargs):
+        return await self._request(method, f"{self.base_url}/{endpoint}", **kwargs)
+
+    async def make_request(self, method: str, endpoint: str, **kwargs):
+        return SMSRequestHandler._parse(await self._send(method, endpoint, **kwargs))
+
 
 sms_app = SMSRequestHandler(
     base_url=settings.SMS_INTEGRATION_SETTINGS['SMS_BASE_URL'],
     username=settings.SMS_INTEGRATION_SETTINGS['SMS_USERNAME'],
-    password=settings.SMS_INTEGRATION_SETTINGS['SMS_PASSWORD']
+    password=settings.SMS_INTEGRATION_SETTINGS['SMS_PASSWORD'],
+    timeout=settings.SMS_INTEGRATION_SETTINGS['SMS_TIMEOUT'],
+    token_ttl=settings.SMS_INTEGRATION_SETTINGS['SMS_TOKEN_TTL'],
+)
+
+sms_async_app = AsyncSMSRequestHandler(
+    base_url=settings.SMS_INTEGRATION_SETTINGS['SMS_BASE_URL'],
+    username=settings.SMS_INTEGRATION_SETTINGS['SMS_USERNAME'],
+    password=settings.SMS_INTEGRATION_SETTINGS['SMS_PASSWORD'],
+    timeout=settings.SMS_INTEGRATION_SETTINGS['SMS_TIMEOUT'],
+    token_ttl=settings.SMS_INTEGRATION_SETTINGS['SMS_TOKEN_TTL'],
 )
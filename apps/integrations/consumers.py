@@ -0,0 +1,30 @@
+import json
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.contrib.auth.models import AnonymousUser
+
+from apps.integrations.services.multibank import payment_group
+
+
+class PaymentConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes state changes of user's payments made by payment worker
+    """
+    group_name = None
+
+    async def connect(self):
+        user = self.scope['user']
+        if isinstance(user, AnonymousUser):
+            await self.close()
+            return
+
+        self.group_name = payment_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def payment_state(self, event):
+        await self.send(text_data=json.dumps({'type': 'payment', 'payment': event['payment']}))
@@ -1,7 +1,8 @@
 from django.urls import path
 
-from apps.integrations.routes.multibank import MultiBankBindCardCallbackWebhookAPIView
+from apps.integrations.routes.multibank import MultiBankBindCardCallbackWebhookAPIView, MultibankPaymentStateAPIView
 
 urlpatterns = [
     path('multibank/bind-card/webhook/', MultiBankBindCardCallbackWebhookAPIView.as_view(), name='multibank_bind_card_webhook'),
+    path('multibank/payment/<uuid:pk>/', MultibankPaymentStateAPIView.as_view(), name='multibank_payment_state'),
 ]
\ No newline at end of file
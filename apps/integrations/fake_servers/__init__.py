@@ -0,0 +1,106 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON request handler; routes are taken from server.routes as (method, regex, callable)
+    callable(handler, body, **url_kwargs) -> (status_code, response_dict)
+    """
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is visible in stats
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024  # headers and body leave in one segment
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def log_message(self, format, *args):  # noqa
+        pass
+
+    def _dispatch(self, method):
+        path = self.path.split('?')[0].strip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            body = {}
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        for route_method, pattern, view in self.server.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                status_code, response = view(self, body, **match.groupdict())
+                break
+        else:
+            status_code, response = 404, {'detail': 'Not found'}
+
+        content = json.dumps(response).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):  # noqa
+        self._dispatch('GET')
+
+    def do_POST(self):  # noqa
+        self._dispatch('POST')
+
+    def do_PUT(self):  # noqa
+        self._dispatch('PUT')
+
+    def do_DELETE(self):  # noqa
+        self._dispatch('DELETE')
+
+    @property
+    def bearer_token(self):
+        auth = self.headers.get('Authorization') or ''
+        return auth[7:] if auth.startswith('Bearer ') else None
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    Local stand-in of an upstream API for development and benchmarks;
+    example: with FakeSMSServer(latency=0.05) as server: server.base_url
+    """
+    daemon_threads = True
+    routes = []
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), FakeRequestHandler)
+        self.latency = latency
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
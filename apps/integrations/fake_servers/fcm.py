@@ -0,0 +1,56 @@
+import json
+import uuid
+
+from apps.integrations.fake_servers import FakeServer
+
+
+def oauth_token(handler, body):
+    server = handler.server
+    server.count('auth')
+    token = uuid.uuid4().hex
+    server.tokens.add(token)
+    return 200, {'access_token': token, 'expires_in': 3600, 'token_type': 'Bearer'}
+
+
+def fcm_error(status_code: int, status: str, error_code: str):
+    return status_code, {'error': {'code': status_code, 'status': status, 'details': [
+        {'@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError', 'errorCode': error_code}
+    ]}}
+
+
+def send_message(handler, body, project_id):
+    server = handler.server
+    if handler.bearer_token not in server.tokens:
+        server.count('unauthorized')
+        return 401, {'error': {'code': 401, 'status': 'UNAUTHENTICATED'}}
+    message = body.get('message', {})
+    token = message.get('token')
+    if len(json.dumps(message.get('notification', {})).encode()) > server.MAX_NOTIFICATION_SIZE:
+        server.count('invalid_argument')
+        return fcm_error(400, 'INVALID_ARGUMENT', 'INVALID_ARGUMENT')
+    if token in server.unregistered:
+        server.count('unregistered')
+        return fcm_error(404, 'NOT_FOUND', 'UNREGISTERED')
+    server.count('sent')
+    server.delivered.append(token)
+    return 200, {'name': f'projects/{project_id}/messages/{uuid.uuid4().hex}'}
+
+
+class FakeFCMServer(FakeServer):
+    """
+    Stand-in of FCM HTTP v1 API and of Google OAuth token endpoint (point FIREBASE_TOKEN_URI to `<base_url>/token`);
+    tokens from `unregistered` are answered with UNREGISTERED, notifications over MAX_NOTIFICATION_SIZE bytes
+    with INVALID_ARGUMENT
+    """
+    MAX_NOTIFICATION_SIZE = 4096
+
+    routes = [
+        ('POST', r'token', oauth_token),
+        ('POST', r'v1/projects/(?P<project_id>[^/]+)/messages:send', send_message),
+    ]
+
+    def __init__(self, *args, unregistered=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tokens = set()
+        self.unregistered = set(unregistered)
+        self.delivered = []
@@ -0,0 +1,102 @@
+import uuid
+from datetime import datetime, timedelta
+
+from apps.integrations.fake_servers import FakeServer
+
+
+def auth(handler, body):
+    server = handler.server
+    server.count('auth')
+    token = uuid.uuid4().hex
+    server.tokens.add(token)
+    expiry = datetime.now() + timedelta(seconds=server.token_ttl)
+    return 200, {'token': token, 'role': 'merchant', 'expiry': expiry.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def authorized(view):
+    def wrapper(handler, body, **kwargs):
+        if handler.bearer_token not in handler.server.tokens:
+            handler.server.count('unauthorized')
+            return 401, {'success': False, 'error': {'code': 'UNAUTHORIZED', 'details': 'Token expired'}}
+        return view(handler, body, **kwargs)
+
+    return wrapper
+
+
+@authorized
+def merchant_account(handler, body, merchant_id):
+    handler.server.count('receipient')
+    account = f"{body.get('tin')}:{body.get('account_no')}"
+    return 200, {'success': True, 'data': {'uuid': str(uuid.uuid5(uuid.NAMESPACE_URL, account))}}
+
+
+@authorized
+def create_payment(handler, body):
+    server = handler.server
+    server.count('payment')
+    payment_uuid = str(uuid.uuid4())
+    server.payments[payment_uuid] = {'uuid': payment_uuid, 'invoice_id': body.get('invoice_id'),
+                                     'amount': body.get('amount'), 'status': 'draft', 'otp_hash': None}
+    return 200, {'success': True, 'data': server.payments[payment_uuid]}
+
+
+@authorized
+def confirm_payment(handler, body, payment_uuid):
+    server = handler.server
+    server.count('confirm')
+    payment = server.payments.get(payment_uuid)
+    if payment is None:
+        return 404, {'success': False, 'error': {'code': 'NOT_FOUND', 'details': 'Payment not found'}}
+    payment['status'] = server.payment_status
+    return 200, {'success': True, 'data': payment}
+
+
+@authorized
+def payment_information(handler, body, payment_uuid):
+    payment = handler.server.payments.get(payment_uuid)
+    if payment is None:
+        return 404, {'success': False, 'error': {'code': 'NOT_FOUND', 'details': 'Payment not found'}}
+    return 200, {'success': True, 'data': payment}
+
+
+@authorized
+def bind_card(handler, body):
+    handler.server.count('bind_card')
+    return 200, {'success': True, 'data': {'session_id': uuid.uuid4().hex,
+                                           'form_url': f'{handler.server.base_url}/card/bind'}}
+
+
+@authorized
+def remove_card(handler, body, card_token):
+    return 200, {'success': True, 'data': {'token': card_token}}
+
+
+@authorized
+def check_account(handler, body):
+    return 200, {'success': True, 'data': {'is_registered': True}}
+
+
+class FakeMultibankServer(FakeServer):
+    """
+    Stand-in of Multibank payment API (auth, recipient, payment, confirmation, cards)
+    """
+    routes = [
+        ('POST', r'auth', auth),
+        ('POST', r'payment/merchant/(?P<merchant_id>[^/]+)/account', merchant_account),
+        ('POST', r'payment', create_payment),
+        ('PUT', r'payment/(?P<payment_uuid>[^/]+)', confirm_payment),
+        ('GET', r'payment/(?P<payment_uuid>[^/]+)', payment_information),
+        ('POST', r'payment/card/bind', bind_card),
+        ('DELETE', r'payment/card/(?P<card_token>[^/]+)', remove_card),
+        ('GET', r'mobile/user/check_account', check_account),
+    ]
+
+    def __init__(self, *args, token_ttl: int = 86400, payment_status: str = 'success', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_ttl = token_ttl
+        self.payment_status = payment_status
+        self.tokens = set()
+        self.payments = {}
+
+    def revoke_tokens(self):
+        self.tokens.clear()
@@ -0,0 +1,267 @@
+import fnmatch
+import socketserver
+import threading
+import time
+from collections import deque
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """
+    RESP2 connection: reads commands, answers from server.execute()
+    """
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def read_command(self) -> list | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        command = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+    def handle(self):
+        while True:
+            try:
+                command = self.read_command()
+            except (ConnectionError, ValueError):
+                return
+            if not command:
+                return
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            try:
+                self.wfile.write(encode(self.server.execute(command)))
+            except ConnectionError:
+                return
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode(value) -> bytes:
+    if isinstance(value, RedisError):
+        return b'-ERR ' + str(value).encode() + b'\r\n'
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, str):
+        return b'+' + value.encode() + b'\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, NullArray):
+        return b'*-1\r\n'
+    return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+
+
+class NullArray:
+    pass
+
+
+def score(value: bytes) -> float:
+    value = value.decode().lower()
+    if value.startswith('('):
+        # Exclusive bounds are not needed by the channel layer, treated as inclusive
+        value = value[1:]
+    return float(value)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    Local stand-in of a Redis server with the commands used by ShardedRedisChannelLayer
+    (lists, sorted sets, EXPIRE, KEYS, SCAN, DEL), for development, tests and benchmarks;
+    example: with FakeRedisServer() as server: ShardedRedisChannelLayer(hosts=[server.base_url])
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), FakeRedisHandler)
+        self.latency = latency
+        self.stats = {}
+        self.data = {}
+        self.expires = {}
+        self._changed = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'redis://{host}:{port}/0'
+
+    def count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def _get(self, key: bytes, factory=None):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        value = self.data.get(key)
+        if value is None and factory is not None:
+            value = self.data[key] = factory()
+        return value
+
+    def _drop_empty(self, key: bytes):
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+            self.expires.pop(key, None)
+
+    def execute(self, command: list):
+        name, args = command[0].decode().upper(), command[1:]
+        self.count(name.lower())
+        handler = getattr(self, f'cmd_{name.lower()}', None)
+        if handler is None:
+            return RedisError(f"unknown command '{name}'")
+        if name == 'BLPOP':
+            return handler(*args)
+        with self._changed:
+            try:
+                return handler(*args)
+            except (TypeError, ValueError) as exc:
+                return RedisError(str(exc))
+
+    # Connection
+
+    def cmd_ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def cmd_client(self, *args):
+        return 'OK'
+
+    def cmd_select(self, *args):
+        return 'OK'
+
+    # Keys
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._get(key) is not None:
+                del self.data[key]
+                self.expires.pop(key, None)
+                deleted += 1
+        return deleted
+
+    def cmd_expire(self, key, seconds):
+        if self._get(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_keys(self, pattern):
+        pattern = pattern.decode()
+        return [key for key in list(self.data) if self._get(key) is not None and fnmatch.fnmatchcase(key.decode(),
+                                                                                                     pattern)]
+
+    def cmd_scan(self, cursor, *args):
+        options = {args[i].decode().upper(): args[i + 1] for i in range(0, len(args) - 1, 2)}
+        keys = sorted(self.cmd_keys(options.get('MATCH', b'*')))
+        start = int(cursor)
+        end = start + int(options.get('COUNT', 10))
+        return [str(end if end < len(keys) else 0).encode(), keys[start:end]]
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return 'OK'
+
+    cmd_flushall = cmd_flushdb
+
+    # Lists
+
+    def cmd_rpush(self, key, *values):
+        items = self._get(key, deque)
+        items.extend(values)
+        self._changed.notify_all()
+        return len(items)
+
+    def cmd_llen(self, key):
+        return len(self._get(key) or ())
+
+    def cmd_lpop(self, key, count=None):
+        items = self._get(key)
+        if not items:
+            return None if count is None else NullArray()
+        if count is None:
+            value = items.popleft()
+        else:
+            value = [items.popleft() for _ in range(min(int(count), len(items)))]
+        self._drop_empty(key)
+        return value
+
+    def cmd_blpop(self, *args):
+        keys, timeout = args[:-1], float(args[-1])
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._changed:
+            while True:
+                for key in keys:
+                    items = self._get(key)
+                    if items:
+                        value = items.popleft()
+                        self._drop_empty(key)
+                        return [key, value]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return NullArray()
+                self._changed.wait(remaining if remaining is not None else 1.0)
+
+    # Sorted sets
+
+    def cmd_zadd(self, key, *args):
+        members = self._get(key, dict)
+        added = 0
+        for index in range(0, len(args), 2):
+            added += args[index + 1] not in members
+            members[args[index + 1]] = float(args[index])
+        return added
+
+    def cmd_zrem(self, key, *values):
+        members = self._get(key) or {}
+        removed = sum(members.pop(value, None) is not None for value in values)
+        self._drop_empty(key)
+        return removed
+
+    def cmd_zcard(self, key):
+        return len(self._get(key) or ())
+
+    def cmd_zrange(self, key, start, stop):
+        ordered = sorted((self._get(key) or {}).items(), key=lambda item: (item[1], item[0]))
+        start, stop = int(start), int(stop)
+        stop = len(ordered) + stop if stop < 0 else stop
+        return [member for member, _score in ordered[start:stop + 1]]
+
+    def cmd_zremrangebyscore(self, key, minimum, maximum):
+        members = self._get(key) or {}
+        minimum, maximum = score(minimum), score(maximum)
+        expired = [member for member, value in members.items() if minimum <= value <= maximum]
+        for member in expired:
+            del members[member]
+        self._drop_empty(key)
+        return len(expired)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,68 @@
+import base64
+import json
+import time
+import uuid
+
+from apps.integrations.fake_servers import FakeServer
+
+
+def _issue_token(ttl: int) -> str:
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+    return '.'.join([encode({'alg': 'none'}), encode({'exp': int(time.time()) + ttl, 'jti': uuid.uuid4().hex}),
+                     'fake'])
+
+
+def login(handler, body):
+    server = handler.server
+    server.count('login')
+    token = _issue_token(server.token_ttl)
+    server.tokens.add(token)
+    return 200, {'message': 'token_generated', 'data': {'token': token}, 'token_type': 'bearer'}
+
+
+def authorized(view):
+    def wrapper(handler, body, **kwargs):
+        if handler.bearer_token not in handler.server.tokens:
+            handler.server.count('unauthorized')
+            return 401, {'status': 'error', 'message': 'Expired'}
+        return view(handler, body, **kwargs)
+
+    return wrapper
+
+
+@authorized
+def user_information(handler, body):
+    return 200, {'data': {'id': 1, 'email': 'fake@sapi.uz', 'balance': 100000}}
+
+
+@authorized
+def templates_list(handler, body):
+    return 200, {'data': []}
+
+
+@authorized
+def send_sms(handler, body):
+    handler.server.count('send')
+    return 200, {'id': uuid.uuid4().hex, 'message': 'Waiting for SMS provider', 'status': 'waiting'}
+
+
+class FakeSMSServer(FakeServer):
+    """
+    Stand-in of SMS provider (login, user, templates, send endpoints)
+    """
+    routes = [
+        ('POST', r'api/auth/login', login),
+        ('GET', r'api/auth/user', user_information),
+        ('GET', r'api/user/templates', templates_list),
+        ('POST', r'api/message/sms/send', send_sms),
+    ]
+
+    def __init__(self, *args, token_ttl: int = 3600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_ttl = token_ttl
+        self.tokens = set()
+
+    def revoke_tokens(self):
+        self.tokens.clear()
@@ -0,0 +1,76 @@
+import asyncio
+from time import perf_counter
+
+import requests
+from django.core.management.base import BaseCommand
+
+from apps.integrations.api_integrations.sms import AsyncSMSRequestHandler, SMSRequestHandler
+from apps.integrations.fake_servers.sms import FakeSMSServer
+from config.core.async_request import AsyncHTTPClient, gather
+from config.core.benchmark import latency_summary, run_timed
+
+
+class Command(BaseCommand):
+    help = ('Compare OTP send latency: login per send on fresh connections vs cached token on pooled session, '
+            'from threads and from one event loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--latency', type=float, default=0.02, help='Fake provider latency per response')
+        parser.add_argument('--base-url', help='Benchmark a running provider instead of in-process fake server')
+
+    def handle(self, *args, **options):
+        server = None
+        base_url = options['base_url']
+        if not base_url:
+            server = FakeSMSServer(latency=options['latency']).start()
+            base_url = server.base_url
+
+        payload = {'mobile_phone': '998900000000', 'message': 'Benchmark', 'from': '4546'}
+        credentials = {'email': 'benchmark', 'password': 'benchmark'}
+
+        def legacy_send():
+            # Behaviour before token caching: login and send, each on a new connection
+            token = requests.request('POST', f'{base_url}/api/auth/login', json=credentials).json()['data']['token']
+            requests.request('POST', f'{base_url}/api/message/sms/send', json=payload,
+                             headers={'Authorization': f'Bearer {token}'})
+
+        client = SMSRequestHandler(base_url=base_url, username='benchmark', password='benchmark')
+
+        def pooled_send():
+            client.send_sms(data=payload)
+
+        async_client = AsyncSMSRequestHandler(base_url=base_url, username='benchmark', password='benchmark')
+
+        async def async_sends():
+            async def timed():
+                started = perf_counter()
+                await async_client.send_sms(data=payload)
+                return perf_counter() - started
+
+            started = perf_counter()
+            try:
+                samples = await gather(*(timed() for _ in range(options['count'])), limit=options['concurrency'])
+            finally:
+                await AsyncHTTPClient.aclose()
+            return samples, perf_counter() - started
+
+        runs = (
+            ('legacy', lambda: run_timed(legacy_send, options['count'], options['concurrency'])),
+            ('cached+pooled', lambda: run_timed(pooled_send, options['count'], options['concurrency'])),
+            ('async', lambda: asyncio.run(async_sends())),
+        )
+        try:
+            for name, run in runs:
+                if server:
+                    server.stats.clear()
+                samples, wall_time = run()
+                summary = latency_summary(samples)
+                summary['throughput_rps'] = round(options['count'] / wall_time, 1)
+                if server:
+                    summary['upstream'] = dict(server.stats)
+                self.stdout.write(f'{name:>14}: {summary}')
+        finally:
+            if server:
+                server.stop()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils.timezone import timedelta
+
+from apps.integrations.services.reconciliation import PaymentReconciler
+
+
+class Command(BaseCommand):
+    help = 'Settle Multibank payments stuck in new/pending (OTP never confirmed, flow interrupted) by their upstream state'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel requests to Multibank')
+        parser.add_argument('--page-size', type=int, default=200, help='Transactions per page')
+        parser.add_argument('--min-age', type=int, default=15, help='Skip transactions younger than N minutes')
+        parser.add_argument('--expire-after', type=int, default=24,
+                            help='Fail transactions still unpaid upstream after N hours')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        reconciler = PaymentReconciler(
+            concurrency=options['concurrency'],
+            page_size=options['page_size'],
+            min_age=timedelta(minutes=options['min_age']),
+            expire_after=timedelta(hours=options['expire_after']),
+            dry_run=options['dry_run'],
+        )
+        stats = reconciler.run()
+        prefix = 'Dry run, would be ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}checked: {stats['checked']}, paid: {stats['paid']}, failed: {stats['failed']}, "
+            f"unchanged: {stats['unchanged']}, errors: {stats['errors']} ({stats['per_second']}/s)"
+        ))
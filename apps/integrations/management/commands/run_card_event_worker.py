@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.integrations.services.card_events import CardBindEventWorker
+
+
+class Command(BaseCommand):
+    help = 'Apply received Multibank bind-card callbacks to pending cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Events applied per batch')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        worker = CardBindEventWorker(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Card event worker started, batch size: {worker.batch_size}'))
+        worker.run(once=options['once'])
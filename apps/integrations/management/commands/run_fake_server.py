@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from apps.integrations.fake_servers.fcm import FakeFCMServer
+from apps.integrations.fake_servers.multibank import FakeMultibankServer
+from apps.integrations.fake_servers.redis import FakeRedisServer
+from apps.integrations.fake_servers.sms import FakeSMSServer
+
+FAKE_SERVERS = {
+    'fcm': FakeFCMServer,
+    'multibank': FakeMultibankServer,
+    'redis': FakeRedisServer,
+    'sms': FakeSMSServer,
+}
+
+
+class Command(BaseCommand):
+    help = 'Run local stand-in of an upstream integration, point *_BASE_URL env variable to it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('service', choices=sorted(FAKE_SERVERS))
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+
+    def handle(self, *args, **options):
+        server = FAKE_SERVERS[options['service']](host=options['host'], port=options['port'],
+                                                  latency=options['latency'])
+        self.stdout.write(self.style.SUCCESS(f"Fake {options['service']} server listening on {server.base_url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Stats: {server.stats}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.integrations.services.push_distribution import DistributionWorker
+
+
+class Command(BaseCommand):
+    help = 'Send waiting push notification distributions in FCM multicast batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Distributions sent in parallel')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        worker = DistributionWorker(concurrency=options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(f'Notification distributor started, batch size: {worker.batch_size}'))
+        worker.run(once=options['once'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.integrations.services.push_distribution import NotificationScheduler
+
+
+class Command(BaseCommand):
+    help = 'Hand scheduled notification distributions to the distributor when their sending_date comes'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Notification scheduler started'))
+        NotificationScheduler().run()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.integrations.services.payment_outbox import PaymentWorker
+
+
+class Command(BaseCommand):
+    help = 'Create and confirm committed Multibank payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Parallel payments in flight')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        worker = PaymentWorker(concurrency=options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(f'Payment worker started, concurrency: {worker.concurrency}'))
+        worker.run(once=options['once'])
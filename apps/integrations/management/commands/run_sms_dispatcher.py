@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.integrations.services.sms_outbox import SMSDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Send queued SMS from the outbox, login OTPs first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Parallel requests to SMS provider')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        dispatcher = SMSDispatcher(concurrency=options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(f'SMS dispatcher started, concurrency: {dispatcher.concurrency}'))
+        dispatcher.run(once=options['once'])
@@ -0,0 +1,45 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from apps.authentication.models import User
+from apps.integrations.models import MultibankRecipient
+from apps.integrations.services.multibank import aresolve_receipient
+from config.core.async_request import AsyncHTTPClient, gather
+
+
+class Command(BaseCommand):
+    help = 'Resolve and store Multibank recipients of verified creators, so payments skip the recipient lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Parallel requests to Multibank')
+
+    @staticmethod
+    async def warm(creator: User) -> bool:
+        try:
+            await aresolve_receipient(creator)
+            return True
+        except Exception:  # noqa
+            return False
+
+    async def warm_all(self, creators: list, concurrency: int) -> list:
+        try:
+            return await gather(*(self.warm(creator) for creator in creators), limit=concurrency)
+        finally:
+            await AsyncHTTPClient.aclose()
+
+    def handle(self, *args, **options):
+        resolved = MultibankRecipient.objects.filter(
+            creator=OuterRef('pk'), pinfl=OuterRef('pinfl'), account_no=OuterRef('multibank_account')
+        )
+        creators = list(
+            User.objects
+            .filter(is_creator=True, multibank_verified=True, pinfl__isnull=False, multibank_account__isnull=False)
+            .exclude(Exists(resolved))
+            .only('id', 'pinfl', 'multibank_account')
+        )
+        results = asyncio.run(self.warm_all(creators, options['concurrency']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Recipients resolved: {results.count(True)}, failed: {results.count(False)}'
+        ))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 16:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0011_multibanktransaction_creator_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SMSOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('phone_number', models.CharField(max_length=30)),
+                ('message', models.TextField()),
+                ('purpose', models.CharField(choices=[('register', 'Регистрация'), ('login', 'Авторизация'), ('forgot_password', 'Забыли пароль'), ('password_reset', 'Сброс пароля'), ('phone_update', 'Обновление телефона'), ('delete_account', 'Удаление аккаунта')], max_length=20)),
+                ('priority', models.PositiveSmallIntegerField(default=0)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Провалено')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'sms_outbox',
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['priority', 'next_attempt_at'], name='sms_outbox_queued_idx')],
+            },
+        ),
+    ]
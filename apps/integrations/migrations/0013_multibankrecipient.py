@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 16:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0012_smsoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MultibankRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('pinfl', models.CharField(max_length=14, null=True)),
+                ('account_no', models.CharField(max_length=20, null=True)),
+                ('uuid', models.CharField(max_length=55)),
+                ('creator', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='multibank_recipient', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'multibank_recipient',
+            },
+        ),
+    ]
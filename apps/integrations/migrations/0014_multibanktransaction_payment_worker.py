@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-19 16:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0024_remove_notificationdistribution_type_and_more'),
+        ('integrations', '0013_multibankrecipient'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='donation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='multibank_transactions', to='authentication.donation'),
+        ),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='fundraising',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='multibank_transactions', to='authentication.fundraising'),
+        ),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='last_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='need_otp',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, null=True),
+        ),
+        # Transactions made before the payment worker were processed in request, keep them out of its queue
+        migrations.RunSQL('UPDATE multibank_transaction SET next_attempt_at = NULL', migrations.RunSQL.noop),
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='subscription',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='multibank_transactions', to='authentication.usersubscription'),
+        ),
+        migrations.AlterField(
+            model_name='multibanktransaction',
+            name='status',
+            field=models.CharField(choices=[('new', 'Новый'), ('pending', 'В обработке'), ('paid', 'Оплачено'), ('failed', 'Провалено')], default='new', max_length=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='multibanktransaction',
+            index=models.Index(condition=models.Q(('locked_at__isnull', True), ('need_otp', False), ('status__in', ['new', 'pending'])), fields=['next_attempt_at'], name='multibank_tr_queued_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0015_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MultibankCardBindEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField()),
+                ('card_token', models.TextField(db_index=True, null=True)),
+                ('status', models.CharField(choices=[('received', 'Получено'), ('processing', 'Обрабатывается'), ('applied', 'Применено'), ('ignored', 'Пропущено')], default='received', max_length=10)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'multibank_card_bind_event',
+                'indexes': [models.Index(condition=models.Q(('status', 'received')), fields=['created_at'], name='mb_card_event_received_idx')],
+            },
+        ),
+    ]
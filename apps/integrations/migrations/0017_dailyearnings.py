@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-19 16:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_earnings(apps, schema_editor):
+    MultibankTransaction = apps.get_model('integrations', 'MultibankTransaction')
+    DailyEarnings = apps.get_model('integrations', 'DailyEarnings')
+    totals = (
+        MultibankTransaction.objects
+        .filter(status='paid')
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(creator_amount=Sum('creator_amount'), sapi_amount=Sum('sapi_amount'), transactions_count=Count('id'))
+    )
+    DailyEarnings.objects.bulk_create([
+        DailyEarnings(date=row['day'], creator_amount=row['creator_amount'] or 0, sapi_amount=row['sapi_amount'] or 0,
+                      transactions_count=row['transactions_count'])
+        for row in totals if row['day']
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0025_card_last4'),
+        ('integrations', '0016_multibankcardbindevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEarnings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('creator_amount', models.BigIntegerField(default=0)),
+                ('sapi_amount', models.BigIntegerField(default=0)),
+                ('transactions_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'daily_earnings',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='multibanktransaction',
+            index=models.Index(fields=['status', 'created_at'], name='multibank_tr_status_idx'),
+        ),
+        migrations.RunPython(fill_daily_earnings, migrations.RunPython.noop),
+    ]
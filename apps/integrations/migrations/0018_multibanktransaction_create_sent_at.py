@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0017_dailyearnings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multibanktransaction',
+            name='create_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
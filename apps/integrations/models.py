@@ -1,5 +1,6 @@
 import uuid
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
@@ -17,6 +18,17 @@ sms_message_purpose = {
 }
 
 
+# Lower value is dispatched first, login OTPs go before everything else
+sms_purpose_priority = {
+    'login': 0,
+    'register': 0,
+    'forgot_password': 1,
+    'password_reset': 1,
+    'phone_update': 2,
+    'delete_account': 3,
+}
+
+
 def sms_message_purpose_tool(purpose, code):
     return sms_message_purpose[purpose].format(code=code)
 
@@ -38,10 +50,30 @@ class MultibankTransactionTypeEnum(models.TextChoices):
 
 class MultibankTransactionStatusEnum(models.TextChoices):
     new = 'new', _("Новый")
+    pending = 'pending', _("В обработке")
     paid = 'paid', _("Оплачено")
     failed = 'failed', _("Провалено")
 
 
+class SMSOutboxStatusEnum(models.TextChoices):
+    queued = 'queued', _("В очереди")
+    sending = 'sending', _("Отправляется")
+    sent = 'sent', _("Отправлено")
+    failed = 'failed', _("Провалено")
+
+
+class CardBindEventStatusEnum(models.TextChoices):
+    received = 'received', _("Получено")
+    processing = 'processing', _("Обрабатывается")
+    applied = 'applied', _("Применено")
+    ignored = 'ignored', _("Пропущено")
+
+
+class IdempotencyKeyStatusEnum(models.TextChoices):
+    in_progress = 'in_progress', _("Выполняется")
+    completed = 'completed', _("Завершено")
+
+
 class SMSConfirmation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sms_confirmations", null=True, blank=True)
     phone_number = models.CharField(max_length=30, null=True, blank=True)
@@ -62,6 +94,28 @@ class SMSConfirmation(models.Model):
         db_table = "sms_confirmation"
 
 
+class SMSOutbox(BaseModel):
+    """Outbound SMS queue, drained by `manage.py run_sms_dispatcher`"""
+    phone_number = models.CharField(max_length=30)
+    message = models.TextField()
+    purpose = models.CharField(max_length=20, choices=PurposeEnum.choices)
+    priority = models.PositiveSmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=SMSOutboxStatusEnum.choices,
+                              default=SMSOutboxStatusEnum.queued)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        db_table = "sms_outbox"
+        indexes = [
+            models.Index(fields=['priority', 'next_attempt_at'], name='sms_outbox_queued_idx',
+                         condition=models.Q(status='queued')),
+        ]
+
+
 class MultibankAuthToken(models.Model):
     token = models.TextField()
     expires_at = models.DateTimeField()
@@ -72,6 +126,19 @@ class MultibankAuthToken(models.Model):
         db_table = "multibank_auth_token"
 
 
+class MultibankRecipient(BaseModel):
+    """
+    Resolved Multibank recipient of creator's account, valid while pinfl and account_no match the creator
+    """
+    creator = models.OneToOneField(User, on_delete=models.CASCADE, related_name='multibank_recipient')
+    pinfl = models.CharField(max_length=14, null=True)
+    account_no = models.CharField(max_length=20, null=True)
+    uuid = models.CharField(max_length=55)
+
+    class Meta:
+        db_table = "multibank_recipient"
+
+
 class MultibankTransaction(BaseModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     status = models.CharField(choices=MultibankTransactionStatusEnum.choices,
@@ -88,6 +155,85 @@ class MultibankTransaction(BaseModel):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='user_multibank_transactions')
     creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
                                 related_name='creator_multibank_transactions')
+    donation = models.ForeignKey('authentication.Donation', on_delete=models.SET_NULL, null=True,
+                                 related_name='multibank_transactions')
+    subscription = models.ForeignKey('authentication.UserSubscription', on_delete=models.SET_NULL, null=True,
+                                     related_name='multibank_transactions')
+    fundraising = models.ForeignKey('authentication.Fundraising', on_delete=models.SET_NULL, null=True,
+                                    related_name='multibank_transactions')
+
+    # Payment worker state, see `manage.py run_payment_worker`
+    need_otp = models.BooleanField(default=False)
+    # Set right before create_payment is sent; a payment with it and no transaction_id may exist upstream
+    create_sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now, null=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
 
     class Meta:
         db_table = "multibank_transaction"
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='multibank_tr_queued_idx',
+                         condition=models.Q(status__in=['new', 'pending'], locked_at__isnull=True,
+                                            need_otp=False)),
+            # Reconciliation pages through non-final payments, dashboards filter paid ones by date
+            models.Index(fields=['status', 'created_at'], name='multibank_tr_status_idx'),
+        ]
+
+
+class DailyEarnings(models.Model):
+    """
+    Paid MultibankTransaction amounts per day (by transaction's created_at, local time) for admin dashboards,
+    refreshed by settle_paid and `manage.py reconcile_multibank_transactions`
+    """
+    date = models.DateField(unique=True)
+    creator_amount = models.BigIntegerField(default=0)
+    sapi_amount = models.BigIntegerField(default=0)
+    transactions_count = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "daily_earnings"
+
+
+class MultibankCardBindEvent(models.Model):
+    """Raw bind-card callback of Multibank, applied to cards by `manage.py run_card_event_worker`"""
+    payload = models.JSONField()
+    card_token = models.TextField(null=True, db_index=True)
+    status = models.CharField(max_length=10, choices=CardBindEventStatusEnum.choices,
+                              default=CardBindEventStatusEnum.received)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "multibank_card_bind_event"
+        indexes = [
+            models.Index(fields=['created_at'], name='mb_card_event_received_idx',
+                         condition=models.Q(status='received')),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Idempotency-Key of a payment request and its final response, see IdempotentRequestMixin"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=55)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=15, choices=IdempotencyKeyStatusEnum.choices,
+                              default=IdempotencyKeyStatusEnum.in_progress)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = "idempotency_key"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='idempotency_key_unique_user_scope_key')
+        ]
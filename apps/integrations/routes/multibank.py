@@ -1,26 +1,41 @@
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.utils.translation import gettext_lazy as _
 
-from apps.authentication.models import User, Card
+from apps.integrations.models import MultibankTransaction
+from apps.integrations.services.card_events import receive_card_event
+from apps.integrations.services.multibank import payment_state
+from config.core.api_exceptions import APIValidation
 
 
 class MultiBankBindCardCallbackWebhookAPIView(APIView):
     permission_classes = [AllowAny, ]
 
     def post(self, request, *args, **kwargs):
-        data = request.data
-        print(data)
-        card = (
-            Card.objects
-            .filter(user__phone_number=data.get('phone'), number__endswith=data.get('card_pan')[12:], is_active=False)
-        )
-        if card.exists():
-            card = card.first()
-            card.card_owner = data.get('holder_name')
-            card.token = data.get('card_token')
-            card.is_active = True
-            if data.get('ps') in ['visa', 'uzcard', 'humo', 'mastercard', ]:
-                card.type = data.get('ps')
-            card.save()
+        # Acknowledged right away, cards are updated in batches by `manage.py run_card_event_worker`
+        receive_card_event(request.data)
         return Response()
+
+
+class MultibankPaymentStateAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description='State of a payment created by donate/subscribe: new -> pending -> paid/failed. '
+                              'Same payload is pushed to ws/payments/ as {"type": "payment", "payment": {...}}',
+        responses={200: openapi.Response(description='Payment state', examples={
+            'application/json': {
+                'id': '5d0c8a8e-3b0f-4a57-9a3e-1f1f6d2b8c11',
+                'status': 'paid',
+                'need_otp': False,
+                'transaction_id': '9bf2385d-46a1-11f0-bdd5-005056b4367d'
+            }
+        })}
+    )
+    def get(self, request, pk, *args, **kwargs):
+        transaction = MultibankTransaction.objects.filter(pk=pk, user=request.user).first()
+        if transaction is None:
+            raise APIValidation(_('Платеж не найден'), status_code=404)
+        return Response(payment_state(transaction))
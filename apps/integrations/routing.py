@@ -0,0 +1,7 @@
+from django.urls import re_path
+
+from apps.integrations.consumers import PaymentConsumer
+
+websocket_urlpatterns = [
+    re_path(r'ws/payments/$', PaymentConsumer.as_asgi()),
+]
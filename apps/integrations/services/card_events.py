@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models import Count
+from django.utils.timezone import now, timedelta
+
+from apps.authentication.models import Card, User
+from apps.integrations.models import MultibankCardBindEvent, CardBindEventStatusEnum
+from config.core.metrics import metrics
+from config.core.pg_notify import notify
+from config.core.workers import QueueWorker
+
+CARD_EVENTS_CHANNEL = 'multibank_card_events'
+CARD_TYPES = ('visa', 'uzcard', 'humo', 'mastercard')
+
+
+def receive_card_event(payload: dict) -> MultibankCardBindEvent:
+    event = MultibankCardBindEvent.objects.create(payload=payload, card_token=payload.get('card_token'))
+    notify(CARD_EVENTS_CHANNEL)
+    return event
+
+
+class CardBindEventWorker(QueueWorker):
+    """
+    Applies bind-card callbacks to pending cards in batches: one query for owners, one for cards
+    and one bulk update per batch. Events are idempotent by card_token, a token already bound is skipped.
+    """
+    name = 'card_event_worker'
+    channel = CARD_EVENTS_CHANNEL
+
+    def __init__(self, batch_size: int = 500):
+        # Single batch in flight, concurrent batches would race for the same cards
+        super().__init__(concurrency=1)
+        self.batch_size = batch_size
+        self.lock_timeout = timedelta(minutes=2)
+
+    def claim(self, limit):
+        with transaction.atomic():
+            events = list(
+                MultibankCardBindEvent.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=CardBindEventStatusEnum.received)
+                .order_by('created_at')[:self.batch_size]
+            )
+            if events:
+                MultibankCardBindEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                    status=CardBindEventStatusEnum.processing, locked_at=now()
+                )
+        return [events] if events else []
+
+    @staticmethod
+    def latest_by_token(events: list[MultibankCardBindEvent]) -> tuple[dict, list]:
+        """
+        return: ({card_token: latest event}, events to ignore)
+        """
+        latest, ignored = {}, []
+        for event in sorted(events, key=lambda item: item.pk):
+            payload = event.payload
+            if not (event.card_token and payload.get('phone') and payload.get('card_pan')):
+                ignored.append(event)
+                continue
+            if event.card_token in latest:
+                ignored.append(latest[event.card_token])
+            latest[event.card_token] = event
+        return latest, ignored
+
+    def process(self, events: list[MultibankCardBindEvent]):
+        latest, ignored = self.latest_by_token(events)
+        applied, cards = [], []
+        with transaction.atomic():
+            bound = set(Card.all_objects.filter(token__in=latest.keys()).values_list('token', flat=True))
+            pending = [event for token, event in latest.items() if token not in bound]
+            ignored += [event for token, event in latest.items() if token in bound]
+
+            users = dict(
+                User.objects
+                .filter(phone_number__in={event.payload['phone'] for event in pending})
+                .values_list('phone_number', 'id')
+            )
+            candidates = {}
+            for card in (
+                Card.objects
+                .filter(user_id__in=users.values(), last4__in={event.payload['card_pan'][-4:] for event in pending},
+                        is_active=False)
+                .order_by('id')
+            ):
+                candidates.setdefault((card.user_id, card.last4), card)
+
+            for event in pending:
+                payload = event.payload
+                card = candidates.pop((users.get(payload['phone']), payload['card_pan'][-4:]), None)
+                if card is None:
+                    ignored.append(event)
+                    continue
+                card.card_owner = payload.get('holder_name')
+                card.token = event.card_token
+                card.is_active = True
+                if payload.get('ps') in CARD_TYPES:
+                    card.type = payload.get('ps')
+                card.updated_at = now()
+                cards.append(card)
+                applied.append(event)
+
+            Card.objects.bulk_update(cards, ['card_owner', 'token', 'is_active', 'type', 'updated_at'])
+            MultibankCardBindEvent.objects.filter(pk__in=[event.pk for event in applied]).update(
+                status=CardBindEventStatusEnum.applied, locked_at=None, processed_at=now()
+            )
+            MultibankCardBindEvent.objects.filter(pk__in=[event.pk for event in ignored]).update(
+                status=CardBindEventStatusEnum.ignored, locked_at=None, processed_at=now()
+            )
+        metrics.increment('card_events.applied', len(applied))
+        metrics.increment('card_events.ignored', len(ignored))
+
+    def tick(self):
+        # Batch of a crashed worker stays locked, give it back to the queue
+        requeued = (
+            MultibankCardBindEvent.objects
+            .filter(status=CardBindEventStatusEnum.processing, locked_at__lt=now() - self.lock_timeout)
+            .update(status=CardBindEventStatusEnum.received, locked_at=None)
+        )
+        if requeued:
+            metrics.increment('card_events.requeued', requeued)
+        depth = (
+            MultibankCardBindEvent.objects
+            .filter(status=CardBindEventStatusEnum.received)
+            .aggregate(count=Count('id'))['count']
+        )
+        metrics.gauge('card_events.queue_depth', depth)
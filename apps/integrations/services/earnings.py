@@ -0,0 +1,64 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localtime, make_aware
+
+from apps.integrations.models import DailyEarnings, MultibankTransaction, MultibankTransactionStatusEnum
+
+# pg_advisory_xact_lock(EARNINGS_LOCK_KEY, day ordinal) serializes refreshes of one day
+EARNINGS_LOCK_KEY = 7_100_002
+
+
+def earnings_date(transaction: MultibankTransaction) -> date:
+    return localtime(transaction.created_at).date()
+
+
+def refresh_daily_earnings(dates):
+    """
+    Recompute DailyEarnings of given dates from paid transactions, one aggregate query for the whole range.
+    Runs in the transaction that marks payments paid: days are locked until it commits, so a concurrent
+    settlement of the same day aggregates after this one is visible instead of overwriting it with its own sum
+    """
+    dates = set(dates)
+    if not dates:
+        return
+    start, end = min(dates), max(dates)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Every day of the range is rewritten; taken in date order, overlapping ranges do not deadlock
+            for ordinal in range(start.toordinal(), end.toordinal() + 1):
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [EARNINGS_LOCK_KEY, ordinal])
+        _refresh_daily_earnings(start, end)
+
+
+def _refresh_daily_earnings(start: date, end: date):
+    totals = {
+        row['day']: row
+        for row in (
+            MultibankTransaction.objects
+            .filter(status=MultibankTransactionStatusEnum.paid,
+                    created_at__gte=make_aware(datetime.combine(start, time.min)),
+                    created_at__lt=make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+            .annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(creator_amount=Sum('creator_amount'), sapi_amount=Sum('sapi_amount'),
+                      transactions_count=Count('id'))
+        )
+    }
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    DailyEarnings.objects.bulk_create(
+        [
+            DailyEarnings(date=day,
+                          creator_amount=totals.get(day, {}).get('creator_amount') or 0,
+                          sapi_amount=totals.get(day, {}).get('sapi_amount') or 0,
+                          transactions_count=totals.get(day, {}).get('transactions_count') or 0)
+            for day in days
+        ],
+        update_conflicts=True,
+        unique_fields=['date'],
+        update_fields=['creator_amount', 'sapi_amount', 'transactions_count', 'updated_at'],
+    )
+
+
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import time
+
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now, timedelta
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.integrations.models import IdempotencyKey, IdempotencyKeyStatusEnum
+from config.core.api_exceptions import APIValidation
+from config.core.metrics import metrics
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+KEY_TTL = timedelta(hours=24)
+# How long a duplicate waits for the in-flight attempt before giving up with 409
+WAIT_TIMEOUT = 10
+
+
+def request_fingerprint(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method}:{request.path}:{body}'.encode()).hexdigest()
+
+
+def claim_key(user, scope: str, key: str, fingerprint: str) -> tuple[IdempotencyKey, bool]:
+    """
+    return: (record, created), created is False when the key was already used
+    """
+    for _attempt in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, scope=scope, key=key, fingerprint=fingerprint,
+                                                     expires_at=now() + KEY_TTL), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at < now():
+                record.delete()
+                continue
+            return record, False
+    raise APIValidation(_('Запрос с этим Idempotency-Key ещё выполняется'), status_code=status.HTTP_409_CONFLICT)
+
+
+def wait_for_completion(record: IdempotencyKey) -> IdempotencyKey | None:
+    """
+    Poll the in-flight attempt with growing interval
+    return: completed record, None when the attempt failed and its key was released
+    """
+    delay = 0.05
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while record.status == IdempotencyKeyStatusEnum.in_progress:
+        if time.monotonic() >= deadline:
+            raise APIValidation(_('Запрос с этим Idempotency-Key ещё выполняется'),
+                                status_code=status.HTTP_409_CONFLICT)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record
+
+
+class IdempotentRequestMixin:
+    """
+    POST with `Idempotency-Key` header runs once per user and key: the final response is stored and replayed
+    to retries, concurrent duplicates wait for the in-flight attempt. Requests without the header are not affected.
+    """
+    idempotency_scope = None
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return super().post(request, *args, **kwargs)
+        if len(key) > 255:
+            raise APIValidation(_('Idempotency-Key слишком длинный'), status_code=status.HTTP_400_BAD_REQUEST)
+
+        scope = self.idempotency_scope or type(self).__name__
+        fingerprint = request_fingerprint(request)
+        for _attempt in range(2):
+            record, created = claim_key(request.user, scope, key, fingerprint)
+            if created:
+                return self.run_once(record, request, *args, **kwargs)
+            if record.fingerprint != fingerprint:
+                raise APIValidation(_('Idempotency-Key уже использован для другого запроса'),
+                                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            record = wait_for_completion(record)
+            if record is not None:
+                metrics.increment('idempotency.replayed', scope=scope)
+                return Response(record.response_body, status=record.response_status,
+                                headers={'Idempotent-Replayed': 'true'})
+        raise APIValidation(_('Запрос с этим Idempotency-Key ещё выполняется'), status_code=status.HTTP_409_CONFLICT)
+
+    def run_once(self, record: IdempotencyKey, request, *args, **kwargs):
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            # Failed attempt does not hold the key, the client may retry it
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        record.status = IdempotencyKeyStatusEnum.completed
+        record.response_status = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=['status', 'response_status', 'response_body'])
+        return response
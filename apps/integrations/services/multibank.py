@@ -1,36 +1,85 @@
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
 from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils.timezone import now
 
-from apps.authentication.models import User, Card
-from apps.integrations.api_integrations.multibank import multibank_prod_app
-from apps.integrations.models import MultibankTransaction
+from apps.authentication.models import User, Card, Donation, Fundraising, UserSubscription
+from apps.authentication.services import create_activity
+from apps.chat.policy import invalidate_chat_access
+from apps.integrations.api_integrations.multibank import multibank_prod_app, multibank_prod_async_app
+from apps.integrations.models import MultibankTransaction, MultibankRecipient, MultibankTransactionStatusEnum
+from apps.integrations.services.earnings import earnings_date, refresh_daily_earnings
 from config.core.api_exceptions import APIValidation
+from config.core.channel_layer import group_send_sync
+from config.core.pg_notify import notify
 
 from django.utils.translation import gettext_lazy as _
 
 
-def multibank_payment(user: User, creator: User, card: Card, amount, payment_type, fundraising=None):
-    # SAPI TRANSACTION CREATION
-    transaction = MultibankTransaction.objects.create(
-        store_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['STORE_ID'], amount=amount,
-        transaction_type=payment_type, user=user, creator=creator, card_token=card.token
-    )
-
-    # GET CREATOR RECEIPIENT
-    creator_receipient, receipient_sc = multibank_prod_app.get_receipient(data={
+def receipient_payload(creator: User) -> dict:
+    return {
         'tin': creator.pinfl,
         'mfo': '00491',  # Hard coded bank's MFO
         'account_no': creator.multibank_account,
         'commitent': True
-    }, merchant_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['MERCHANT_ID'])
-    if not str(receipient_sc).startswith('2'):
+    }
+
+
+def stored_receipient(creator: User) -> str | None:
+    """
+    return: persisted recipient uuid, None when it was never resolved or creator's account/pinfl changed since
+    """
+    return MultibankRecipient.objects.filter(
+        creator=creator, pinfl=creator.pinfl, account_no=creator.multibank_account
+    ).values_list('uuid', flat=True).first()
+
+
+def store_receipient(creator: User, creator_receipient: dict, receipient_sc) -> str:
+    receipient_uuid = creator_receipient.get('data', {}).get('uuid')
+    if not str(receipient_sc).startswith('2') or not receipient_uuid:
         raise APIValidation(_('Ошибка во время получение данных от Multibank'), status_code=400)
+    MultibankRecipient.objects.update_or_create(creator=creator, defaults={
+        'pinfl': creator.pinfl, 'account_no': creator.multibank_account, 'uuid': receipient_uuid
+    })
+    return receipient_uuid
 
-    # PAYMENT CREATION
+
+def resolve_receipient(creator: User) -> str:
+    """
+    return: creator's Multibank recipient uuid, upstream is called only when account or pinfl changed
+    """
+    receipient_uuid = stored_receipient(creator)
+    if receipient_uuid:
+        return receipient_uuid
+    creator_receipient, receipient_sc = multibank_prod_app.get_receipient(
+        data=receipient_payload(creator), merchant_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['MERCHANT_ID']
+    )
+    return store_receipient(creator, creator_receipient, receipient_sc)
+
+
+async def aresolve_receipient(creator: User) -> str:
+    receipient_uuid = await database_sync_to_async(stored_receipient)(creator)
+    if receipient_uuid:
+        return receipient_uuid
+    creator_receipient, receipient_sc = await multibank_prod_async_app.get_receipient(
+        data=receipient_payload(creator), merchant_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['MERCHANT_ID']
+    )
+    return await database_sync_to_async(store_receipient)(creator, creator_receipient, receipient_sc)
+
+
+def payment_body(transaction: MultibankTransaction, creator: User, receipient_uuid: str):
+    """
+    Fill SAPI/creator split amounts of transaction and return Multibank payment body
+    """
+    amount = transaction.amount
     multicard_commission = amount * 0.02
     creator_amount = (((100 - creator.sapi_share) / 100) * amount) - multicard_commission
     creator_split = {
         'type': 'account',
-        'receipient': creator_receipient.get('data', {}).get('uuid'),
+        'receipient': receipient_uuid,
         'amount': int(creator_amount),
         'details': 'Донат для креатора SAPI'
     }
@@ -43,39 +92,107 @@ def multibank_payment(user: User, creator: User, card: Card, amount, payment_typ
     }
     transaction.sapi_amount = sapi_amount
     transaction.creator_amount = creator_amount
-    body = {
+    return {
         'card': {
-            'token': card.token
+            'token': transaction.card_token
         },
         'amount': amount,
         'store_id': settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['STORE_ID'],
         'invoice_id': str(transaction.id),
         'split': [creator_split, sapi_split]
     }
-    payment_response, payment_sc = multibank_prod_app.create_payment(data=body)
-    if not str(payment_sc).startswith('2'):
-        transaction.status = 'failed'
-        transaction.save()
-        raise APIValidation(_('Ошибка во время получение данных от Multibank'), status_code=400)
-    payment_transaction_id = payment_response.get('data', {}).get('uuid')
-    transaction.transaction_id = payment_transaction_id
-
-    # PAYMENT CONFIRMATION
-    need_otp_confirmation = True if payment_response.get('data', {}).get('otp_hash') else False
-    if need_otp_confirmation:
-        transaction.save()
-        return {'need_otp': need_otp_confirmation, 'transaction_id': payment_transaction_id}
-    payment_confirm_resp, payment_confirm_sc = multibank_prod_app.confirm_payment(
-        transaction_id=payment_transaction_id
+
+
+PAYMENT_CHANNEL = 'multibank_payments'
+
+
+def payment_group(user_id) -> str:
+    return f'payments_{user_id}'
+
+
+def create_payment_intent(user: User, creator: User, card: Card, amount, payment_type, donation: Donation = None,
+                          subscription: UserSubscription = None,
+                          fundraising: Fundraising = None) -> MultibankTransaction:
+    """
+    Commit payment as `new` transaction, upstream calls are made by `manage.py run_payment_worker`;
+    clients poll multibank/payment/<id>/ or listen on ws/payments/
+    """
+    transaction = MultibankTransaction.objects.create(
+        store_id=settings.MULTIBANK_INTEGRATION_SETTINGS['PROD']['STORE_ID'], amount=amount,
+        transaction_type=payment_type, user=user, creator=creator, card_token=card.token,
+        donation=donation, subscription=subscription, fundraising=fundraising
+    )
+    notify(PAYMENT_CHANNEL)
+    return transaction
+
+
+def payment_state(transaction: MultibankTransaction) -> dict:
+    return {
+        'id': str(transaction.id),
+        'status': transaction.status,
+        'need_otp': transaction.need_otp,
+        'transaction_id': transaction.transaction_id,
+    }
+
+
+def push_payment_state(transaction: MultibankTransaction):
+    group_send_sync(payment_group(transaction.user_id), {
+        'type': 'payment.state',
+        'payment': payment_state(transaction),
+    })
+
+
+def credit_paid(transactions: list[MultibankTransaction]):
+    """
+    Side effects of payments that have just become paid: credit fundraisings, activate subscriptions,
+    notify creators of donations and subscriptions and refresh earnings of their days
+    """
+    fundraising_amounts = defaultdict(int)
+    for transaction in transactions:
+        if transaction.fundraising_id:
+            fundraising_amounts[transaction.fundraising_id] += int(transaction.creator_amount)
+    for fundraising_id, amount in fundraising_amounts.items():
+        Fundraising.objects.filter(pk=fundraising_id).update(current_amount=F('current_amount') + amount)
+
+    subscriptions = list(
+        UserSubscription.objects
+        .select_related('plan')
+        .filter(pk__in=[transaction.subscription_id for transaction in transactions if transaction.subscription_id])
     )
-    if not str(payment_confirm_sc).startswith('2'):
-        transaction.status = 'failed'
-        transaction.save()
-        raise APIValidation(_('Ошибка во время подтверждении оплаты Multibank'), status_code=400)
-    if payment_confirm_resp.get('data', {}).get('status') == 'success':
-        transaction.status = 'paid'
-    transaction.save()
-    if fundraising:
-        fundraising.current_amount += creator_amount
-        fundraising.save(update_fields=['current_amount'])
-    return {'need_otp': need_otp_confirmation, 'transaction_id': payment_transaction_id}
+    for subscription in subscriptions:
+        subscription.is_active = True
+        if subscription.plan:
+            subscription.end_date = now() + subscription.plan.duration
+    UserSubscription.objects.bulk_update(subscriptions, ['is_active', 'end_date'])
+    activities = [transaction for transaction in transactions if transaction.subscription_id or transaction.donation_id]
+    users = User.objects.in_bulk({transaction.user_id for transaction in activities} |
+                                 {transaction.creator_id for transaction in activities}) if activities else {}
+    for transaction in activities:
+        activity_type, content_id = ('subscribed', transaction.subscription_id) if transaction.subscription_id else \
+            ('donation', transaction.donation_id)
+        create_activity(activity_type, None, content_id, users.get(transaction.user_id),
+                        users.get(transaction.creator_id))
+    # Paid subscriptions and donations may open chats with their creators
+    invalidate_chat_access({
+        (transaction.creator_id, transaction.user_id) for transaction in transactions
+        if transaction.creator_id and (transaction.subscription_id or transaction.donation_id)
+    })
+    refresh_daily_earnings({earnings_date(transaction) for transaction in transactions})
+
+
+def settle_paid(transaction: MultibankTransaction):
+    """
+    Final step of a successful payment: credit fundraising and activate subscription
+    """
+    with db_transaction.atomic():
+        updated = (
+            MultibankTransaction.objects
+            .filter(pk=transaction.pk)
+            .exclude(status=MultibankTransactionStatusEnum.paid)
+            .update(status=MultibankTransactionStatusEnum.paid, locked_at=None, next_attempt_at=None,
+                    last_error=None, attempts=transaction.attempts)
+        )
+        if not updated:
+            return
+        credit_paid([transaction])
+    transaction.status = MultibankTransactionStatusEnum.paid
@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Count, F
+from django.utils.timezone import now, timedelta
+
+from apps.integrations.api_integrations.multibank import multibank_prod_app
+from apps.integrations.models import MultibankTransaction, MultibankTransactionStatusEnum, IdempotencyKey
+from apps.integrations.services.multibank import (PAYMENT_CHANNEL, payment_body, push_payment_state,
+                                                  resolve_receipient, settle_paid)
+from config.core.api_exceptions import APIValidation
+from config.core.metrics import metrics
+from config.core.request import UpstreamUnavailable
+from config.core.workers import QueueWorker, backoff_delay
+
+
+class PaymentRejected(Exception):
+    pass
+
+
+class PaymentOutcomeUnknown(Exception):
+    """
+    create_payment may have reached Multibank, which has no lookup by invoice id: creating it again could
+    charge the card twice, so the payment fails
+    """
+
+
+def check_response(response: dict, status_code):
+    if str(status_code).startswith('5'):
+        raise APIValidation(str(response), status_code=status_code)
+    if not str(status_code).startswith('2'):
+        raise PaymentRejected(str(response))
+
+
+class PaymentWorker(QueueWorker):
+    """
+    Moves MultibankTransaction through new -> pending -> paid/failed:
+    new: intent committed by request, payment is not created upstream yet
+    pending: claimed by worker, or created upstream and waiting for confirmation (or OTP)
+    """
+    name = 'payment_worker'
+    channel = PAYMENT_CHANNEL
+
+    def __init__(self, concurrency: int = None):
+        config = settings.MULTIBANK_INTEGRATION_SETTINGS['PAYMENT_WORKER']
+        super().__init__(concurrency or config['CONCURRENCY'])
+        self.max_attempts = config['MAX_ATTEMPTS']
+        self.backoff = (config['BACKOFF_BASE'], config['BACKOFF_MAX'])
+        self.lock_timeout = timedelta(minutes=2)
+
+    def claim(self, limit):
+        with db_transaction.atomic():
+            jobs = list(
+                MultibankTransaction.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('creator')
+                .filter(status__in=[MultibankTransactionStatusEnum.new, MultibankTransactionStatusEnum.pending],
+                        locked_at__isnull=True, need_otp=False, next_attempt_at__lte=now())
+                .order_by('next_attempt_at')[:limit]
+            )
+            if jobs:
+                MultibankTransaction.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                    status=MultibankTransactionStatusEnum.pending, locked_at=now()
+                )
+        return jobs
+
+    @staticmethod
+    def create(job: MultibankTransaction):
+        if job.create_sent_at:
+            # Sent by an attempt that never saved its answer (worker died, row requeued by tick)
+            raise PaymentOutcomeUnknown(f'create_payment sent at {job.create_sent_at}, outcome unknown')
+        body = payment_body(job, job.creator, resolve_receipient(job.creator))
+        # Failures up to here (recipient, token) happen before anything is sent and are retried as usual
+        multibank_prod_app.auth()
+        job.create_sent_at = now()
+        MultibankTransaction.objects.filter(pk=job.pk).update(create_sent_at=job.create_sent_at)
+        try:
+            payment_response, payment_sc = multibank_prod_app.create_payment(data=body)
+        except UpstreamUnavailable as exc:
+            if exc.reason != 'circuit_open':
+                raise PaymentOutcomeUnknown(f'create_payment {exc.reason}, outcome unknown') from exc
+            # Rejected by the breaker before sending
+            job.create_sent_at = None
+            MultibankTransaction.objects.filter(pk=job.pk).update(create_sent_at=None)
+            raise
+        if str(payment_sc).startswith('5'):
+            raise PaymentOutcomeUnknown(f'create_payment answered {payment_sc}, outcome unknown: {payment_response}')
+        check_response(payment_response, payment_sc)
+        job.transaction_id = payment_response.get('data', {}).get('uuid')
+        job.need_otp = bool(payment_response.get('data', {}).get('otp_hash'))
+        job.status = MultibankTransactionStatusEnum.pending
+        # Saved right away, a retry must confirm this payment instead of creating another one
+        job.save(update_fields=['transaction_id', 'need_otp', 'status', 'sapi_amount', 'creator_amount',
+                                'attempts', 'updated_at'])
+
+    @staticmethod
+    def confirm(job: MultibankTransaction):
+        confirm_response, confirm_sc = multibank_prod_app.confirm_payment(transaction_id=job.transaction_id)
+        check_response(confirm_response, confirm_sc)
+        if confirm_response.get('data', {}).get('status') != 'success':
+            raise PaymentRejected(str(confirm_response))
+        settle_paid(job)
+
+    def process(self, job: MultibankTransaction):
+        job.attempts += 1
+        try:
+            if not job.transaction_id:
+                self.create(job)
+            if job.need_otp:
+                MultibankTransaction.objects.filter(pk=job.pk).update(locked_at=None)
+                metrics.increment('payment.need_otp')
+            else:
+                self.confirm(job)
+                metrics.increment('payment.paid', type=job.transaction_type)
+                metrics.observe('payment.latency', (now() - job.created_at).total_seconds())
+        except PaymentOutcomeUnknown as exc:
+            metrics.increment('payment.outcome_unknown', type=job.transaction_type)
+            self.fail(job, str(exc))
+        except UpstreamUnavailable as exc:
+            self.retry(job, exc.reason)
+        except APIValidation as exc:
+            if exc.status_code >= 500:
+                self.retry(job, str(exc.detail))
+            else:
+                self.fail(job, str(exc.detail))
+        except PaymentRejected as exc:
+            self.fail(job, str(exc))
+        push_payment_state(job)
+
+    def fail(self, job: MultibankTransaction, error: str):
+        job.status = MultibankTransactionStatusEnum.failed
+        MultibankTransaction.objects.filter(pk=job.pk).update(
+            status=job.status, attempts=job.attempts, locked_at=None, next_attempt_at=None, last_error=error
+        )
+        metrics.increment('payment.failed', type=job.transaction_type)
+
+    def retry(self, job: MultibankTransaction, error: str):
+        if job.attempts >= self.max_attempts:
+            return self.fail(job, error)
+        # Nothing was created upstream yet, payment goes back to `new`
+        job.status = MultibankTransactionStatusEnum.pending if job.transaction_id else MultibankTransactionStatusEnum.new
+        MultibankTransaction.objects.filter(pk=job.pk).update(
+            status=job.status, attempts=job.attempts, locked_at=None, last_error=error,
+            next_attempt_at=now() + timedelta(seconds=backoff_delay(job.attempts, *self.backoff))
+        )
+        metrics.increment('payment.retried', type=job.transaction_type)
+
+    def tick(self):
+        # Payments of a crashed worker stay locked, give them back to the queue unless they are out of attempts
+        with db_transaction.atomic():
+            stale = list(
+                MultibankTransaction.objects
+                .select_for_update(skip_locked=True)
+                .filter(status__in=[MultibankTransactionStatusEnum.new, MultibankTransactionStatusEnum.pending],
+                        locked_at__lt=now() - self.lock_timeout)
+                .only('id', 'status', 'attempts', 'transaction_type', 'user_id', 'need_otp', 'create_sent_at',
+                      'transaction_id')
+            )
+            exhausted = [job for job in stale if job.attempts + 1 >= self.max_attempts]
+            for job in exhausted:
+                job.attempts += 1
+                if job.create_sent_at and not job.transaction_id:
+                    metrics.increment('payment.outcome_unknown', type=job.transaction_type)
+                self.fail(job, f'worker stopped while processing it, {job.attempts} attempts made')
+            requeued = (
+                MultibankTransaction.objects
+                .filter(pk__in=[job.pk for job in stale if job not in exhausted])
+                .update(locked_at=None, attempts=F('attempts') + 1)
+            )
+        for job in exhausted:
+            push_payment_state(job)
+        if requeued:
+            metrics.increment('payment.requeued', requeued)
+        # Idempotency keys of payment requests are not needed after they expire
+        IdempotencyKey.objects.filter(expires_at__lt=now()).delete()
+
+        depth = dict(
+            MultibankTransaction.objects
+            .filter(status__in=[MultibankTransactionStatusEnum.new, MultibankTransactionStatusEnum.pending],
+                    locked_at__isnull=True, need_otp=False, next_attempt_at__isnull=False)
+            .values_list('status')
+            .annotate(count=Count('id'))
+        )
+        for status in (MultibankTransactionStatusEnum.new, MultibankTransactionStatusEnum.pending):
+            metrics.gauge('payment.queue_depth', depth.get(status, 0), status=status)
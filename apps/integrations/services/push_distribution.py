@@ -0,0 +1,191 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils.timezone import now, timedelta
+from fcm_django.models import FCMDevice
+
+from apps.authentication.models import NotificationDistribution, NotifDisStatus, NotifDisPlatformType, User
+from apps.chat.partitions import ensure_partitions
+from apps.files.utils import delete_abandoned_uploads
+from apps.integrations.api_integrations.firebase import fcm_app, INVALID_TOKEN_ERRORS
+from config.core.metrics import metrics
+from config.core.pg_notify import notify
+from config.core.workers import QueueWorker
+
+DISTRIBUTION_CHANNEL = 'notification_distributions'
+SCHEDULER_CHANNEL = 'notification_schedule'
+
+
+def audience(user_type: str):
+    if user_type == 'creators':
+        return User.objects.filter(is_creator=True)
+    if user_type == 'users':
+        return User.objects.filter(is_creator=False)
+    return User.objects.all()
+
+
+def queue_distribution(distribution: NotificationDistribution) -> str | None:
+    """
+    Hand published distribution to the distributor, or to the scheduler when sending_date is in the future;
+    instance is not saved
+    return: channel to notify after the distribution is saved, None for drafts
+    """
+    if distribution.is_draft:
+        return None
+    distribution.status = NotifDisStatus.waiting
+    if distribution.sending_date and distribution.sending_date > now():
+        distribution.queued_at = None
+        return SCHEDULER_CHANNEL
+    distribution.queued_at = now()
+    return DISTRIBUTION_CHANNEL
+
+
+class DistributionWorker(QueueWorker):
+    """
+    Sends push distributions outside of admin's request: streams active device tokens of the audience
+    in batches of FCM_INTEGRATION_SETTINGS['BATCH_SIZE'], sends every batch as a concurrent multicast and records
+    progress after each one, so a crashed distribution resumes from `last_device_id` instead of starting over.
+    Status moves waiting -> sending -> sent.
+    """
+    name = 'notification_distributor'
+    channel = DISTRIBUTION_CHANNEL
+
+    def __init__(self, concurrency: int = 1):
+        super().__init__(concurrency)
+        self.batch_size = settings.FCM_INTEGRATION_SETTINGS['BATCH_SIZE']
+        self.lock_timeout = timedelta(minutes=5)
+
+    def claim(self, limit):
+        with transaction.atomic():
+            distributions = list(
+                NotificationDistribution.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=NotifDisStatus.waiting, is_draft=False, queued_at__isnull=False)
+                .order_by('queued_at')[:limit]
+            )
+            if distributions:
+                NotificationDistribution.objects.filter(pk__in=[item.pk for item in distributions]).update(
+                    status=NotifDisStatus.sending, locked_at=now(), started_at=now()
+                )
+        return distributions
+
+    def devices(self, distribution: NotificationDistribution):
+        """
+        return: iterator of (device id, token) batches of active devices of the audience, in id order
+        """
+        devices = (
+            FCMDevice.objects
+            .filter(active=True, user__in=audience(distribution.user_type))
+            .filter(Q(id__gt=distribution.last_device_id) if distribution.last_device_id else Q())
+            .order_by('id')
+            .values_list('id', 'registration_id')
+            .iterator(chunk_size=self.batch_size)
+        )
+        batch = []
+        for device in devices:
+            batch.append(device)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def send_batch(self, distribution: NotificationDistribution, batch: list):
+        tokens = [token for _device_id, token in batch]
+        with metrics.timer('push.batch_latency'):
+            errors = fcm_app.send_multicast(tokens, distribution.title_ru, distribution.text_ru)
+
+        failures = Counter(error for error in errors if error)
+        invalid = [token for token, error in zip(tokens, errors) if error in INVALID_TOKEN_ERRORS]
+        if invalid:
+            FCMDevice.objects.filter(registration_id__in=invalid).update(active=False)
+        for code, count in failures.items():
+            distribution.failures[code] = distribution.failures.get(code, 0) + count
+
+        failed = sum(failures.values())
+        distribution.last_device_id = batch[-1][0]
+        NotificationDistribution.objects.filter(pk=distribution.pk).update(
+            sent_count=F('sent_count') + len(tokens) - failed,
+            failed_count=F('failed_count') + failed,
+            failures=distribution.failures,
+            last_device_id=distribution.last_device_id,
+            locked_at=now(),
+        )
+        metrics.increment('push.sent', len(tokens) - failed)
+        metrics.increment('push.failed', failed)
+
+    def process(self, distribution: NotificationDistribution):
+        if NotifDisPlatformType.push_notification in distribution.types:
+            for batch in self.devices(distribution):
+                if self._stopped.is_set():
+                    # Left in `sending`, tick() gives it back to the queue and it resumes from last_device_id
+                    return
+                self.send_batch(distribution, batch)
+        NotificationDistribution.objects.filter(pk=distribution.pk).update(
+            status=NotifDisStatus.sent, locked_at=None, finished_at=now()
+        )
+        metrics.increment('push.distributions')
+
+    def tick(self):
+        # Distributions of a crashed worker stay in `sending`, give them back to the queue
+        requeued = (
+            NotificationDistribution.objects
+            .filter(status=NotifDisStatus.sending, locked_at__lt=now() - self.lock_timeout)
+            .update(status=NotifDisStatus.waiting, locked_at=None)
+        )
+        if requeued:
+            metrics.increment('push.requeued', requeued)
+
+
+class NotificationScheduler(QueueWorker):
+    """
+    Hands distributions to the distributor when their sending_date comes; due ones are claimed with
+    SKIP LOCKED, so replicas do not queue the same distribution twice. Sleeps until the nearest sending_date
+    (or until an admin schedules a distribution) instead of polling. Its tick() also does time-based housekeeping
+    of other apps, every step of it is safe to run on several replicas at once.
+    """
+    name = 'notification_scheduler'
+    channel = SCHEDULER_CHANNEL
+    max_sleep = 300.0
+
+    def __init__(self):
+        super().__init__(concurrency=1)
+
+    @staticmethod
+    def scheduled():
+        return NotificationDistribution.objects.filter(
+            status=NotifDisStatus.waiting, is_draft=False, queued_at__isnull=True, sending_date__isnull=False
+        )
+
+    def claim(self, limit):
+        with transaction.atomic():
+            due = list(
+                self.scheduled()
+                .select_for_update(skip_locked=True)
+                .filter(sending_date__lte=now())
+                .order_by('sending_date')
+                .values_list('pk', flat=True)[:100]
+            )
+            if due:
+                NotificationDistribution.objects.filter(pk__in=due).update(queued_at=now())
+                notify(DISTRIBUTION_CHANNEL)
+        if due:
+            metrics.increment('push.scheduled', len(due))
+        # Nothing to process here, the distributor takes it from now on
+        return []
+
+    def tick(self):
+        created = ensure_partitions()
+        if created:
+            metrics.increment('chat.partitions_created', len(created))
+        deleted = delete_abandoned_uploads()
+        if deleted:
+            metrics.increment('files.abandoned_uploads', deleted)
+
+    def next_timeout(self) -> float:
+        next_date = self.scheduled().aggregate(next_date=Min('sending_date'))['next_date']
+        if next_date is None:
+            return self.max_sleep
+        return min(max((next_date - now()).total_seconds(), 0.0), self.max_sleep)
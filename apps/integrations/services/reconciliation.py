@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction as db_transaction
+from django.db.models import Q
+from django.utils.timezone import now, timedelta
+
+from apps.integrations.api_integrations.multibank import multibank_prod_app
+from apps.integrations.models import MultibankTransaction, MultibankTransactionStatusEnum
+from apps.integrations.services.multibank import credit_paid
+from config.core.metrics import metrics
+
+PAID_STATUSES = frozenset({'success'})
+FAILED_STATUSES = frozenset({'cancelled', 'canceled', 'error', 'failed', 'rejected', 'reversed'})
+
+
+class PaymentReconciler:
+    """
+    Settles payments the worker does not own any more (waiting for OTP, or stuck in `new`/`pending` without
+    a queued attempt): pages through them by (status, created_at), asks Multibank for their state in parallel
+    and applies the results in bulk. With dry_run nothing is written, only the outcome is counted.
+    """
+
+    def __init__(self, concurrency: int = 8, page_size: int = 200, min_age: timedelta = timedelta(minutes=15),
+                 expire_after: timedelta = timedelta(days=1), dry_run: bool = False):
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.min_age = min_age
+        self.expire_after = expire_after
+        self.dry_run = dry_run
+        self.stats = {'checked': 0, 'paid': 0, 'failed': 0, 'unchanged': 0, 'errors': 0}
+
+    def queryset(self):
+        return (
+            MultibankTransaction.objects
+            .filter(Q(need_otp=True) | Q(next_attempt_at__isnull=True),
+                    status__in=[MultibankTransactionStatusEnum.new, MultibankTransactionStatusEnum.pending],
+                    locked_at__isnull=True, created_at__lt=now() - self.min_age)
+            .order_by('created_at', 'id')
+        )
+
+    def pages(self):
+        """
+        Keyset pagination over (created_at, id), rows updated by a page do not shift the next one
+        """
+        queryset = self.queryset()
+        page = list(queryset[:self.page_size])
+        while page:
+            yield page
+            last = page[-1]
+            page = list(
+                queryset.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+                [:self.page_size]
+            )
+
+    def upstream_status(self, transaction: MultibankTransaction) -> tuple[str | None, str | None]:
+        """
+        return: (new status or None to keep it, error)
+        """
+        expired = transaction.created_at < now() - self.expire_after
+        if not transaction.transaction_id:
+            return (MultibankTransactionStatusEnum.failed, 'payment was not created, expired') if expired else \
+                (None, None)
+
+        close_old_connections()
+        try:
+            response, status_code = multibank_prod_app.payment_information(transaction_id=transaction.transaction_id)
+        finally:
+            close_old_connections()
+        if status_code == 404:
+            return MultibankTransactionStatusEnum.failed, 'payment not found'
+        if not str(status_code).startswith('2'):
+            raise ValueError(str(response))
+        upstream = response.get('data', {}).get('status')
+        if upstream in PAID_STATUSES:
+            return MultibankTransactionStatusEnum.paid, None
+        if upstream in FAILED_STATUSES:
+            return MultibankTransactionStatusEnum.failed, f'payment {upstream}'
+        if expired:
+            return MultibankTransactionStatusEnum.failed, f'payment {upstream}, expired'
+        return None, None
+
+    def check(self, transaction: MultibankTransaction):
+        try:
+            return transaction, *self.upstream_status(transaction)
+        except Exception as exc:
+            metrics.increment('reconcile.errors')
+            return transaction, None, repr(exc)
+
+    def apply(self, results: list):
+        changed = {transaction.pk: (status, error) for transaction, status, error in results if status}
+        self.stats['errors'] += sum(1 for _transaction, status, error in results if not status and error)
+        self.stats['unchanged'] += len(results) - len(changed)
+        if not changed or self.dry_run:
+            for status, _error in changed.values():
+                self.stats[status] += 1
+            return
+
+        with db_transaction.atomic():
+            # Rows claimed or settled meanwhile are skipped, they will come back in the next run if still stuck
+            transactions = list(
+                self.queryset()
+                .select_for_update(skip_locked=True, of=('self',))
+                .filter(pk__in=changed.keys())
+            )
+            for transaction in transactions:
+                transaction.status, transaction.last_error = changed[transaction.pk]
+                transaction.next_attempt_at = None
+                transaction.updated_at = now()
+                self.stats[transaction.status] += 1
+                metrics.increment('reconcile.updated', status=transaction.status)
+            MultibankTransaction.objects.bulk_update(transactions, ['status', 'last_error', 'next_attempt_at',
+                                                                   'updated_at'])
+            credit_paid([item for item in transactions if item.status == MultibankTransactionStatusEnum.paid])
+
+    def run(self) -> dict:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='reconcile') as executor:
+            for page in self.pages():
+                self.apply(list(executor.map(self.check, page)))
+                self.stats['checked'] += len(page)
+                metrics.increment('reconcile.checked', len(page))
+        elapsed = time.perf_counter() - started
+        self.stats['per_second'] = round(self.stats['checked'] / elapsed, 1) if elapsed else 0
+        metrics.gauge('reconcile.throughput', self.stats['per_second'])
+        metrics.log('reconcile')
+        return self.stats
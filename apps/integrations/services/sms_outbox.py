@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils.timezone import now, timedelta
+
+from apps.integrations.api_integrations.sms import sms_app
+from apps.integrations.models import SMSOutbox, SMSOutboxStatusEnum, PurposeEnum
+from apps.integrations.services.sms_services import SMS_OUTBOX_CHANNEL, sms_payload
+from config.core.metrics import metrics
+from config.core.workers import QueueWorker, backoff_delay
+
+
+def is_accepted(response: dict) -> bool:
+    return 'detail' not in response and response.get('status') != 'error'
+
+
+class SMSDispatcher(QueueWorker):
+    """
+    Drains SMSOutbox by priority (login OTPs first) with bounded concurrency and retries
+    """
+    name = 'sms_dispatcher'
+    channel = SMS_OUTBOX_CHANNEL
+
+    def __init__(self, concurrency: int = None):
+        config = settings.SMS_INTEGRATION_SETTINGS
+        super().__init__(concurrency or config['DISPATCHER_CONCURRENCY'])
+        self.max_attempts = config['DISPATCHER_MAX_ATTEMPTS']
+        self.backoff = (config['DISPATCHER_BACKOFF_BASE'], config['DISPATCHER_BACKOFF_MAX'])
+        # OTP is valid for 10 minutes, there is no point to deliver it later
+        self.message_ttl = timedelta(minutes=10)
+        self.lock_timeout = timedelta(minutes=2)
+
+    def claim(self, limit):
+        with transaction.atomic():
+            jobs = list(
+                SMSOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=SMSOutboxStatusEnum.queued, next_attempt_at__lte=now())
+                .order_by('priority', 'next_attempt_at')[:limit]
+            )
+            if jobs:
+                SMSOutbox.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                    status=SMSOutboxStatusEnum.sending, locked_at=now()
+                )
+        return jobs
+
+    def process(self, job: SMSOutbox):
+        outbox = SMSOutbox.objects.filter(pk=job.pk)
+        attempts = job.attempts + 1
+        if job.created_at < now() - self.message_ttl:
+            outbox.update(status=SMSOutboxStatusEnum.failed, last_error='expired', locked_at=None)
+            metrics.increment('sms.expired', purpose=job.purpose)
+            return
+
+        try:
+            with metrics.timer('sms.send_latency', purpose=job.purpose):
+                response = sms_app.send_sms(data=sms_payload(job.phone_number, job.message))
+            error = None if is_accepted(response) else str(response)
+        except Exception as exc:
+            error = repr(exc)
+
+        if error is None:
+            sent_at = now()
+            outbox.update(status=SMSOutboxStatusEnum.sent, sent_at=sent_at, attempts=attempts, locked_at=None,
+                          last_error=None)
+            metrics.increment('sms.sent', purpose=job.purpose)
+            metrics.observe('sms.queue_latency', (sent_at - job.created_at).total_seconds(), purpose=job.purpose)
+        elif attempts >= self.max_attempts:
+            outbox.update(status=SMSOutboxStatusEnum.failed, attempts=attempts, locked_at=None, last_error=error)
+            metrics.increment('sms.failed', purpose=job.purpose)
+        else:
+            outbox.update(status=SMSOutboxStatusEnum.queued, attempts=attempts, locked_at=None, last_error=error,
+                          next_attempt_at=now() + timedelta(seconds=backoff_delay(attempts, *self.backoff)))
+            metrics.increment('sms.retried', purpose=job.purpose)
+
+    def tick(self):
+        # Jobs of a crashed dispatcher stay in `sending`, give them back to the queue
+        requeued = (
+            SMSOutbox.objects
+            .filter(status=SMSOutboxStatusEnum.sending, locked_at__lt=now() - self.lock_timeout)
+            .update(status=SMSOutboxStatusEnum.queued, locked_at=None, attempts=F('attempts') + 1)
+        )
+        if requeued:
+            metrics.increment('sms.requeued', requeued)
+
+        depth = dict(
+            SMSOutbox.objects
+            .filter(status=SMSOutboxStatusEnum.queued)
+            .values_list('purpose')
+            .annotate(count=Count('id'))
+        )
+        for purpose in PurposeEnum.values:
+            metrics.gauge('sms.queue_depth', depth.get(purpose, 0), purpose=purpose)
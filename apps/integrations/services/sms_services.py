@@ -1,13 +1,19 @@
 import re
 import random
 
+from django.conf import settings
+from django.db import transaction
 from django.utils.timezone import timedelta, now
 from django.utils.translation import gettext_lazy as _
 from rest_framework import status
 
 from apps.integrations.api_integrations.sms import sms_app
-from apps.integrations.models import SMSConfirmation, sms_message_purpose_tool
+from apps.integrations.models import SMSConfirmation, SMSOutbox, sms_message_purpose_tool, sms_purpose_priority
 from config.core.api_exceptions import APIValidation
+from config.core.pg_notify import notify
+from config.core.rate_limit import hit, is_shared, raise_rate_limited
+
+SMS_OUTBOX_CHANNEL = 'sms_outbox'
 
 
 def only_phone_numbers(phone):
@@ -25,21 +31,54 @@ def generate_sms_code() -> str:
     return str(random.randint(100000, 999999))
 
 
+def sms_cooldown(key: str, confirmations) -> float:
+    """
+    One SMS a minute (RATE_LIMITS['RULES']['sms_cooldown']) per key. The limiter counts it when its store is
+    shared by all workers; a per-process one would give every worker a minute of its own, so the last
+    of `confirmations` is checked in the database instead
+    return: seconds until another SMS may be requested, 0 when it may be now
+    """
+    if is_shared():
+        allowed, retry_after = hit('sms_cooldown', key)
+        return 0.0 if allowed else retry_after
+    period = settings.RATE_LIMITS['RULES']['sms_cooldown'][2]
+    requested_at = confirmations.order_by('-requested_at').values_list('requested_at', flat=True).first()
+    if requested_at is None:
+        return 0.0
+    return max(0.0, (requested_at + timedelta(seconds=period) - now()).total_seconds())
+
+
 def can_request_sms(user, purpose):
-    last_request = SMSConfirmation.objects.filter(user=user, purpose=purpose).order_by('-requested_at').first()
-    if last_request and last_request.requested_at > now() - timedelta(minutes=1):  # 1-minute cooldown
+    if sms_cooldown(f'user:{user.pk}:{purpose}', SMSConfirmation.objects.filter(user=user, purpose=purpose)):
         raise APIValidation(_('Пожалуйста, подождите минуту, прежде чем запросить еще один код.'), status_code=400)
     return True
 
 
-def send_sms(phone_number: str, purpose, code: str = generate_sms_code()):
-    message = sms_message_purpose_tool(purpose, code)
-    phone_number = only_phone_numbers(phone_number)
-    return sms_app.send_sms(data={
+def sms_payload(phone_number: str, message: str) -> dict:
+    return {
         'mobile_phone': phone_number,
         'message': message,
         'from': '4546'
-    })
+    }
+
+
+def send_sms(phone_number: str, purpose, code: str = generate_sms_code()):
+    message = sms_message_purpose_tool(purpose, code)
+    phone_number = only_phone_numbers(phone_number)
+    return sms_app.send_sms(data=sms_payload(phone_number, message))
+
+
+def enqueue_sms(phone_number: str, purpose, code: str):
+    """
+    Put SMS into outbox, it is sent by `manage.py run_sms_dispatcher` after the transaction commits
+    """
+    SMSOutbox.objects.create(
+        phone_number=only_phone_numbers(phone_number),
+        message=sms_message_purpose_tool(purpose, code),
+        purpose=purpose,
+        priority=sms_purpose_priority.get(purpose, max(sms_purpose_priority.values()) + 1),
+    )
+    notify(SMS_OUTBOX_CHANNEL)
 
 
 def sms_confirmation_open(user, purpose):
@@ -47,29 +86,35 @@ def sms_confirmation_open(user, purpose):
 
     code = generate_sms_code()
     expires_at = now() + timedelta(minutes=10)
-    SMSConfirmation.objects.update_or_create(
-        user=user,
-        purpose=purpose,
-        is_used=False,
-        defaults={'code': code, 'expires_at': expires_at, 'requested_at': now(),
-                  'phone_number': only_phone_numbers(user.phone_number)}
-    )
-    send_sms(user.phone_number, purpose, code)
+    with transaction.atomic():
+        SMSConfirmation.objects.update_or_create(
+            user=user,
+            purpose=purpose,
+            is_used=False,
+            defaults={'code': code, 'expires_at': expires_at, 'requested_at': now(),
+                      'phone_number': only_phone_numbers(user.phone_number)}
+        )
+        enqueue_sms(user.phone_number, purpose, code)
     return True
 
 
 def sms_confirmation_open_phone_number(phone_number, purpose):
     phone_number = only_phone_numbers(phone_number)
+    retry_after = sms_cooldown(f'phone:{phone_number}:{purpose}',
+                               SMSConfirmation.objects.filter(phone_number=phone_number, purpose=purpose))
+    if retry_after:
+        raise_rate_limited(retry_after)
 
     code = generate_sms_code()
     expires_at = now() + timedelta(minutes=10)
-    SMSConfirmation.objects.update_or_create(
-        phone_number=phone_number,
-        purpose=purpose,
-        is_used=False,
-        defaults={'code': code, 'expires_at': expires_at, 'requested_at': now()}
-    )
-    send_sms(phone_number, purpose, code)
+    with transaction.atomic():
+        SMSConfirmation.objects.update_or_create(
+            phone_number=phone_number,
+            purpose=purpose,
+            is_used=False,
+            defaults={'code': code, 'expires_at': expires_at, 'requested_at': now()}
+        )
+        enqueue_sms(phone_number, purpose, code)
     return True
 
 
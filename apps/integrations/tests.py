@@ -1,3 +1,261 @@
+import time
+import uuid
+from unittest import mock
+
 from django.test import TestCase
+from django.utils.timezone import now, timedelta
+from fcm_django.models import FCMDevice
+
+from apps.authentication.models import Card, Donation, NotificationDistribution, NotifDisStatus, User
+from apps.integrations.api_integrations.firebase import fcm_app, UNAVAILABLE_ERROR
+from apps.integrations.api_integrations.multibank import multibank_prod_app
+from apps.integrations.fake_servers.fcm import FakeFCMServer
+from apps.integrations.fake_servers.multibank import FakeMultibankServer
+from apps.integrations.models import MultibankTransaction, MultibankTransactionStatusEnum
+from apps.integrations.services.multibank import create_payment_intent
+from apps.integrations.services.payment_outbox import PaymentWorker
+from apps.integrations.services.push_distribution import DistributionWorker
+from config.core.metrics import metrics
+from config.core.request import UpstreamUnavailable
+from config.core.token_cache import CachedToken
+
+
+class PaymentWorkerTests(TestCase):
+    """
+    MultibankTransaction state machine against FakeMultibankServer; jobs are claimed and processed
+    in the test thread, so they see the data of the test transaction
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeMultibankServer().start()
+        cls.base_url = mock.patch.object(multibank_prod_app, 'base_url', cls.server.base_url)
+        cls.base_url.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.base_url.stop()
+        cls.server.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create(phone_number='998900000001', username='creator', is_creator=True,
+                                          multibank_verified=True, pinfl='1' * 14, multibank_account='2' * 20)
+        cls.donator = User.objects.create(phone_number='998900000002', username='donator')
+        cls.card = Card.objects.create(user=cls.donator, number='8600123412341234', expiration='12/30',
+                                       token='card-token', is_active=True)
+
+    def setUp(self):
+        self.server.stats.clear()
+        self.server.payment_status = 'success'
+        self.worker = PaymentWorker(concurrency=1)
+
+    def donate(self, amount: int = 10000) -> MultibankTransaction:
+        donation = Donation.objects.create(amount=amount, card=self.card, donator=self.donator, creator=self.creator)
+        return create_payment_intent(self.donator, self.creator, self.card, amount, 'donation', donation=donation)
+
+    def run_worker(self) -> list:
+        jobs = self.worker.claim(10)
+        for job in jobs:
+            self.worker.process(job)
+        return jobs
+
+    def state(self, payment: MultibankTransaction) -> MultibankTransaction:
+        return MultibankTransaction.objects.get(pk=payment.pk)
+
+    def test_new_payment_is_created_and_confirmed(self):
+        payment = self.donate()
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.new)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_worker()
+
+        payment = self.state(payment)
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.paid)
+        self.assertIsNotNone(payment.transaction_id)
+        self.assertEqual((payment.attempts, payment.locked_at, payment.next_attempt_at), (1, None, None))
+        self.assertEqual((self.server.stats['payment'], self.server.stats['confirm']), (1, 1))
+        # Paid payments are not claimed again
+        self.assertEqual(self.run_worker(), [])
+
+    def test_rejected_payment_fails(self):
+        self.server.payment_status = 'failed'
+        payment = self.donate()
+        self.run_worker()
+
+        payment = self.state(payment)
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.failed)
+        self.assertIsNone(payment.next_attempt_at)
+
+    def test_unavailable_upstream_is_retried_with_backoff(self):
+        payment = self.donate()
+        with mock.patch.object(multibank_prod_app, 'create_payment',
+                               side_effect=UpstreamUnavailable('multibank', 'circuit_open')):
+            self.run_worker()
+
+        payment = self.state(payment)
+        # Not sent, so it starts over as new after the backoff
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.new)
+        self.assertEqual(payment.attempts, 1)
+        self.assertIsNone(payment.create_sent_at)
+        self.assertIsNone(payment.locked_at)
+        self.assertGreater(payment.next_attempt_at, now())
+        self.assertEqual(self.run_worker(), [])
+
+        MultibankTransaction.objects.filter(pk=payment.pk).update(next_attempt_at=now())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_worker()
+        self.assertEqual(self.state(payment).status, MultibankTransactionStatusEnum.paid)
+        self.assertEqual(self.state(payment).attempts, 2)
+
+    def test_confirmation_error_keeps_the_created_payment(self):
+        payment = self.donate()
+        with mock.patch.object(multibank_prod_app, 'confirm_payment', return_value=({'detail': 'bad gateway'}, 502)):
+            self.run_worker()
+
+        payment = self.state(payment)
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.pending)
+        self.assertIsNotNone(payment.transaction_id)
+
+        MultibankTransaction.objects.filter(pk=payment.pk).update(next_attempt_at=now())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_worker()
+        self.assertEqual(self.state(payment).status, MultibankTransactionStatusEnum.paid)
+        # Confirmed the payment created by the first attempt
+        self.assertEqual(self.server.stats['payment'], 1)
+
+    def test_payment_fails_after_max_attempts(self):
+        payment = self.donate()
+        MultibankTransaction.objects.filter(pk=payment.pk).update(attempts=self.worker.max_attempts - 1)
+        with mock.patch.object(multibank_prod_app, 'create_payment',
+                               side_effect=UpstreamUnavailable('multibank', 'circuit_open')):
+            self.run_worker()
+
+        payment = self.state(payment)
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.failed)
+        self.assertEqual(payment.attempts, self.worker.max_attempts)
+
+    def test_create_without_reply_is_outcome_unknown(self):
+        unknown = metrics.counters.get('payment.outcome_unknown{type=donation}', 0)
+        payment = self.donate()
+        with mock.patch.object(multibank_prod_app, 'create_payment',
+                               side_effect=UpstreamUnavailable('multibank', 'timeout')):
+            self.run_worker()
+
+        payment = self.state(payment)
+        self.assertEqual(payment.status, MultibankTransactionStatusEnum.failed)
+        self.assertIsNotNone(payment.create_sent_at)
+        self.assertIn('outcome unknown', payment.last_error)
+        self.assertEqual(metrics.counters['payment.outcome_unknown{type=donation}'], unknown + 1)
+
+    def test_requeued_payment_sent_before_is_not_created_again(self):
+        payment = self.donate()
+        MultibankTransaction.objects.filter(pk=payment.pk).update(create_sent_at=now())
+        with mock.patch.object(multibank_prod_app, 'create_payment') as create_payment:
+            self.run_worker()
+
+        create_payment.assert_not_called()
+        self.assertEqual(self.state(payment).status, MultibankTransactionStatusEnum.failed)
+
+    def test_tick_requeues_stale_payments_until_attempts_run_out(self):
+        stale, exhausted = self.donate(), self.donate()
+        locked_at = now() - self.worker.lock_timeout - timedelta(seconds=1)
+        MultibankTransaction.objects.filter(pk=stale.pk).update(
+            status=MultibankTransactionStatusEnum.pending, locked_at=locked_at, attempts=1
+        )
+        MultibankTransaction.objects.filter(pk=exhausted.pk).update(
+            status=MultibankTransactionStatusEnum.pending, locked_at=locked_at, attempts=self.worker.max_attempts - 1
+        )
+        self.worker.tick()
+
+        stale, exhausted = self.state(stale), self.state(exhausted)
+        self.assertEqual((stale.status, stale.locked_at, stale.attempts),
+                         (MultibankTransactionStatusEnum.pending, None, 2))
+        self.assertEqual((exhausted.status, exhausted.locked_at, exhausted.attempts),
+                         (MultibankTransactionStatusEnum.failed, None, self.worker.max_attempts))
+
+
+class DistributionWorkerTests(TestCase):
+    """
+    Push distributions against FakeFCMServer: devices are deactivated only for errors saying their token is dead
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeFCMServer().start()
+        cls.patches = [
+            mock.patch.object(fcm_app, 'base_url', cls.server.base_url),
+            mock.patch.object(fcm_app, 'cached_token', CachedToken(fetch=cls.fetch_token)),
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for patch in cls.patches:
+            patch.stop()
+        cls.server.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def fetch_token(cls):
+        token = uuid.uuid4().hex
+        cls.server.tokens.add(token)
+        return token, time.time() + 3600
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(phone_number=f'99890000001{index}', username=f'user{index}')
+                     for index in range(4)]
+        cls.devices = [FCMDevice.objects.create(user=user, registration_id=f'token-{user.pk}', type='android')
+                       for user in cls.users]
+
+    def setUp(self):
+        self.server.stats.clear()
+        self.server.delivered.clear()
+        self.server.unregistered.clear()
+        self.worker = DistributionWorker()
+
+    def distribute(self, text: str = 'text') -> NotificationDistribution:
+        distribution = NotificationDistribution.objects.create(
+            title_ru='title', text_ru=text, types=['push_notification'], queued_at=now()
+        )
+        for job in self.worker.claim(10):
+            self.worker.process(job)
+        return NotificationDistribution.objects.get(pk=distribution.pk)
+
+    def active(self) -> list:
+        return list(FCMDevice.objects.filter(active=True).order_by('id').values_list('registration_id', flat=True))
+
+    def test_unregistered_devices_are_deactivated(self):
+        dead = self.devices[1].registration_id
+        self.server.unregistered.add(dead)
+        distribution = self.distribute()
+
+        self.assertEqual(distribution.status, NotifDisStatus.sent)
+        self.assertEqual((distribution.sent_count, distribution.failed_count), (3, 1))
+        self.assertEqual(distribution.failures, {'UNREGISTERED': 1})
+        self.assertEqual(distribution.last_device_id, self.devices[-1].pk)
+        self.assertNotIn(dead, self.active())
+        self.assertEqual(len(self.active()), 3)
+
+    def test_payload_error_keeps_devices(self):
+        distribution = self.distribute(text='x' * (FakeFCMServer.MAX_NOTIFICATION_SIZE + 1))
+
+        self.assertEqual(distribution.status, NotifDisStatus.sent)
+        self.assertEqual((distribution.sent_count, distribution.failed_count), (0, 4))
+        self.assertEqual(distribution.failures, {'INVALID_ARGUMENT': 4})
+        self.assertEqual(len(self.active()), 4)
+
+    def test_batch_finishes_when_fcm_is_down(self):
+        down = FakeFCMServer().start()
+        down.stop()
+        with mock.patch.object(fcm_app, 'base_url', down.base_url):
+            distribution = self.distribute()
 
-# Create your tests here.
+        self.assertEqual(distribution.status, NotifDisStatus.sent)
+        self.assertEqual((distribution.sent_count, distribution.failed_count), (0, 4))
+        self.assertEqual(distribution.failures, {UNAVAILABLE_ERROR: 4})
+        self.assertEqual(len(self.active()), 4)
@@ -6,6 +6,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 
 from apps.chat.middleware import JWTAuthMiddleware
 from apps.chat.routing import websocket_urlpatterns
+from apps.integrations.routing import websocket_urlpatterns as integrations_websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -14,7 +15,7 @@ application = ProtocolTypeRouter({
     'http': get_asgi_application(),
     'websocket': JWTAuthMiddleware(
         URLRouter(
-            websocket_urlpatterns
+            websocket_urlpatterns + integrations_websocket_urlpatterns
         )
     ),
 })
@@ -0,0 +1,141 @@
+import asyncio
+import ssl
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+from config.core.metrics import metrics
+from config.core.request import HTTPClient, UpstreamUnavailable
+
+IDEMPOTENT_METHODS = frozenset({'HEAD', 'GET', 'OPTIONS', 'DELETE'})
+RETRY_STATUSES = (502, 503, 504)
+
+
+def _no_ssl_context() -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    context.set_ciphers('DEFAULT@SECLEVEL=1')
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def gather(*aws, limit: int = None) -> list:
+    """
+    Run upstream calls concurrently, at most `limit` at once; the first exception cancels the calls
+    still running and is raised
+    example: recipient, token = await gather(multibank_prod_async_app.get_receipient(...), sms_async_app.token())
+    """
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def run(aw):
+        if semaphore is None:
+            return await aw
+        async with semaphore:
+            return await aw
+
+    tasks = [asyncio.ensure_future(run(aw)) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+class AsyncHTTPClient:
+    """
+    Async counterpart of HTTPClient for ASGI views and consumers: one httpx.AsyncClient per event loop
+    shared by all integrations, same timeouts, retries, circuit breakers and metrics as the sync client
+    """
+    service = 'http'
+    timeout = None
+
+    _clients = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _timeout(timeout) -> httpx.Timeout:
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return httpx.Timeout(read, connect=connect)
+
+    @classmethod
+    def client_for(cls, verify: bool = True) -> httpx.AsyncClient:
+        """
+        return: shared client of the running loop, httpx clients can not be used across loops
+        """
+        loop = asyncio.get_running_loop()
+        clients = cls._clients.setdefault(loop, {})
+        client = clients.get(verify)
+        if client is None or client.is_closed:
+            config = settings.HTTP_CLIENT
+            limits = httpx.Limits(max_connections=config['POOL_MAXSIZE'],
+                                  max_keepalive_connections=config['POOL_MAXSIZE'])
+            transport = httpx.AsyncHTTPTransport(verify=True if verify else _no_ssl_context(), limits=limits,
+                                                 retries=config['RETRIES'])
+            client = clients[verify] = httpx.AsyncClient(transport=transport, timeout=cls._timeout(config['TIMEOUT']))
+        return client
+
+    @classmethod
+    async def aclose(cls):
+        for client in cls._clients.pop(asyncio.get_running_loop(), {}).values():
+            await client.aclose()
+
+    async def _send_request(self, method: str, url: str, verify: bool, **kwargs) -> httpx.Response:
+        breaker = HTTPClient.breaker_for(urlsplit(url).netloc)
+        if not breaker.allow():
+            metrics.increment('http.requests', service=self.service, status='circuit_open')
+            raise UpstreamUnavailable(self.service, 'circuit_open')
+
+        if kwargs.get('timeout') or self.timeout:
+            kwargs['timeout'] = self._timeout(kwargs.get('timeout') or self.timeout)
+        kwargs.pop('verify', None)
+        client = self.client_for(verify)
+        # Transport retries connection errors, read errors and 5xx are retried for idempotent methods only
+        retries = settings.HTTP_CLIENT['RETRIES'] if method.upper() in IDEMPOTENT_METHODS else 0
+        started = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except (httpx.ReadError, httpx.ReadTimeout):
+                    if attempt == retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == retries:
+                        break
+                await asyncio.sleep(settings.HTTP_CLIENT['BACKOFF_FACTOR'] * 2 ** attempt)
+        except httpx.TransportError as exc:
+            breaker.record_failure()
+            reason = 'timeout' if isinstance(exc, httpx.TimeoutException) else 'connection_error'
+            metrics.increment('http.requests', service=self.service, status=reason)
+            raise UpstreamUnavailable(self.service, reason) from exc
+        except httpx.HTTPError:
+            # TooManyRedirects, DecodingError: a half-open breaker needs an outcome. A cancelled call
+            # (client gone, task cancelled) says nothing of the upstream, an abandoned probe is replaced
+            # after reset_timeout
+            breaker.record_failure()
+            metrics.increment('http.requests', service=self.service, status='error')
+            raise
+        finally:
+            metrics.observe('http.latency', time.perf_counter() - started, service=self.service)
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        metrics.increment('http.requests', service=self.service, status=response.status_code)
+        return response
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._send_request(method, url, verify=True, **kwargs)
+
+    async def _no_ssl_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._send_request(method, url, verify=False, **kwargs)
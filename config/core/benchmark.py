@@ -0,0 +1,41 @@
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(samples: list) -> dict:
+    """
+    return: latency percentiles in milliseconds of samples given in seconds
+    """
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def run_timed(func, count: int, concurrency: int = 1) -> tuple[list, float]:
+    """
+    Call func `count` times from `concurrency` threads
+    return: (per-call latencies, total wall time) in seconds
+    """
+
+    def timed(_):
+        started = perf_counter()
+        func()
+        return perf_counter() - started
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(timed, range(count)))
+    return samples, perf_counter() - started
@@ -0,0 +1,340 @@
+import asyncio
+import binascii
+import logging
+import random
+import string
+import time
+import weakref
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, get_channel_layer
+from redis import asyncio as aioredis
+
+from config.core.metrics import metrics
+
+logger = logging.getLogger()
+
+# Seconds a blocking pop waits, below socket_timeout of redis clients (5 by default)
+BLOCK_TIMEOUT = 2
+# Keys per SCAN / DEL round trip of flush()
+FLUSH_BATCH = 500
+
+
+class ShardedRedisChannelLayer(BaseChannelLayer):
+    """
+    Channel layer over several Redis-protocol hosts, keys are sharded by group/channel name (crc32).
+    Every process reads one inbox list and keeps group membership of its own channels, Redis only knows
+    which processes are in a group; so group_send pushes one message per process, pipelined per shard,
+    and the process fans it out to its sockets.
+    Messages expire `expiry` seconds after sending. Capacity is checked per channel in the receiving process
+    (`capacity`, `channel_capacity`; messages to a full channel are dropped) and per inbox in Redis
+    (`inbox_capacity`; send() raises ChannelFull).
+    """
+    extensions = ['groups', 'flush']
+
+    def __init__(self, hosts: list = None, prefix: str = 'asgi', expiry: int = 60, group_expiry: int = 86400,
+                 capacity: int = 100, channel_capacity: dict = None, inbox_capacity: int = 10000,
+                 read_batch: int = 100):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.hosts = hosts or ['redis://localhost:6379/0']
+        self.prefix = prefix
+        self.group_expiry = group_expiry
+        self.inbox_capacity = inbox_capacity
+        self.read_batch = read_batch
+        self.client_prefix = ''.join(random.choices(string.ascii_letters, k=12))
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> client per host
+        self._queues = {}  # channel of this process -> asyncio.Queue of (expires_at, message)
+        self._groups = {}  # group -> {channel of this process: joined at}
+        self._reader = None
+        self._closing = False
+
+    # Routing
+
+    def shard(self, name: str) -> int:
+        return binascii.crc32(name.encode()) % len(self.hosts)
+
+    @staticmethod
+    def process_of(channel: str) -> str:
+        # specific.<process>!<socket>
+        return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+    def inbox_key(self, process: str) -> str:
+        return f'{self.prefix}:inbox:{process}'
+
+    def channel_key(self, channel: str) -> str:
+        return f'{self.prefix}:channel:{channel}'
+
+    def group_key(self, group: str) -> str:
+        return f'{self.prefix}:group:{group}'
+
+    def is_local(self, channel: str) -> bool:
+        return '!' in channel and self.process_of(channel) == self.client_prefix
+
+    def member(self, channel: str) -> str:
+        """
+        return: group member stored in Redis, the process for channels of this process
+        """
+        return '!' + self.client_prefix if self.is_local(channel) else channel
+
+    def pack(self, group: str | None, channels: list, message: dict) -> bytes:
+        return msgpack.packb([time.time() + self.expiry, group, channels, message], use_bin_type=True)
+
+    def destination(self, channel: str) -> tuple[int, str, int]:
+        """
+        return: (shard, list key, capacity) of the list a message to channel is pushed to
+        """
+        if '!' in channel:
+            process = self.process_of(channel)
+            return self.shard(process), self.inbox_key(process), self.inbox_capacity
+        return self.shard(channel), self.channel_key(channel), self.get_capacity(channel)
+
+    # Connections
+
+    def connection(self, index: int) -> aioredis.Redis:
+        """
+        Clients are bound to the event loop; ones of a loop that ends (async_to_sync, asyncio.run) are closed
+        by close_loop_clients() or close() before it does, see group_send_sync
+        """
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            # RESP2, understood by any Redis-protocol server
+            clients = self._clients[loop] = [
+                aioredis.Redis.from_url(host, protocol=2) if isinstance(host, str) else
+                aioredis.Redis(**{'protocol': 2, **host})
+                for host in self.hosts
+            ]
+        return clients[index]
+
+    def has_loop_clients(self) -> bool:
+        return asyncio.get_running_loop() in self._clients
+
+    async def close_loop_clients(self):
+        clients = self._clients.pop(asyncio.get_running_loop(), None) or []
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+    async def _push(self, index: int, items: list) -> int:
+        """
+        Push (key, capacity, payload) items to lists of one shard, skipping lists at capacity;
+        two round trips whatever the number of items
+        return: number of pushed items
+        """
+        async with self.connection(index).pipeline(transaction=False) as pipe:
+            for key, _capacity, _payload in items:
+                pipe.llen(key)
+            lengths = await pipe.execute()
+            pushed = 0
+            for (key, capacity, payload), length in zip(items, lengths):
+                if length >= capacity:
+                    metrics.increment('channel_layer.full', target='inbox')
+                    continue
+                pipe.rpush(key, payload)
+                pipe.expire(key, self.expiry + 1)
+                pushed += 1
+            if pushed:
+                await pipe.execute()
+        return pushed
+
+    # Channel layer API
+
+    async def new_channel(self, prefix: str = 'specific') -> str:
+        channel = f"{prefix}.{self.client_prefix}!{''.join(random.choices(string.ascii_letters, k=12))}"
+        # Buffered from now on, messages may come before the consumer starts receiving
+        self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return channel
+
+    async def send(self, channel: str, message: dict):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        index, key, capacity = self.destination(channel)
+        if not await self._push(index, [(key, capacity, self.pack(None, [channel], message))]):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel: str) -> dict:
+        self.require_valid_channel_name(channel)
+        if '!' not in channel:
+            return await self._receive_shared(channel)
+        assert self.is_local(channel), 'channel was not created by this channel layer'
+
+        self._ensure_reader()
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        try:
+            while True:
+                expires_at, message = await queue.get()
+                if expires_at >= time.time():
+                    return message
+                metrics.increment('channel_layer.expired')
+        except asyncio.CancelledError:
+            # Consumer is gone, so are its buffered messages
+            self._queues.pop(channel, None)
+            raise
+
+    async def _receive_shared(self, channel: str) -> dict:
+        client = self.connection(self.shard(channel))
+        while True:
+            result = await client.blpop([self.channel_key(channel)], timeout=BLOCK_TIMEOUT)
+            if result is None:
+                continue
+            expires_at, _group, _channels, message = msgpack.unpackb(result[1], raw=False)
+            if expires_at >= time.time():
+                return message
+            metrics.increment('channel_layer.expired')
+
+    def _ensure_reader(self):
+        loop = asyncio.get_running_loop()
+        if self._reader is None or self._reader.done() or self._reader.get_loop() is not loop:
+            self._reader = loop.create_task(self._read_inbox())
+
+    async def _read_inbox(self):
+        client = self.connection(self.shard(self.client_prefix))
+        key = self.inbox_key(self.client_prefix)
+        next_cleanup = time.monotonic() + 60
+        while not self._closing:
+            try:
+                payloads = await client.lpop(key, self.read_batch)
+                if not payloads:
+                    result = await client.blpop([key], timeout=BLOCK_TIMEOUT)
+                    payloads = [result[1]] if result else []
+            except Exception as exc:
+                metrics.increment('channel_layer.errors')
+                logger.warning(f'channel_layer: inbox {key} is not readable: {exc!r}')
+                await asyncio.sleep(1)
+                continue
+            for payload in payloads:
+                self._deliver(payload)
+            if time.monotonic() > next_cleanup:
+                self._expire_groups()
+                next_cleanup = time.monotonic() + 60
+
+    def _deliver(self, payload: bytes):
+        expires_at, group, channels, message = msgpack.unpackb(payload, raw=False)
+        if expires_at < time.time():
+            metrics.increment('channel_layer.expired')
+            return
+        if group is not None:
+            channels = list(self._groups.get(group, ()))
+        delivered = 0
+        for channel in channels:
+            queue = self._queues.get(channel)
+            if queue is None:
+                continue
+            try:
+                queue.put_nowait((expires_at, dict(message)))
+                delivered += 1
+            except asyncio.QueueFull:
+                metrics.increment('channel_layer.full', target='channel')
+        metrics.increment('channel_layer.delivered', delivered)
+
+    def _expire_groups(self):
+        joined_after = time.time() - self.group_expiry
+        for group, channels in list(self._groups.items()):
+            for channel, joined_at in list(channels.items()):
+                if joined_at < joined_after or channel not in self._queues:
+                    del channels[channel]
+            if not channels:
+                del self._groups[group]
+
+    # Groups extension
+
+    async def group_add(self, group: str, channel: str):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if self.is_local(channel):
+            self._groups.setdefault(group, {})[channel] = time.time()
+        async with self.connection(self.shard(group)).pipeline(transaction=False) as pipe:
+            pipe.zadd(self.group_key(group), {self.member(channel): time.time()})
+            pipe.expire(self.group_key(group), self.group_expiry)
+            await pipe.execute()
+
+    async def group_discard(self, group: str, channel: str):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if self.is_local(channel):
+            channels = self._groups.get(group, {})
+            channels.pop(channel, None)
+            if channels:
+                # Other sockets of this process are still in the group
+                return
+            self._groups.pop(group, None)
+        await self.connection(self.shard(group)).zrem(self.group_key(group), self.member(channel))
+
+    async def group_send(self, group: str, message: dict):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        async with self.connection(self.shard(group)).pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.group_key(group), 0, time.time() - self.group_expiry)
+            pipe.zrange(self.group_key(group), 0, -1)
+            _expired, members = await pipe.execute()
+
+        batches, foreign = {}, {}
+        for member in members:
+            member = member.decode()
+            if member.startswith('!'):
+                process = member[1:]
+                batches.setdefault(self.shard(process), []).append(
+                    (self.inbox_key(process), self.inbox_capacity, self.pack(group, [], message))
+                )
+            elif '!' in member:
+                # Channel of a process that joined it on behalf of another one, addressed by name
+                foreign.setdefault(self.process_of(member), []).append(member)
+            else:
+                index, key, capacity = self.destination(member)
+                batches.setdefault(index, []).append((key, capacity, self.pack(None, [member], message)))
+        for process, channels in foreign.items():
+            batches.setdefault(self.shard(process), []).append(
+                (self.inbox_key(process), self.inbox_capacity, self.pack(None, channels, message))
+            )
+
+        # Full lists are skipped, as group_send of other layers drops messages to full channels
+        pushed = await asyncio.gather(*(self._push(index, items) for index, items in batches.items()))
+        metrics.increment('channel_layer.group_sends')
+        metrics.increment('channel_layer.pushed', sum(pushed))
+
+    # Flush extension
+
+    async def flush(self):
+        for index in range(len(self.hosts)):
+            client = self.connection(index)
+            # SCAN in batches, KEYS would block a Redis shared with other users
+            keys = [key async for key in client.scan_iter(match=f'{self.prefix}:*', count=FLUSH_BATCH)]
+            for start in range(0, len(keys), FLUSH_BATCH):
+                await client.delete(*keys[start:start + FLUSH_BATCH])
+        self._groups = {}
+        for queue in self._queues.values():
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def close(self):
+        if self._reader is not None:
+            # Cancelling a blocking pop leaves the redis client waiting for its reply, the reader stops by itself
+            # after the current pop instead
+            self._closing = True
+            await asyncio.wait([self._reader], timeout=BLOCK_TIMEOUT + 1)
+            self._reader.cancel()
+            self._reader = None
+            self._closing = False
+        await self.close_loop_clients()
+
+
+def group_send_sync(group: str, message: dict):
+    """
+    group_send from sync code. async_to_sync runs it in a loop of its own unless called under an ASGI loop;
+    Redis clients opened for that call are closed before the loop ends
+    """
+    layer = get_channel_layer()
+
+    async def send():
+        opened = isinstance(layer, ShardedRedisChannelLayer) and not layer.has_loop_clients()
+        try:
+            await layer.group_send(group, message)
+        finally:
+            if opened:
+                await layer.close_loop_clients()
+
+    async_to_sync(send)()
@@ -0,0 +1,75 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+from config.core.benchmark import percentile
+
+logger = logging.getLogger()
+
+
+class Metrics:
+    """
+    Process-local counters, gauges and latency histograms;
+    example: metrics.increment('sms.sent'); with metrics.timer('sms.send_latency'): ...
+    """
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._window = window
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> str:
+        if not labels:
+            return name
+        return name + '{' + ','.join(f'{k}={v}' for k, v in sorted(labels.items())) + '}'
+
+    def increment(self, name: str, value: int = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'count': 0, 'sum': 0.0, 'samples': deque(maxlen=self._window)}
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['samples'].append(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {}
+            for key, histogram in self.histograms.items():
+                samples = list(histogram['samples'])
+                histograms[key] = {
+                    'count': histogram['count'],
+                    'avg_ms': round(histogram['sum'] / histogram['count'] * 1000, 2),
+                    'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                    'p99_ms': round(percentile(samples, 99) * 1000, 2),
+                }
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges), 'histograms': histograms}
+
+    def log(self, prefix: str = 'metrics'):
+        logger.info(f'{prefix}: {self.snapshot()}')
+
+
+metrics = Metrics()
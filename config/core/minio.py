@@ -14,6 +14,14 @@ s3_client = boto3.client(
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
 )
+# Signs upload URLs for clients, the signature covers the host they upload to
+s3_public_client = boto3.client(
+    's3',
+    endpoint_url=settings.AWS_S3_PUBLIC_ENDPOINT_URL,
+    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+    config=Config(signature_version='s3v4'),
+)
 
 def ensure_minio_bucket():
     try:
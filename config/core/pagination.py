@@ -37,3 +37,13 @@ class APILimitOffsetPagination(pagination.LimitOffsetPagination):
             'previous': self.get_previous_link(),
             'results': data
         })
+
+
+class APICursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination for feeds that grow at the head, pages stay stable and fast at any depth
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
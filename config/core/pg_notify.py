@@ -0,0 +1,45 @@
+import select
+
+from django.db import connection
+
+
+def notify(channel: str, payload: str = ''):
+    """
+    Wake up listeners of channel; inside transaction.atomic it is delivered on commit
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [channel, payload])
+
+
+class PgListener:
+    """
+    LISTEN on a dedicated connection, so workers sleep until there is work instead of polling;
+    example: listener = PgListener('sms_outbox'); listener.wait(timeout=5)
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._connection = None
+
+    def _connect(self):
+        self._connection = connection.get_new_connection(connection.get_connection_params())
+        self._connection.autocommit = True
+        with self._connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+    def wait(self, timeout: float) -> list:
+        """
+        return: payloads received within timeout, empty list on timeout
+        """
+        if self._connection is None or self._connection.closed:
+            self._connect()
+        if not self._connection.notifies:
+            select.select([self._connection], [], [], max(timeout, 0))
+        self._connection.poll()
+        payloads = [item.payload for item in self._connection.notifies]
+        self._connection.notifies.clear()
+        return payloads
+
+    def close(self):
+        if self._connection is not None and not self._connection.closed:
+            self._connection.close()
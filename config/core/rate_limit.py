@@ -0,0 +1,192 @@
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.throttling import BaseThrottle
+
+from config.core.api_exceptions import APIValidation
+
+
+class MemoryBackend:
+    """
+    Per-process store, exact and lock-protected; limits are counted per worker process.
+    Keys are kept in LRU order, past `max_keys` the least recently hit one is forgotten in O(1)
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+        self._buckets = OrderedDict()
+        self._max_keys = max_keys
+
+    def _touch(self, store: OrderedDict, key: str):
+        if key in store:
+            store.move_to_end(key)
+        elif len(store) >= self._max_keys:
+            store.popitem(last=False)
+
+    def sliding_window(self, key: str, limit: int, period: float, now: float) -> tuple[bool, float]:
+        with self._lock:
+            self._touch(self._windows, key)
+            hits = self._windows.setdefault(key, deque())
+            while hits and hits[0] <= now - period:
+                hits.popleft()
+            if len(hits) < limit:
+                hits.append(now)
+                return True, 0.0
+            return False, hits[0] + period - now
+
+    def token_bucket(self, key: str, limit: int, period: float, now: float) -> tuple[bool, float]:
+        rate = limit / period
+        with self._lock:
+            self._touch(self._buckets, key)
+            tokens, updated_at = self._buckets.get(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return True, 0.0
+            self._buckets[key] = (tokens, now)
+            return False, (1 - tokens) / rate
+
+
+class CacheBackend:
+    """
+    Shared store through Django cache (Redis in production, LocMemCache as local stand-in);
+    sliding window is approximated with two fixed-window counters using atomic incr,
+    token bucket state is read-modify-write and is best effort across processes
+    """
+
+    def __init__(self, alias: str = 'default'):
+        self.cache = caches[alias]
+
+    def sliding_window(self, key: str, limit: int, period: float, now: float) -> tuple[bool, float]:
+        window = int(now // period)
+        current_key, previous_key = f'rl:sw:{key}:{window}', f'rl:sw:{key}:{window - 1}'
+        self.cache.add(current_key, 0, timeout=int(period * 2) + 1)
+        current = self.cache.incr(current_key)
+        previous = self.cache.get(previous_key, 0)
+        elapsed = now - window * period
+        estimated = previous * (1 - elapsed / period) + current
+        if estimated <= limit:
+            return True, 0.0
+        # Rejected requests do not consume the limit
+        self.cache.decr(current_key)
+        return False, period - elapsed
+
+    def token_bucket(self, key: str, limit: int, period: float, now: float) -> tuple[bool, float]:
+        rate = limit / period
+        cache_key = f'rl:tb:{key}'
+        tokens, updated_at = self.cache.get(cache_key, (limit, now))
+        tokens = min(limit, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        self.cache.set(cache_key, (tokens - 1 if allowed else tokens, now), timeout=int(period) + 1)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    name = settings.RATE_LIMITS['BACKEND']
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = CacheBackend() if name == 'cache' else MemoryBackend()
+        return _backends[name]
+
+
+def is_shared() -> bool:
+    """
+    return: whether limits are counted across worker processes; memory and LocMemCache count them per process
+    """
+    backend = get_backend()
+    return isinstance(backend, CacheBackend) and not isinstance(backend.cache, LocMemCache)
+
+
+def hit(scope: str, key) -> tuple[bool, float]:
+    """
+    Count one request of `key` against rule `scope` from settings.RATE_LIMITS['RULES']
+    return: (allowed, seconds until next request is allowed)
+    """
+    algorithm, limit, period = settings.RATE_LIMITS['RULES'][scope]
+    backend = get_backend()
+    return getattr(backend, algorithm)(f'{scope}:{key}', limit, period, time.time())
+
+
+def check_rate_limit(scope: str, key):
+    """
+    Service-level guard, raises 429 when `key` is over the limit of `scope`
+    example: check_rate_limit('sms_cooldown', f'{user.id}:{purpose}')
+    """
+    allowed, retry_after = hit(scope, key)
+    if not allowed:
+        raise_rate_limited(retry_after)
+    return True
+
+
+def raise_rate_limited(retry_after: float):
+    raise APIValidation(
+        _('Слишком много запросов, повторите через {seconds} сек.').format(seconds=int(retry_after) + 1),
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS
+    )
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    DRF throttle over rate_limit rules, runs before the view so rejected requests never reach the database;
+    subclasses set `scope` and `key_source`: ip, user or phone (digits of request.data['phone_number'])
+    """
+    scope = None
+    key_source = 'ip'
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_key(self, request):
+        if self.key_source == 'user':
+            return request.user.pk if request.user and request.user.is_authenticated else None
+        if self.key_source == 'phone':
+            phone_number = request.data.get('phone_number') if hasattr(request.data, 'get') else None
+            return re.sub(r'\D', '', str(phone_number or '')) or None
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        key = self.get_key(request)
+        if key is None:
+            return True
+        allowed, self.retry_after = hit(self.scope, key)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class LoginPhoneThrottle(RateLimitThrottle):
+    scope = 'login_phone'
+    key_source = 'phone'
+
+
+class SMSCooldownPhoneThrottle(RateLimitThrottle):
+    scope = 'sms_cooldown'
+    key_source = 'phone'
+
+
+class LoginIPThrottle(RateLimitThrottle):
+    scope = 'login_ip'
+    key_source = 'ip'
+
+
+class VerifySMSPhoneThrottle(RateLimitThrottle):
+    scope = 'verify_sms_phone'
+    key_source = 'phone'
+
+
+class VerifySMSIPThrottle(RateLimitThrottle):
+    scope = 'verify_sms_ip'
+    key_source = 'ip'
@@ -1,7 +1,18 @@
 import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
 import requests
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from rest_framework import status
+from urllib3.util.retry import Retry
+
+from config.core.api_exceptions import APIValidation
+from config.core.metrics import metrics
 
 
 class SSLAdapter(HTTPAdapter):
@@ -14,21 +25,156 @@ class SSLAdapter(HTTPAdapter):
         return super(SSLAdapter, self).init_poolmanager(*args, **kwargs)
 
 
+class UpstreamUnavailable(APIValidation):
+    """
+    Upstream timed out, refused connection or its circuit is open
+    """
+
+    def __init__(self, upstream: str, reason: str):
+        self.upstream = upstream
+        self.reason = reason
+        super().__init__(_('Сервис {upstream} временно недоступен, повторите позже').format(upstream=upstream),
+                         status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout` seconds,
+    then lets a single probe through (half-open) to decide whether to close again;
+    a probe that reports no outcome (cancelled) is replaced by another one after `reset_timeout`
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state != self.CLOSED and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
 class HTTPClient:
+    """
+    Base for integrations: long-lived keep-alive session per upstream host, default timeouts,
+    retries of idempotent methods (and of connection errors for any method), circuit breaker per host
+    and `http.latency` / `http.requests` metrics labelled by `service` and status.
+    Settings are read from settings.HTTP_CLIENT, subclasses may override `service` and `timeout`.
+    """
+    service = 'http'
+    timeout = None
+
+    _sessions = {}
+    _breakers = {}
+    _registry_lock = threading.Lock()
+
     @staticmethod
     def basic_auth(username: str, password: str) -> HTTPBasicAuth:
         return HTTPBasicAuth(username, password)
 
     @staticmethod
-    def _request(method: str, url: str, **kwargs) -> requests.Response:
-        response = requests.request(method=method, url=url, **kwargs)
-        return response
+    def _retry() -> Retry:
+        config = settings.HTTP_CLIENT
+        return Retry(
+            total=config['RETRIES'],
+            connect=config['RETRIES'],
+            read=config['RETRIES'],
+            status=config['RETRIES'],
+            # PUT is left out, Multibank confirms payments with it
+            allowed_methods=frozenset({'HEAD', 'GET', 'OPTIONS', 'DELETE'}),
+            status_forcelist=(502, 503, 504),
+            backoff_factor=config['BACKOFF_FACTOR'],
+            raise_on_status=False,
+        )
 
-    @staticmethod
-    def _no_ssl_request(method: str, url: str, **kwargs) -> requests.Response:
-        # response = requests.request(method=method, url=url, verify=False, **kwargs)
+    @classmethod
+    def session_for(cls, url: str, verify: bool = True) -> requests.Session:
+        """
+        return: shared session of url's host, created on first use
+        """
+        parts = urlsplit(url)
+        prefix = f'{parts.scheme}://{parts.netloc}/'
+        key = (prefix, verify)
+        session = cls._sessions.get(key)
+        if session is None:
+            with cls._registry_lock:
+                session = cls._sessions.get(key)
+                if session is None:
+                    adapter_class = HTTPAdapter if verify else SSLAdapter
+                    session = requests.Session()
+                    session.verify = verify
+                    session.mount(prefix, adapter_class(pool_connections=1,
+                                                        pool_maxsize=settings.HTTP_CLIENT['POOL_MAXSIZE'],
+                                                        max_retries=cls._retry()))
+                    cls._sessions[key] = session
+        return session
 
-        session = requests.Session()
-        session.mount('https://', SSLAdapter())
-        response = session.request(method=method, url=url, verify=False, **kwargs)
+    @classmethod
+    def breaker_for(cls, host: str) -> CircuitBreaker:
+        breaker = cls._breakers.get(host)
+        if breaker is None:
+            with cls._registry_lock:
+                breaker = cls._breakers.setdefault(host, CircuitBreaker(
+                    failure_threshold=settings.HTTP_CLIENT['BREAKER_FAILURES'],
+                    reset_timeout=settings.HTTP_CLIENT['BREAKER_RESET_TIMEOUT'],
+                ))
+        return breaker
+
+    def _send_request(self, method: str, url: str, verify: bool, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        breaker = self.breaker_for(host)
+        if not breaker.allow():
+            metrics.increment('http.requests', service=self.service, status='circuit_open')
+            raise UpstreamUnavailable(self.service, 'circuit_open')
+
+        kwargs.setdefault('timeout', self.timeout or settings.HTTP_CLIENT['TIMEOUT'])
+        started = time.perf_counter()
+        try:
+            response = self.session_for(url, verify).request(method=method, url=url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            breaker.record_failure()
+            reason = 'timeout' if isinstance(exc, requests.Timeout) else 'connection_error'
+            metrics.increment('http.requests', service=self.service, status=reason)
+            raise UpstreamUnavailable(self.service, reason) from exc
+        except requests.RequestException:
+            # ChunkedEncodingError, TooManyRedirects...: a half-open breaker needs an outcome of its probe
+            breaker.record_failure()
+            metrics.increment('http.requests', service=self.service, status='error')
+            raise
+        finally:
+            metrics.observe('http.latency', time.perf_counter() - started, service=self.service)
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        metrics.increment('http.requests', service=self.service, status=response.status_code)
         return response
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self._send_request(method, url, verify=True, **kwargs)
+
+    def _no_ssl_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self._send_request(method, url, verify=False, **kwargs)
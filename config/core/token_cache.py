@@ -0,0 +1,77 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+import weakref
+
+
+def jwt_expiry(token: str) -> float | None:
+    """
+    return: `exp` claim of a JWT as unix timestamp, signature is not verified
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:  # noqa
+        return None
+
+
+class CachedToken:
+    """
+    Process-local bearer token holder with single-flight refresh;
+    fetch: callable returning (token, expires_at) where expires_at is unix timestamp
+    example: CachedToken(fetch=login, refresh_margin=60).get()
+    """
+
+    def __init__(self, fetch, refresh_margin: int = 60):
+        self._fetch = fetch
+        self._refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+    def _is_fresh(self) -> bool:
+        return bool(self._token) and time.time() < self._expires_at - self._refresh_margin
+
+    def get(self) -> str:
+        if self._is_fresh():
+            return self._token
+        with self._lock:
+            # Concurrent callers wait here and reuse the token fetched by the first one
+            if not self._is_fresh():
+                self._token, self._expires_at = self._fetch()
+            return self._token
+
+    def set(self, token: str, expires_at: float):
+        with self._lock:
+            self._token, self._expires_at = token, expires_at
+
+    def invalidate(self, stale_token: str = None):
+        """
+        Drop cached token; when stale_token is given, token refreshed meanwhile by another thread is kept
+        """
+        with self._lock:
+            if stale_token is None or stale_token == self._token:
+                self._token, self._expires_at = None, 0.0
+
+
+class AsyncCachedToken(CachedToken):
+    """
+    CachedToken for coroutines, fetch is awaited and concurrent refreshes are coalesced per event loop
+    example: await AsyncCachedToken(fetch=alogin).aget()
+    """
+
+    def __init__(self, fetch, refresh_margin: int = 60):
+        super().__init__(fetch, refresh_margin)
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    async def aget(self) -> str:
+        if self._is_fresh():
+            return self._token
+        lock = self._async_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+        async with lock:
+            if not self._is_fresh():
+                self.set(*await self._fetch())
+            return self._token
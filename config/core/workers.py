@@ -0,0 +1,121 @@
+import logging
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.db import close_old_connections, connection
+
+from config.core.metrics import metrics
+from config.core.pg_notify import PgListener
+
+logger = logging.getLogger()
+
+
+def backoff_delay(attempts: int, base: float, cap: float) -> float:
+    """
+    return: seconds before next attempt, exponential with jitter
+    """
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+class QueueWorker:
+    """
+    Long-running loop that claims jobs from the database and processes them in a bounded thread pool;
+    subclasses implement claim(limit) and process(job), optionally tick() for periodic housekeeping.
+    When `channel` is set, the worker sleeps on LISTEN until NOTIFY or the next timeout.
+    """
+    name = 'worker'
+    channel = None
+    poll_interval = 5.0
+    tick_interval = 30.0
+
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self._stopped = threading.Event()
+        self._listener = PgListener(self.channel) if self.channel else None
+
+    def claim(self, limit: int) -> list:
+        raise NotImplementedError
+
+    def process(self, job):
+        raise NotImplementedError
+
+    def tick(self):
+        pass
+
+    def next_timeout(self) -> float:
+        """
+        return: seconds to sleep when there is nothing to claim
+        """
+        return self.poll_interval
+
+    def stop(self, *args):
+        logger.info(f'{self.name}: stopping, waiting for in-flight jobs')
+        self._stopped.set()
+
+    def _process(self, job):
+        close_old_connections()
+        try:
+            self.process(job)
+        except Exception as exc:
+            metrics.increment(f'{self.name}.errors')
+            logger.exception(f'{self.name}: job failed: {exc.args}')
+
+    def _sleep(self, timeout: float):
+        if self._listener:
+            try:
+                # Short slices keep stop() responsive while waiting for NOTIFY
+                deadline = time.monotonic() + timeout
+                while not self._stopped.is_set() and time.monotonic() < deadline:
+                    if self._listener.wait(min(1.0, deadline - time.monotonic())):
+                        break
+                return
+            except Exception as exc:
+                logger.warning(f'{self.name}: listener failed, falling back to polling: {exc.args}')
+                self._listener.close()
+        self._stopped.wait(timeout)
+
+    def run(self, once: bool = False):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        last_tick = 0.0
+        failures = 0
+        inflight = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=self.name) as executor:
+            while not self._stopped.is_set():
+                free = self.concurrency - len(inflight)
+                try:
+                    if time.monotonic() - last_tick >= self.tick_interval:
+                        self.tick()
+                        metrics.log(self.name)
+                        last_tick = time.monotonic()
+                    jobs = self.claim(free) if free else []
+                    failures = 0
+                except Exception as exc:
+                    # Database restarts and dropped connections: reconnect on the next round instead of exiting
+                    failures += 1
+                    metrics.increment(f'{self.name}.loop_errors')
+                    logger.exception(f'{self.name}: claim failed ({failures} in a row): {exc.args}')
+                    close_old_connections()
+                    self._stopped.wait(backoff_delay(failures, base=1.0, cap=60.0))
+                    continue
+                for job in jobs:
+                    inflight.add(executor.submit(self._process, job))
+
+                if once and not jobs:
+                    wait(inflight)
+                    break
+                if len(jobs) == free:
+                    # Pool is full or queue still has work, claim again as soon as a slot frees up
+                    wait(inflight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self._sleep(self.next_timeout())
+                inflight = {future for future in inflight if not future.done()}
+
+        if self._listener:
+            self._listener.close()
+        connection.close()
@@ -1,6 +1,14 @@
 import threading
 
+from django.db import connection
+
 
 def run_with_thread(func, args):
-    t = threading.Thread(target=func, args=args)
+    def target():
+        try:
+            func(*args)
+        finally:
+            connection.close()
+
+    t = threading.Thread(target=target)
     t.start()
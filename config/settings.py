@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
 from django.utils.translation import gettext_lazy as _
 from firebase_admin import initialize_app, credentials
 
@@ -23,6 +24,7 @@ ALLOWED_HOSTS = ['*']
 
 # CORS
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Application definition
 INSTALLED_APPS = [
@@ -168,24 +170,75 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'config.core.api_exceptions.uni_exception_handler',
 }
 
+# Cache, Redis when REDIS_URL is set, otherwise process memory
+REDIS_URL = getenv('REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Rate limits, see config/core/rate_limit.py
+RATE_LIMITS = {
+    # memory: per process; cache: shared through CACHES['default'] (per process too without REDIS_URL);
+    # sms_cooldown falls back to the last SMSConfirmation unless the store is shared
+    'BACKEND': getenv('RATE_LIMIT_BACKEND', 'cache' if REDIS_URL else 'memory'),
+    'RULES': {
+        # scope: (algorithm, limit, period in seconds)
+        'sms_cooldown': ('sliding_window', 1, 60),
+        'login_phone': ('sliding_window', 5, 600),
+        'login_ip': ('token_bucket', 30, 60),
+        'verify_sms_phone': ('sliding_window', 10, 600),
+        'verify_sms_ip': ('token_bucket', 60, 60),
+        'chat_message': ('token_bucket', 20, 10),
+    },
+}
+
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 
 AWS_ACCESS_KEY_ID = getenv('MINIO_USERNAME')
 AWS_SECRET_ACCESS_KEY = getenv('MINIO_PASSWORD')
 AWS_STORAGE_BUCKET_NAME = 'sapi'
 AWS_S3_ENDPOINT_URL = getenv('MINIO_URL')
+# Storage address reachable by clients, presigned upload URLs point to it
+AWS_S3_PUBLIC_ENDPOINT_URL = getenv('MINIO_PUBLIC_URL') or AWS_S3_ENDPOINT_URL
 AWS_S3_FILE_OVERWRITE = False
 AWS_S3_VERIFY = False  # Optional: disable SSL cert verification
 AWS_DEFAULT_ACL = None  # Optional: use None for default ACL
 # AWS_S3_CUSTOM_DOMAIN = 'api.sapi.uz'
 AWS_S3_USE_SSL = False
 AWS_QUERYSTRING_AUTH = False
+FILE_MAX_SIZE = 20_971_520
+FILE_UPLOAD_URL_TTL = int(getenv('FILE_UPLOAD_URL_TTL', 600))
 
 # SMS Integration
 SMS_INTEGRATION_SETTINGS = {
     'SMS_BASE_URL': getenv('SMS_BASE_URL'),
     'SMS_USERNAME': getenv('SMS_USERNAME'),
     'SMS_PASSWORD': getenv('SMS_PASSWORD'),
+    # (connect, read) seconds
+    'SMS_TIMEOUT': (float(getenv('SMS_CONNECT_TIMEOUT', 3.05)), float(getenv('SMS_READ_TIMEOUT', 10))),
+    # Used when provider token has no `exp` claim
+    'SMS_TOKEN_TTL': int(getenv('SMS_TOKEN_TTL', 3600)),
+    # Outbox dispatcher, see `manage.py run_sms_dispatcher`
+    'DISPATCHER_CONCURRENCY': int(getenv('SMS_DISPATCHER_CONCURRENCY', 4)),
+    'DISPATCHER_MAX_ATTEMPTS': int(getenv('SMS_DISPATCHER_MAX_ATTEMPTS', 5)),
+    'DISPATCHER_BACKOFF_BASE': float(getenv('SMS_DISPATCHER_BACKOFF_BASE', 2)),
+    'DISPATCHER_BACKOFF_MAX': float(getenv('SMS_DISPATCHER_BACKOFF_MAX', 60)),
+}
+
+# Outbound HTTP of integrations, see config/core/request.py
+HTTP_CLIENT = {
+    # (connect, read) seconds, used when integration does not set its own
+    'TIMEOUT': (float(getenv('HTTP_CONNECT_TIMEOUT', 3.05)), float(getenv('HTTP_READ_TIMEOUT', 15))),
+    'RETRIES': int(getenv('HTTP_RETRIES', 2)),
+    'BACKOFF_FACTOR': float(getenv('HTTP_BACKOFF_FACTOR', 0.3)),
+    'POOL_MAXSIZE': int(getenv('HTTP_POOL_MAXSIZE', 20)),
+    'BREAKER_FAILURES': int(getenv('HTTP_BREAKER_FAILURES', 5)),
+    'BREAKER_RESET_TIMEOUT': float(getenv('HTTP_BREAKER_RESET_TIMEOUT', 30)),
 }
 
 # MULTIBANK
@@ -203,7 +256,14 @@ MULTIBANK_INTEGRATION_SETTINGS = {
         'STORE_ID': getenv('MULTIBANK_DEV_STORE_ID'),
         'MERCHANT_ID': getenv('MULTIBANK_DEV_MERCHANT_ID'),
         'SECRET': getenv('MULTIBANK_DEV_SECRET'),
-    }
+    },
+    # Payment worker, see `manage.py run_payment_worker`
+    'PAYMENT_WORKER': {
+        'CONCURRENCY': int(getenv('MULTIBANK_PAYMENT_WORKER_CONCURRENCY', 8)),
+        'MAX_ATTEMPTS': int(getenv('MULTIBANK_PAYMENT_WORKER_MAX_ATTEMPTS', 5)),
+        'BACKOFF_BASE': float(getenv('MULTIBANK_PAYMENT_WORKER_BACKOFF_BASE', 2)),
+        'BACKOFF_MAX': float(getenv('MULTIBANK_PAYMENT_WORKER_BACKOFF_MAX', 60)),
+    },
 }
 
 # FIREBASE
@@ -215,7 +275,7 @@ FCM_CONFIG = {
     'client_email': getenv('FIREBASE_CLIENT_EMAIL'),
     'client_id': getenv('FIREBASE_CLIENT_ID'),
     'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
-    'token_uri': 'https://oauth2.googleapis.com/token',
+    'token_uri': getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
     'auth_provider_x509_cert_url': 'https://www.googleapis.com/oauth2/v1/certs',
     'client_x509_cert_url': 'https://www.googleapis.com/robot/v1/metadata/x509/firebase-adminsdk-fbsvc%40sapi-72000.iam.gserviceaccount.com',
     'universe_domain': 'googleapis.com'
@@ -224,6 +284,14 @@ FCM_CONFIG = {
 cred = credentials.Certificate(FCM_CONFIG)
 FIREBASE_APP = initialize_app(cred)
 
+FCM_INTEGRATION_SETTINGS = {
+    'BASE_URL': getenv('FCM_BASE_URL', 'https://fcm.googleapis.com'),
+    # Tokens per multicast, FCM allows up to 500
+    'BATCH_SIZE': int(getenv('FCM_BATCH_SIZE', 500)),
+    # Parallel requests of one multicast
+    'CONCURRENCY': int(getenv('FCM_CONCURRENCY', 50)),
+}
+
 FCM_DJANGO_SETTINGS = {
     "DEFAULT_FIREBASE_APP": None,
     "APP_VERBOSE_NAME": 'SAPI',
@@ -260,14 +328,41 @@ if not DEBUG:
     # SWAGGER_SETTINGS['DEFAULT_API_URL'] = 'http://195.26.243.201:8080'
     SWAGGER_SETTINGS['DEFAULT_API_URL'] = 'https://api.sapi.uz'
 
+# Chat messages are partitioned by month, `manage.py manage_chat_partitions` detaches partitions older than this,
+# 0 keeps everything
+CHAT_MESSAGE_RETENTION_MONTHS = int(getenv('CHAT_MESSAGE_RETENTION_MONTHS', 0))
+
+# Chat sockets, see BaseChatConsumer: frames waiting for a client are bounded per connection, on overflow
+# the frame is dropped or the socket closed (drop | disconnect); IDLE_TIMEOUT 0 keeps silent clients connected
+CHAT_SOCKET = {
+    'OUTBOX_SIZE': int(getenv('CHAT_SOCKET_OUTBOX_SIZE', 200)),
+    'OVERFLOW': getenv('CHAT_SOCKET_OVERFLOW', 'disconnect'),
+    'SEND_TIMEOUT': float(getenv('CHAT_SOCKET_SEND_TIMEOUT', 10)),
+    'HEARTBEAT': float(getenv('CHAT_SOCKET_HEARTBEAT', 30)),
+    'IDLE_TIMEOUT': float(getenv('CHAT_SOCKET_IDLE_TIMEOUT', 0)),
+}
+
+# Cached chat permissions, see apps/chat/policy.py; both are dropped when they change, TTL is the safety net.
+# Cached with a shared CACHES only (REDIS_URL), LocMemCache would keep stale permissions in other processes
+CHAT_POLICY = {
+    'SETTINGS_TTL': int(getenv('CHAT_POLICY_SETTINGS_TTL', 3600)),
+    'ACCESS_TTL': int(getenv('CHAT_POLICY_ACCESS_TTL', 600)),
+}
+
+# Channel layer, sharded over CHANNEL_LAYER_HOSTS (comma separated Redis URLs) when set, see
+# config/core/channel_layer.py; otherwise process memory, group_send reaches only sockets of the same process
+CHANNEL_LAYER_HOSTS = [host for host in getenv('CHANNEL_LAYER_HOSTS', '').split(',') if host]
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',  # For development
-        # OR for production with Redis:
-        # 'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        # 'CONFIG': {
-        #     'hosts': [('redis', 6379)],  # Or your Redis server address
-        # },
+        'BACKEND': 'config.core.channel_layer.ShardedRedisChannelLayer',
+        'CONFIG': {
+            'hosts': CHANNEL_LAYER_HOSTS,
+            'expiry': int(getenv('CHANNEL_LAYER_EXPIRY', 60)),
+            'capacity': int(getenv('CHANNEL_LAYER_CAPACITY', 100)),
+            'inbox_capacity': int(getenv('CHANNEL_LAYER_INBOX_CAPACITY', 10000)),
+        },
+    } if CHANNEL_LAYER_HOSTS else {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
     },
 }
 